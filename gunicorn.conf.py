@@ -0,0 +1,55 @@
+# gunicorn.conf.py - Configuración de gunicorn para la API (src/api_complete.py)
+#
+# Con preload la app se importa una sola vez en el proceso maestro (SDK, base
+# de conocimiento, índices y calentamiento) y cada worker la hereda al hacer
+# fork: arranca en milisegundos y comparte esas páginas de memoria con los
+# demás. GUNICORN_PRELOAD=0 vuelve a cargar la app en cada worker.
+import os
+import sys
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").strip().lower() not in ("0", "false", "no")
+if preload_app:
+    # La app no abre conexiones al importarse en el maestro (ver startup.py)
+    os.environ["STARTUP_PRELOAD"] = "1"
+
+# startup.py está en src/ (la app se importa como api_complete o src.api_complete)
+_SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+if _SRC_DIR not in sys.path:
+    sys.path.append(_SRC_DIR)
+
+
+def when_ready(server):
+    # Con varios workers cada petición puede caer en uno distinto: sin un fichero de
+    # sesiones compartido (SESSION_DB_PATH) cada worker tiene su propio historial
+    if server.cfg.workers > 1 and not os.getenv("SESSION_DB_PATH", "").strip():
+        server.log.warning(
+            "SESSION_DB_PATH no está definido: con %s workers cada uno guarda sus propias sesiones",
+            server.cfg.workers,
+        )
+
+    # Maestro, con la app ya cargada: cierra hilos, conexiones y procesos que no se heredan
+    from startup import STARTUP
+
+    STARTUP.prepare_fork()
+
+
+def post_worker_init(worker):
+    # App ya cargada en el worker: la admisión (src/admission.py) tiene que caber en sus
+    # hilos; los límites fijados en el entorno se respetan, pero se avisa si no caben
+    from admission import ADMISSION
+
+    threads = worker.cfg.threads
+    max_concurrent, max_queue = ADMISSION.fit_to_threads(threads)
+    if max_concurrent <= 0 or max_concurrent + max_queue >= threads:
+        worker.log.warning(
+            "ADMISSION_MAX_CONCURRENT=%s + ADMISSION_MAX_QUEUE=%s no caben en --threads %s: "
+            "las peticiones de más esperarán en gunicorn sin recibir 429",
+            max_concurrent, max_queue, threads,
+        )
+
+
+def post_fork(server, worker):
+    # Worker recién creado: vuelve a crear lo que se cerró en el maestro y calienta su conexión
+    from startup import STARTUP
+
+    STARTUP.after_fork()
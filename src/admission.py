@@ -0,0 +1,368 @@
+# admission.py - Control de admisión de /api/chat: límite de llamadas al modelo,
+# cola de espera acotada y límite de peticiones por cliente
+#
+# Ante un pico de tráfico es mejor rechazar enseguida (429 con Retry-After) que
+# aceptar todas las peticiones: cada worker acabaría esperando a Azure, las
+# peticiones caducarían en el balanceador y pagaríamos respuestas que nadie
+# recibe. Los límites son por proceso (cada worker de gunicorn tiene los suyos).
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS, REGISTRY
+
+# Peticiones que pueden estar llamando al modelo a la vez (0 = sin límite). Con
+# gunicorn, si no se definen, estos dos límites se derivan de --threads (ver
+# limits_for_threads y gunicorn.conf.py)
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8"))
+# Peticiones que pueden esperar turno y cuánto esperan como máximo antes del 429
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+# Peticiones por minuto de cada cliente (dirección IP) y ráfaga permitida (0 = sin límite)
+ADMISSION_RATE_PER_MINUTE = float(os.getenv("ADMISSION_RATE_PER_MINUTE", "30"))
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "10"))
+# Clientes distintos de los que se recuerda el consumo (los más antiguos se olvidan)
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+# Proxies de confianza delante de la API (balanceador, nginx...): solo entonces se lee
+# X-Forwarded-For, y solo las entradas que añadieron ellos (0 = dirección de la conexión)
+ADMISSION_TRUSTED_PROXIES = int(os.getenv("ADMISSION_TRUSTED_PROXIES", "0"))
+
+
+class AdmissionRejected(RuntimeError):
+    """La petición no se admite ahora; ``retry_after`` son los segundos sugeridos para reintentar"""
+
+    MESSAGES = {
+        "rate_limited": "Demasiadas peticiones: espera un momento antes de volver a preguntar",
+        "queue_full": "El asistente está atendiendo demasiadas consultas, inténtalo en unos segundos",
+        "queue_timeout": "El asistente está atendiendo demasiadas consultas, inténtalo en unos segundos",
+    }
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(self.MESSAGES.get(reason, reason))
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Valor de la cabecera Retry-After (segundos enteros, al menos 1)"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimiter:
+    """Token bucket por cliente: ``burst`` peticiones seguidas y ``rate_per_minute`` sostenidas.
+
+    Los buckets se guardan en un ``OrderedDict`` por último uso; al superar
+    ``max_clients`` se olvida el más antiguo (vuelve con el bucket lleno).
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = ADMISSION_RATE_PER_MINUTE,
+        burst: int = ADMISSION_BURST,
+        max_clients: int = ADMISSION_MAX_CLIENTS,
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        # cliente -> (tokens, instante de la última recarga)
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: str, cost: int = 1) -> float:
+        """Consume ``cost`` tokens; devuelve 0 si hay, o los segundos hasta el siguiente.
+
+        Basta con tener un token para pasar: un ``cost`` mayor (un lote) deja el
+        bucket en negativo y el cliente espera hasta recuperarlo.
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= cost
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def refund(self, key: str, cost: int = 1):
+        """Devuelve los tokens de peticiones que al final no se atendieron"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(float(self.burst), tokens + cost), updated)
+
+
+class _Waiter:
+    """Petición en la cola; ``granted`` se marca (con el lock) al cederle un hueco"""
+
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionSlot:
+    """Hueco concedido a una petición; ``release()`` lo devuelve (solo la primera vez cuenta)"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(time.monotonic() - self._start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Admite peticiones al modelo con límite de concurrencia, cola FIFO y límite por cliente.
+
+    ``acquire`` (o ``acquire_async``) aplica primero el token bucket del
+    cliente y después espera un hueco: si hay menos de ``max_concurrent``
+    peticiones en curso entra enseguida; si no, espera en una cola de como
+    mucho ``max_queue`` peticiones durante ``queue_timeout`` segundos. Al
+    liberarse un hueco se cede directamente al primero de la cola. Si no se
+    admite, lanza ``AdmissionRejected`` con los segundos sugeridos para
+    reintentar (estimados con la duración media de las peticiones); si el
+    motivo es la cola y no el límite del cliente, se le devuelve el token.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        # Duración media de una petición admitida (media móvil exponencial)
+        self.avg_seconds = 1.0
+        self.admitted = 0
+        self.queued = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def fit_to_threads(self, threads: int) -> Tuple[int, int]:
+        """Ajusta a ``threads`` los límites que no se fijaron en el entorno; devuelve los vigentes"""
+        max_concurrent, max_queue = limits_for_threads(threads)
+        with self._lock:
+            if "ADMISSION_MAX_CONCURRENT" not in os.environ:
+                self.max_concurrent = max_concurrent
+            if "ADMISSION_MAX_QUEUE" not in os.environ:
+                self.max_queue = max_queue
+            return self.max_concurrent, self.max_queue
+
+    def charge(self, key: str, cost: int = 1):
+        """Solo el límite del cliente, sin ocupar hueco (un lote: cada llamada pide el suyo)"""
+        wait = self.limiter.acquire(key, cost)
+        if wait > 0:
+            self._reject("rate_limited", wait)
+
+    def refund(self, key: str, cost: int = 1):
+        """Devuelve al cliente ``cost`` peticiones que no se atendieron"""
+        self.limiter.refund(key, cost)
+
+    def limit_workers(self, workers: int) -> int:
+        """Hilos de un lote: no más que las llamadas al modelo que se admiten a la vez"""
+        if self.max_concurrent <= 0:
+            return workers
+        return max(1, min(workers, self.max_concurrent))
+
+    def _retry_after(self, ahead: int) -> float:
+        """Segundos hasta que se atiendan las ``ahead`` peticiones que van delante"""
+        slots = max(1, self.max_concurrent)
+        return self.avg_seconds * (ahead // slots + 1)
+
+    def _reject(self, reason: str, retry_after: float, key: Optional[str] = None):
+        """Lanza el 429; ``key`` recupera el token si el límite del cliente no fue el motivo"""
+        if key is not None:
+            self.limiter.refund(key)
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        raise AdmissionRejected(reason, retry_after)
+
+    def _enter(self, key: Optional[str], loop=None) -> Optional[_Waiter]:
+        """Límite del cliente y hueco libre; devuelve el ``_Waiter`` si hay que esperar"""
+        if key is not None:
+            wait = self.limiter.acquire(key)
+            if wait > 0:
+                self._reject("rate_limited", wait)
+        with self._lock:
+            if self.max_concurrent <= 0 or (self.in_flight < self.max_concurrent and not self._waiters):
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                ahead = len(self._waiters)
+            else:
+                waiter = _Waiter(loop)
+                self._waiters.append(waiter)
+                self.queued += 1
+                return waiter
+        self._reject("queue_full", self._retry_after(ahead), key)
+
+    def _timed_out(self, waiter: _Waiter) -> bool:
+        """Tras agotar la espera: True si sigue en la cola (se retira) o False si ya tenía hueco"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            return True
+
+    def acquire(self, key: Optional[str] = None) -> AdmissionSlot:
+        """Espera un hueco (bloqueando el hilo); ``key`` identifica al cliente para su límite"""
+        start = time.monotonic()
+        waiter = self._enter(key)
+        if waiter is not None:
+            if not waiter.event.wait(self.queue_timeout) and self._timed_out(waiter):
+                self._reject("queue_timeout", self._retry_after(self.queue_depth), key)
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+        return AdmissionSlot(self)
+
+    async def acquire_async(self, key: Optional[str] = None) -> AdmissionSlot:
+        """Igual que ``acquire`` pero espera sin bloquear el event loop"""
+        start = time.monotonic()
+        waiter = self._enter(key, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._timed_out(waiter):
+                    self._reject("queue_timeout", self._retry_after(self.queue_depth), key)
+            except asyncio.CancelledError:
+                # El cliente se fue mientras esperaba: ceder el hueco si ya se lo habían dado
+                if not self._timed_out(waiter):
+                    self._release(0.0, observe=False)
+                if key is not None:
+                    self.limiter.refund(key)
+                raise
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+        return AdmissionSlot(self)
+
+    def _release(self, seconds: float, observe: bool = True):
+        with self._lock:
+            if observe:
+                self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * seconds
+            if self._waiters:
+                # El hueco pasa directamente al primero de la cola (in_flight no cambia)
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.admitted += 1
+                waiter.wake()
+            else:
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "rate_per_minute": self.limiter.rate * 60,
+                "burst": self.limiter.burst,
+                "tracked_clients": len(self.limiter),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "avg_seconds": round(self.avg_seconds, 3),
+            }
+
+
+def limits_for_threads(threads: int) -> Tuple[int, int]:
+    """``(max_concurrent, max_queue)`` para un worker que atiende ``threads`` peticiones a la vez.
+
+    Una petición en cola también ocupa un hilo mientras espera, así que los dos
+    límites tienen que caber en ``threads``: la mitad de los hilos llama al
+    modelo, los demás menos uno esperan turno, y ese último queda libre para
+    responder los 429, /api/health y /api/metrics. Si la suma supera a
+    ``threads`` la cola nunca se llena: las peticiones de más esperan dentro
+    de gunicorn, sin plazo ni 429.
+    """
+    max_concurrent = max(1, threads // 2)
+    return max_concurrent, max(0, threads - max_concurrent - 1)
+
+
+def client_key(
+    remote_addr: Optional[str],
+    forwarded_for: Optional[str] = None,
+    trusted_proxies: int = ADMISSION_TRUSTED_PROXIES,
+) -> str:
+    """Clave del límite por cliente: su dirección IP.
+
+    Sin proxies de confianza es la dirección de la conexión: el cliente no la
+    puede cambiar (el ``session_id`` o X-Forwarded-For sí). Con
+    ``trusted_proxies=n`` es la n-ésima entrada de X-Forwarded-For empezando
+    por la derecha, la que añadió el primero de esos proxies (como
+    ``werkzeug.middleware.proxy_fix.ProxyFix(x_for=n)``); lo que haya a su
+    izquierda lo envió el cliente y se ignora.
+    """
+    if trusted_proxies > 0 and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        if len(hops) >= trusted_proxies and hops[-trusted_proxies]:
+            return hops[-trusted_proxies]
+    return remote_addr or "unknown"
+
+
+ADMISSION = AdmissionController()
+
+REGISTRY.register_callback(
+    "greendream_admission_in_flight", "Peticiones de chat admitidas en curso", "gauge",
+    lambda: ADMISSION.in_flight,
+)
+REGISTRY.register_callback(
+    "greendream_admission_queue_depth", "Peticiones de chat esperando turno", "gauge",
+    lambda: ADMISSION.queue_depth,
+)
@@ -0,0 +1,325 @@
+# api_async.py - API REST asíncrona (ASGI) para Green Dream
+#
+# Misma interfaz que api_complete.py, pero sobre Quart + azure.ai.inference.aio:
+# un solo proceso puede mantener cientos de llamadas al modelo en curso sin
+# ocupar un worker por petición. Ejecutar con, por ejemplo:
+#   uvicorn --app-dir src api_async:app --host 0.0.0.0 --port 5001
+import asyncio
+import json
+import os
+import sys
+import time
+import weakref
+
+# Agregar el directorio actual al path para importar nuestros módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from startup import STARTUP, STARTUP_WARMUP
+
+with STARTUP.phase("imports"):
+    from quart import Quart, Response, g, request, jsonify
+
+    from admission import ADMISSION, AdmissionRejected, client_key
+    from assistant_rag import AsistenteGreenDreamRAG, BatchRequestError, FallbackAnswer, parse_batch_request
+    from chat_client import breaker, client_stats
+    from metrics import ERRORS, REGISTRY, REQUEST_SECONDS, REQUESTS, STAGE_SECONDS
+
+# Crear aplicación Quart (API compatible con Flask)
+app = Quart(__name__)
+
+# Inicializar el asistente RAG (una sola vez al inicio)
+print("🚀 Inicializando Green Dream RAG Assistant (modo asíncrono)...")
+assistant_initialized = False
+assistant_init_error = None
+asistente = None
+try:
+    with STARTUP.phase("assistant"):
+        asistente = AsistenteGreenDreamRAG()
+    assistant_initialized = True
+    if STARTUP_WARMUP:
+        # El cliente asíncrono se crea dentro del bucle de eventos: aquí solo la búsqueda
+        asistente.warmup(client=False)
+    print("✅ API asíncrona lista para recibir consultas")
+except Exception as e:
+    assistant_init_error = str(e)
+    assistant_initialized = False
+    print(f"⚠️ Error inicializando asistente: {e}")
+STARTUP.report()
+
+
+@app.before_request
+async def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+async def record_request_metrics(response):
+    """Cuenta la petición y su duración por endpoint (para streams, hasta el primer byte)"""
+    endpoint = request.url_rule.rule if request.url_rule else "other"
+    start = getattr(g, "request_start", None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    if response.status_code >= 500:
+        ERRORS.inc(endpoint=endpoint)
+    return response
+
+
+@app.after_request
+async def add_cors_headers(response):
+    """Permitir requests desde el frontend (equivalente a flask_cors.CORS)"""
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+
+async def _session_id(data):
+    """Sesión de la petición (se crea si no se envía). El almacén es síncrono y con
+    SESSION_DB_PATH consulta SQLite: se usa desde un hilo para no bloquear el event loop"""
+    session = await asyncio.to_thread(asistente.sessions.get_or_create, data.get('session_id'))
+    return session.session_id
+
+
+async def _admit():
+    """Hueco para llamar al modelo (ver admission.py); lanza AdmissionRejected si no hay"""
+    return await ADMISSION.acquire_async(_client_key())
+
+
+def _client_key():
+    """Cliente de la petición para el límite por minuto (ver admission.client_key)"""
+    return client_key(request.remote_addr, request.headers.get('X-Forwarded-For'))
+
+
+def _too_many_requests(error):
+    """Respuesta 429 con Retry-After para una petición no admitida"""
+    payload = {"success": False, "error": str(error), "reason": error.reason,
+               "retry_after": int(error.retry_after_header)}
+    return jsonify(payload), 429, {"Retry-After": error.retry_after_header}
+
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    """Endpoint principal para chatear con el asistente Green Dream"""
+    try:
+        data = await request.get_json()
+
+        if not data or 'message' not in data:
+            return jsonify({"error": "Campo 'message' requerido"}), 400
+
+        user_message = data['message']
+
+        # Con el sistema saturado se responde 429 enseguida en vez de esperar al modelo
+        try:
+            slot = await _admit()
+        except AdmissionRejected as e:
+            return _too_many_requests(e)
+
+        async with slot:
+            session_id = await _session_id(data)
+
+            # Procesar con RAG sin bloquear el event loop
+            respuesta = await asistente.preguntar_con_rag_async(
+                user_message, session_id=session_id
+            )
+
+        payload = {
+            "success": True,
+            "response": respuesta,
+            "session_id": session_id,
+            "source": "Green Dream RAG Assistant",
+            "degraded": isinstance(respuesta, FallbackAnswer)
+        }
+        if isinstance(respuesta, FallbackAnswer):
+            # Respuesta solo con la búsqueda: el modelo no respondió a tiempo
+            payload["degraded_reason"] = respuesta.reason
+
+        with STAGE_SECONDS.time(stage="serialization"):
+            return jsonify(payload)
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+def _sse(data, event=None):
+    """Formatea un evento Server-Sent Events"""
+    with STAGE_SECONDS.time(stage="serialization"):
+        payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        return f"event: {event}\n{payload}" if event else payload
+
+
+def _ndjson(data):
+    """Formatea una línea de NDJSON (un objeto JSON por línea)"""
+    with STAGE_SECONDS.time(stage="serialization"):
+        return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+async def chat_stream():
+    """Respuesta por Server-Sent Events (mismos eventos que en api_complete.py)"""
+    data = await request.get_json(silent=True)
+
+    if not data or 'message' not in data:
+        return jsonify({"error": "Campo 'message' requerido"}), 400
+    if asistente is None:
+        return jsonify({"success": False, "error": "Asistente no inicializado"}), 500
+
+    user_message = data['message']
+    try:
+        slot = await _admit()
+    except AdmissionRejected as e:
+        return _too_many_requests(e)
+    try:
+        session_id = await _session_id(data)
+    except BaseException:
+        # Todavía no hay stream que libere el hueco (también si se cancela la petición)
+        slot.release()
+        raise
+
+    async def generate():
+        yield _sse({"session_id": session_id}, event="session")
+        fragmentos = asistente.preguntar_con_rag_stream_async(
+            user_message, session_id=session_id
+        )
+        try:
+            async for fragment in fragmentos:
+                if isinstance(fragment, FallbackAnswer):
+                    yield _sse({"reason": fragment.reason}, event="degraded")
+                yield _sse({"delta": str(fragment)})
+            yield _sse({"success": True}, event="done")
+        except Exception as e:
+            ERRORS.inc(endpoint="/api/chat/stream")
+            yield _sse({"success": False, "error": str(e)}, event="error")
+        finally:
+            # Si el cliente se desconecta, cerrar el generador guarda la respuesta parcial
+            await fragmentos.aclose()
+            slot.release()
+
+    stream = generate()
+    # Quart no tiene call_on_close: si el stream no llega a empezar, el hueco se
+    # libera al descartar el generador (release solo cuenta una vez)
+    weakref.finalize(stream, slot.release)
+    response = Response(stream, mimetype='text/event-stream')
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = None  # El stream puede durar más que el timeout por defecto
+    return response
+
+
+@app.route('/api/chat/batch', methods=['POST'])
+async def chat_batch():
+    """Lote de preguntas en paralelo (mismo formato NDJSON que en api_complete.py)"""
+    try:
+        questions, max_workers = parse_batch_request(await request.get_json(silent=True))
+    except BatchRequestError as e:
+        return jsonify({"error": str(e)}), e.status
+    if asistente is None:
+        return jsonify({"success": False, "error": "Asistente no inicializado"}), 500
+    # Cada pregunta cuenta para el límite del cliente y cada llamada al modelo del
+    # lote ocupa un hueco de admisión, como una de /api/chat
+    key = _client_key()
+    try:
+        ADMISSION.charge(key, len(questions))
+    except AdmissionRejected as e:
+        return _too_many_requests(e)
+    max_workers = ADMISSION.limit_workers(max_workers)
+
+    async def generate():
+        start = time.perf_counter()
+        statuses = {}
+        resultados = asistente.preguntar_lote_async(
+            questions, max_workers=max_workers, admit=ADMISSION.acquire_async
+        )
+        try:
+            async for item in resultados:
+                statuses[item["status"]] = statuses.get(item["status"], 0) + 1
+                yield _ndjson(item)
+            yield _ndjson({
+                "done": True, "total": len(questions), "statuses": statuses,
+                "seconds": round(time.perf_counter() - start, 3),
+            })
+        except Exception as e:
+            ERRORS.inc(endpoint="/api/chat/batch")
+            yield _ndjson({"done": True, "success": False, "error": str(e)})
+        finally:
+            # Si el cliente se desconecta, se cancelan las preguntas pendientes
+            await resultados.aclose()
+            # Las preguntas sin hueco no gastan el límite del cliente
+            if statuses.get("rejected"):
+                ADMISSION.refund(key, statuses["rejected"])
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = None  # Un lote grande puede durar más que el timeout por defecto
+    return response
+
+
+@app.route('/api/welcome', methods=['GET'])
+async def welcome():
+    """Saludo inicial del asistente, una sola vez por sesión (``?session_id=...``)"""
+    try:
+        if asistente is None:
+            return jsonify({"success": False, "error": "Asistente no inicializado"}), 500
+
+        session_id, saludo = await asyncio.to_thread(asistente.saludo_para_sesion, request.args.get('session_id'))
+
+        if saludo:
+            return jsonify({"success": True, "welcome": saludo, "session_id": session_id}), 200
+        else:
+            return jsonify({"success": False, "welcome": None, "session_id": session_id}), 204
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/health', methods=['GET'])
+async def health():
+    """Endpoint para verificar que la API está funcionando"""
+    payload = {
+        "status": "healthy",
+        "service": "Green Dream Chat API",
+        "version": "1.0.0",
+        "mode": "async",
+        "assistant_initialized": assistant_initialized
+    }
+    if assistant_init_error:
+        payload["assistant_error"] = assistant_init_error
+
+    return jsonify(payload)
+
+
+@app.route('/api/debug', methods=['GET'])
+async def debug_info():
+    """Información de diagnóstico útil para desarrollo local."""
+    return jsonify({
+        "service": "Green Dream Chat API",
+        "mode": "async",
+        "assistant_initialized": assistant_initialized,
+        "assistant_error": assistant_init_error,
+        "sessions": await asyncio.to_thread(asistente.sessions.stats) if asistente is not None else None,
+        "response_cache": asistente.response_cache.stats() if asistente is not None else None,
+        "coalescing": asistente.async_coalescer.stats() if asistente is not None else None,
+        "admission": ADMISSION.stats(),
+        "llm_client": {"circuit": breaker.state, "outcomes": client_stats.snapshot()}
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+async def metrics():
+    """Métricas en formato de texto de Prometheus (latencia por etapa, peticiones, tokens, caché)"""
+    # En un hilo: algunas métricas (p. ej. las sesiones activas) consultan SQLite
+    return Response(await asyncio.to_thread(REGISTRY.render), content_type=REGISTRY.CONTENT_TYPE)
+
+
+@app.route('/')
+async def index():
+    """Raíz: información mínima de la API (sin servir archivos estáticos)."""
+    return jsonify({
+        "service": "Green Dream Chat API",
+        "message": "API only — use /api/* endpoints. The static website is not served here.",
+        "endpoints": ["/api/health", "/api/chat", "/api/chat/stream", "/api/chat/batch", "/api/debug", "/api/metrics"]
+    })
+
+if __name__ == '__main__':
+    # Ejecutar en modo desarrollo
+    app.run(host='0.0.0.0', port=5001, debug=True)
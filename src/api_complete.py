@@ -1,14 +1,23 @@
 
 # green_dream_api.py - API REST para integrar con página web
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+import json
 import os
 import sys
+import time
 
 # Agregar el directorio actual al path para importar nuestros módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from assistant_rag import AsistenteGreenDreamRAG
+from startup import STARTUP, STARTUP_PRELOAD, STARTUP_WARMUP
+
+with STARTUP.phase("imports"):
+    from flask import Flask, Response, g, request, jsonify, stream_with_context
+    from flask_cors import CORS
+
+    from admission import ADMISSION, AdmissionRejected, client_key
+    from assistant_rag import AsistenteGreenDreamRAG, BatchRequestError, FallbackAnswer, parse_batch_request
+    from chat_client import breaker, client_stats
+    from metrics import ERRORS, REGISTRY, REQUEST_SECONDS, REQUESTS, STAGE_SECONDS
 
 # Crear aplicación Flask
 app = Flask(__name__)
@@ -20,13 +29,59 @@ assistant_initialized = False
 assistant_init_error = None
 asistente = None
 try:
-    asistente = AsistenteGreenDreamRAG()
+    with STARTUP.phase("assistant"):
+        asistente = AsistenteGreenDreamRAG()
     assistant_initialized = True
+    if STARTUP_WARMUP:
+        asistente.warmup(connection=not STARTUP_PRELOAD)
+    # Con gunicorn --preload (gunicorn.conf.py) este módulo se importa en el maestro
+    # y los workers heredan la base ya cargada; ver startup.py
+    STARTUP.on_fork(
+        before=asistente.prepare_fork,
+        after=lambda: asistente.after_fork(warmup=STARTUP_WARMUP),
+    )
     print("✅ API lista para recibir consultas")
 except Exception as e:
     assistant_init_error = str(e)
     assistant_initialized = False
     print(f"⚠️ Error inicializando asistente: {e}")
+STARTUP.report()
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Cuenta la petición y su duración por endpoint (para streams, hasta el primer byte)"""
+    endpoint = request.url_rule.rule if request.url_rule else "other"
+    start = getattr(g, "request_start", None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    if response.status_code >= 500:
+        ERRORS.inc(endpoint=endpoint)
+    return response
+
+
+def _admit():
+    """Hueco para llamar al modelo (ver admission.py); lanza AdmissionRejected si no hay"""
+    return ADMISSION.acquire(_client_key())
+
+
+def _client_key():
+    """Cliente de la petición para el límite por minuto (ver admission.client_key)"""
+    return client_key(request.remote_addr, request.headers.get('X-Forwarded-For'))
+
+
+def _too_many_requests(error):
+    """Respuesta 429 con Retry-After para una petición no admitida"""
+    payload = {"success": False, "error": str(error), "reason": error.reason,
+               "retry_after": int(error.retry_after_header)}
+    return jsonify(payload), 429, {"Retry-After": error.retry_after_header}
+
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -39,38 +94,179 @@ def chat():
 
         user_message = data['message']
 
-        # Procesar con RAG
-        respuesta = asistente.preguntar_con_rag(user_message, stream=False)
+        # Con el sistema saturado se responde 429 enseguida en vez de esperar al modelo
+        try:
+            slot = _admit()
+        except AdmissionRejected as e:
+            return _too_many_requests(e)
+
+        with slot:
+            # Cada visitante conversa en su propia sesión (se crea si no se envía)
+            session_id = asistente.sessions.get_or_create(data.get('session_id')).session_id
+
+            # Procesar con RAG
+            respuesta = asistente.preguntar_con_rag(
+                user_message, stream=False, session_id=session_id
+            )
 
-        return jsonify({
+        payload = {
             "success": True,
             "response": respuesta,
-            "source": "Green Dream RAG Assistant"
-        })
+            "session_id": session_id,
+            "source": "Green Dream RAG Assistant",
+            "degraded": isinstance(respuesta, FallbackAnswer)
+        }
+        if isinstance(respuesta, FallbackAnswer):
+            # Respuesta solo con la búsqueda: el modelo no respondió a tiempo
+            payload["degraded_reason"] = respuesta.reason
+
+        with STAGE_SECONDS.time(stage="serialization"):
+            return jsonify(payload)
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+def _sse(data, event=None):
+    """Formatea un evento Server-Sent Events"""
+    with STAGE_SECONDS.time(stage="serialization"):
+        payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        return f"event: {event}\n{payload}" if event else payload
+
+
+def _ndjson(data):
+    """Formatea una línea de NDJSON (un objeto JSON por línea)"""
+    with STAGE_SECONDS.time(stage="serialization"):
+        return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Igual que /api/chat pero envía la respuesta por Server-Sent Events.
+
+    Eventos: ``session`` (session_id), un ``data`` por fragmento (``{"delta": ...}``),
+    ``degraded`` si la respuesta es solo de búsqueda, ``done`` al terminar y ``error``
+    si falla la generación.
+    """
+    data = request.get_json(silent=True)
+
+    if not data or 'message' not in data:
+        return jsonify({"error": "Campo 'message' requerido"}), 400
+    if asistente is None:
+        return jsonify({"success": False, "error": "Asistente no inicializado"}), 500
+
+    user_message = data['message']
+    try:
+        slot = _admit()
+    except AdmissionRejected as e:
+        return _too_many_requests(e)
+    try:
+        session_id = asistente.sessions.get_or_create(data.get('session_id')).session_id
+    except BaseException:
+        # Todavía no hay stream que libere el hueco
+        slot.release()
+        raise
+
+    def generate():
+        yield _sse({"session_id": session_id}, event="session")
+        fragmentos = asistente.preguntar_con_rag_stream(user_message, session_id=session_id)
+        try:
+            for fragment in fragmentos:
+                if isinstance(fragment, FallbackAnswer):
+                    yield _sse({"reason": fragment.reason}, event="degraded")
+                yield _sse({"delta": str(fragment)})
+            yield _sse({"success": True}, event="done")
+        except Exception as e:
+            ERRORS.inc(endpoint="/api/chat/stream")
+            yield _sse({"success": False, "error": str(e)}, event="error")
+        finally:
+            # Si el cliente se desconecta, cerrar el generador guarda la respuesta parcial
+            fragmentos.close()
+            slot.release()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Evita que proxies acumulen la respuesta
+        },
+    )
+    # También si el stream se cierra antes de empezar (release solo cuenta una vez)
+    response.call_on_close(slot.release)
+    return response
+
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Responde una lista de preguntas independientes en paralelo.
+
+    Cuerpo: ``{"questions": [...], "max_workers": n}``. La respuesta es NDJSON:
+    una línea por pregunta a medida que terminan (``index``, ``question``,
+    ``status``, ``response``...) y una última línea ``{"done": true, ...}``
+    con el resumen del lote.
+    """
+    try:
+        questions, max_workers = parse_batch_request(request.get_json(silent=True))
+    except BatchRequestError as e:
+        return jsonify({"error": str(e)}), e.status
+    if asistente is None:
+        return jsonify({"success": False, "error": "Asistente no inicializado"}), 500
+    # Cada pregunta cuenta para el límite del cliente y cada llamada al modelo del
+    # lote ocupa un hueco de admisión, como una de /api/chat
+    key = _client_key()
+    try:
+        ADMISSION.charge(key, len(questions))
+    except AdmissionRejected as e:
+        return _too_many_requests(e)
+    max_workers = ADMISSION.limit_workers(max_workers)
+
+    def generate():
+        start = time.perf_counter()
+        statuses = {}
+        resultados = asistente.preguntar_lote(questions, max_workers=max_workers, admit=ADMISSION.acquire)
+        try:
+            for item in resultados:
+                statuses[item["status"]] = statuses.get(item["status"], 0) + 1
+                yield _ndjson(item)
+            yield _ndjson({
+                "done": True, "total": len(questions), "statuses": statuses,
+                "seconds": round(time.perf_counter() - start, 3),
+            })
+        except Exception as e:
+            ERRORS.inc(endpoint="/api/chat/batch")
+            yield _ndjson({"done": True, "success": False, "error": str(e)})
+        finally:
+            # Si el cliente se desconecta, se cancelan las preguntas pendientes
+            resultados.close()
+            # Las preguntas sin hueco no gastan el límite del cliente
+            if statuses.get("rejected"):
+                ADMISSION.refund(key, statuses["rejected"])
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route('/api/welcome', methods=['GET'])
 def welcome():
     """Endpoint que devuelve el saludo inicial del asistente (si existe).
 
-    Devuelve el saludo y lo marca como consumido para que se entregue solo una vez.
+    Devuelve el saludo y lo marca como consumido para que se entregue solo una vez
+    por sesión (``?session_id=...``; si no se envía se crea una sesión nueva).
     """
     try:
         if asistente is None:
             return jsonify({"success": False, "error": "Asistente no inicializado"}), 500
 
-        # Asistente puede tener un método que devuelva el saludo inicial y lo quite
-        saludo = None
-        if hasattr(asistente, 'pop_initial_greeting'):
-            saludo = asistente.pop_initial_greeting()
+        session_id, saludo = asistente.saludo_para_sesion(request.args.get('session_id'))
 
         if saludo:
-            return jsonify({"success": True, "welcome": saludo}), 200
+            return jsonify({"success": True, "welcome": saludo, "session_id": session_id}), 200
         else:
-            return jsonify({"success": False, "welcome": None}), 204
+            return jsonify({"success": False, "welcome": None, "session_id": session_id}), 204
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -95,17 +291,28 @@ def debug_info():
     return jsonify({
         "service": "Green Dream Chat API",
         "assistant_initialized": assistant_initialized,
-        "assistant_error": assistant_init_error
+        "assistant_error": assistant_init_error,
+        "sessions": asistente.sessions.stats() if asistente is not None else None,
+        "response_cache": asistente.response_cache.stats() if asistente is not None else None,
+        "coalescing": asistente.coalescer.stats() if asistente is not None else None,
+        "admission": ADMISSION.stats(),
+        "llm_client": {"circuit": breaker.state, "outcomes": client_stats.snapshot()}
     })
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Métricas en formato de texto de Prometheus (latencia por etapa, peticiones, tokens, caché)"""
+    return Response(REGISTRY.render(), content_type=REGISTRY.CONTENT_TYPE)
+
+
 @app.route('/')
 def index():
     """Raíz: información mínima de la API (sin servir archivos estáticos)."""
     return jsonify({
         "service": "Green Dream Chat API",
         "message": "API only — use /api/* endpoints. The static website is not served here.",
-        "endpoints": ["/api/health", "/api/chat", "/api/debug"]
+        "endpoints": ["/api/health", "/api/chat", "/api/chat/stream", "/api/chat/batch", "/api/debug", "/api/metrics"]
     })
 
 if __name__ == '__main__':
@@ -1,7 +1,200 @@
 # assistant_rag.py - Asistente con RAG integrado para Green Dream
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
 from azure.ai.inference.models import SystemMessage, UserMessage, AssistantMessage
-from chat_client import client
-from rag_system import GreenDreamRAG
+from admission import AdmissionRejected
+from chat_client import breaker, client_stats, get_async_client, get_client, reset_client, warm_up_connection
+from llm_client import CircuitOpenError
+from rag_system import GreenDreamRAG, KnowledgeBaseWatcher
+from session_store import create_session_store
+from prompt_budget import PromptPacker, estimate_tokens
+from response_cache import ResponseCache, make_cache_key
+from single_flight import AsyncSingleFlight, FirstFragmentTimeout, SingleFlight
+from startup import STARTUP
+from metrics import (
+    COMPLETION_TOKENS,
+    DEGRADED_RESPONSES,
+    PROMPT_TOKENS,
+    REGISTRY,
+    STAGE_SECONDS,
+)
+
+# Segundos que se espera a que el modelo empiece a responder antes de contestar
+# solo con la búsqueda (modo degradado); 0 desactiva el límite
+LLM_LATENCY_BUDGET_SECONDS = float(os.getenv("LLM_LATENCY_BUDGET_SECONDS", "8"))
+
+# Lotes de preguntas (preguntar_lote y /api/chat/batch): llamadas simultáneas al
+# modelo y número máximo de preguntas por lote
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+
+# Tipos de mensaje según el rol guardado en el historial
+_MESSAGE_TYPES = {
+    "system": SystemMessage,
+    "user": UserMessage,
+    "assistant": AssistantMessage,
+}
+
+
+class FallbackAnswer(str):
+    """Respuesta degradada construida solo con la búsqueda, sin el modelo"""
+
+    def __new__(cls, content: str, reason: str):
+        answer = super().__new__(cls, content)
+        answer.reason = reason
+        return answer
+
+
+class BatchRequestError(ValueError):
+    """Cuerpo de /api/chat/batch no válido (``status`` es el código HTTP)"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_batch_request(data):
+    """``(preguntas, max_workers)`` del cuerpo de /api/chat/batch.
+
+    ``{"questions": ["...", ...], "max_workers": n}``; ``max_workers`` es
+    opcional y no puede superar ``BATCH_MAX_WORKERS``.
+    """
+    preguntas = data.get("questions") if isinstance(data, dict) else None
+    if not isinstance(preguntas, list) or not preguntas or not all(
+        isinstance(pregunta, str) and pregunta.strip() for pregunta in preguntas
+    ):
+        raise BatchRequestError("Campo 'questions' requerido (lista de preguntas)")
+    if len(preguntas) > BATCH_MAX_QUESTIONS:
+        raise BatchRequestError(f"Máximo {BATCH_MAX_QUESTIONS} preguntas por lote", status=413)
+    try:
+        max_workers = int(data.get("max_workers") or BATCH_MAX_WORKERS)
+    except (TypeError, ValueError):
+        raise BatchRequestError("'max_workers' debe ser un número entero")
+    return preguntas, max(1, min(max_workers, BATCH_MAX_WORKERS))
+
+
+def _rejected_item(error, inicio):
+    """Resultado de una pregunta de un lote que no obtuvo hueco para llamar al modelo"""
+    return {
+        "status": "rejected", "reason": error.reason, "error": str(error),
+        "retry_after": int(error.retry_after_header),
+        "seconds": round(time.perf_counter() - inicio, 3),
+    }
+
+
+def _fallback_reason(error):
+    """Motivo del modo degradado según el error del modelo"""
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, FirstFragmentTimeout):
+        return "latency_budget"
+    return "llm_error"
+
+
+@dataclass
+class PreparedRequest:
+    """Petición lista para enviar al modelo"""
+
+    messages: List[Any]
+    # Clave en la caché de respuestas (None si la pregunta depende del historial)
+    cache_key: Optional[str] = None
+    # Huella del prompt efectivo: peticiones simultáneas iguales comparten la llamada
+    prompt_key: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+def _prompt_key(messages, **model_params):
+    """Huella del prompt completo (mensajes + parámetros del modelo)"""
+    raw = json.dumps(
+        [[type(m).__name__, m.content] for m in messages] + [model_params],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _role_of(mensaje):
+    """Rol ("user", "assistant", ...) de un mensaje del SDK de Azure"""
+    for role, message_type in _MESSAGE_TYPES.items():
+        if isinstance(mensaje, message_type):
+            return role
+    return None
+
+
+class _LLMCallMetrics:
+    """Mide una llamada al modelo: tiempo al primer fragmento, tiempo total y tokens"""
+
+    def __init__(self, messages):
+        self.start = time.perf_counter()
+        self.parts = []
+        PROMPT_TOKENS.inc(sum(estimate_tokens(m.content) for m in messages))
+
+    def fragment(self, text):
+        if not self.parts:
+            STAGE_SECONDS.observe(time.perf_counter() - self.start, stage="llm_ttft")
+        self.parts.append(text)
+
+    def finish(self, completed=True):
+        if completed:
+            STAGE_SECONDS.observe(time.perf_counter() - self.start, stage="llm_total")
+        if self.parts:
+            COMPLETION_TOKENS.inc(estimate_tokens("".join(self.parts)))
+
+
+class _StreamCall:
+    """Une el stream del modelo con quien espera su primer fragmento.
+
+    Si este se rinde por el límite de latencia, el circuit breaker lo cuenta
+    como fallo aunque el stream se establezca (o empiece a responder) después.
+    """
+
+    def __init__(self):
+        self._stream = None
+        self._gave_up = False
+        self._lock = threading.Lock()
+
+    def attach(self, stream):
+        with self._lock:
+            self._stream = stream
+            gave_up = self._gave_up
+        if gave_up:
+            self._give_up(stream)
+
+    def give_up(self):
+        with self._lock:
+            self._gave_up = True
+            stream = self._stream
+        if stream is not None:
+            self._give_up(stream)
+
+    @staticmethod
+    def _give_up(stream):
+        # Solo los streams del cliente gestionado (llm_client.BreakerStream) llevan el circuito
+        give_up = getattr(stream, "give_up", None)
+        if give_up:
+            give_up()
+
+
+def _delta_content(event):
+    """Texto incremental de un evento de streaming (None si no trae contenido)"""
+    if (
+        hasattr(event, "choices") and event.choices
+    ):  # hasattr verifica que choices existe y no es None
+        choice = event.choices[0]
+        if hasattr(choice, "delta") and choice.delta:
+            if hasattr(choice.delta, "content") and choice.delta.content:
+                return choice.delta.content
+    return None
 
 
 class AsistenteGreenDreamRAG:
@@ -44,7 +237,94 @@ class AsistenteGreenDreamRAG:
         self.messages.append(AssistantMessage(content=greeting))
         # Log útil para desarrollo: ver el saludo inicial en los logs del servidor
         print("🌱 Saludo inicial del asistente:", greeting)
-        self.rag_system = GreenDreamRAG()
+        self.greeting = greeting
+        with STARTUP.phase("knowledge_base"):
+            self.rag_system = GreenDreamRAG()
+        # Recarga en caliente de los JSON de la base (KB_RELOAD_INTERVAL_SECONDS)
+        self.kb_watcher = KnowledgeBaseWatcher(self.rag_system)
+        self.kb_watcher.start()
+        # Historiales por sesión (usados por la API); self.messages queda para uso local.
+        # Con SESSION_DB_PATH se comparten entre los workers en un fichero SQLite
+        self.sessions = create_session_store()
+        # Presupuesto de tokens de entrada (historial + contexto + pregunta)
+        self.packer = PromptPacker()
+        # Respuestas a preguntas sin historial previo (p. ej. "cursos gratuitos")
+        self.response_cache = ResponseCache()
+        # Peticiones idénticas simultáneas comparten una sola llamada al modelo
+        self.coalescer = SingleFlight()
+        self.async_coalescer = AsyncSingleFlight()
+        # Tiempo máximo hasta el primer fragmento del modelo antes de responder en modo degradado
+        self.latency_budget = LLM_LATENCY_BUDGET_SECONDS
+        self._register_metrics()
+
+    def warmup(self, client: bool = True, connection: bool = True):
+        """Calienta la búsqueda y el cliente del modelo antes de la primera pregunta.
+
+        Con ``connection=False`` el cliente se crea (se carga el SDK) sin abrir
+        conexiones: así lo hace el maestro de gunicorn con preload, cuyos
+        sockets no deben heredar los workers.
+        """
+        with STARTUP.phase("warmup_search"):
+            self.rag_system.warmup()
+        if client:
+            with STARTUP.phase("warmup_client"):
+                if connection:
+                    warm_up_connection()
+                else:
+                    get_client()
+
+    def prepare_fork(self):
+        """En el proceso maestro antes de crear workers: detiene lo que no sobrevive a un fork"""
+        self.kb_watcher.stop(timeout=10)
+        self.rag_system.prepare_fork()
+        # Escribe las sesiones pendientes y cierra el fichero: cada worker abre su conexión
+        self.sessions.close()
+        # Cada worker abre sus propias conexiones con Azure (no se comparten sockets)
+        reset_client()
+
+    def after_fork(self, warmup: bool = True):
+        """En cada worker: recarga en caliente, procesos de búsqueda y conexión propios"""
+        # Los procesos de búsqueda, antes de arrancar el vigilante: sin otros hilos se crean con fork
+        self.rag_system.after_fork()
+        self.kb_watcher.restart()
+        if warmup:
+            with STARTUP.phase("warmup_connection"):
+                warm_up_connection()
+
+    def _register_metrics(self):
+        """Expone en /api/metrics los contadores que ya llevan la caché, las sesiones y el cliente"""
+        REGISTRY.register_callback(
+            "greendream_cache_hits_total", "Respuestas servidas desde la caché", "counter",
+            lambda: self.response_cache.hits,
+        )
+        REGISTRY.register_callback(
+            "greendream_cache_misses_total", "Consultas a la caché sin respuesta guardada", "counter",
+            lambda: self.response_cache.misses,
+        )
+        REGISTRY.register_callback(
+            "greendream_active_sessions", "Sesiones de conversación activas", "gauge",
+            lambda: len(self.sessions),
+        )
+        REGISTRY.register_callback(
+            "greendream_coalesced_requests_total", "Peticiones que compartieron una llamada en curso al modelo", "counter",
+            lambda: self.coalescer.coalesced + self.async_coalescer.coalesced,
+        )
+        REGISTRY.register_callback(
+            "greendream_llm_calls_total", "Resultados de las llamadas al modelo", "counter",
+            client_stats.snapshot, labelnames=("outcome",),
+        )
+        REGISTRY.register_callback(
+            "greendream_circuit_open", "1 si el circuit breaker del modelo está abierto", "gauge",
+            lambda: 1 if breaker.is_open else 0,
+        )
+        REGISTRY.register_callback(
+            "greendream_kb_version", "Versión de la base de conocimiento cargada (sube en cada recarga)", "gauge",
+            lambda: self.rag_system.version,
+        )
+        REGISTRY.register_callback(
+            "greendream_kb_documents", "Documentos en la base de conocimiento", "gauge",
+            lambda: len(self.rag_system.documents),
+        )
 
     def preguntar_con_rag(
         self,
@@ -53,6 +333,7 @@ class AsistenteGreenDreamRAG:
         max_tokens: int = 1000,
         stream: bool = False,
         model: str = "gpt-4o",
+        session_id: str = None,
     ):
         """
         Pregunta al modelo usando RAG para obtener información contextual específica de Green Dream
@@ -62,26 +343,452 @@ class AsistenteGreenDreamRAG:
             max_tokens (int): Número máximo de tokens en la respuesta
             stream (bool): Si se debe usar streaming para la respuesta (Streaming significa que la respuesta se muestra en tiempo real a medida que se genera)
             model (str): El modelo de lenguaje a utilizar
+            session_id (str): Sesión cuyo historial se usa; si es None se usa el historial local (self.messages)
+        """
+        peticion = self._preparar_mensajes(
+            pregunta, session_id, temperature=temperature, max_tokens=max_tokens, model=model
+        )
+
+        cached = self._cached_response(peticion)
+        if cached is not None:
+            print("⚡ Respuesta desde caché:", cached)
+            self._commit_turn(pregunta, cached, session_id)
+            return cached
+
+        if get_client() is None:
+            return self._fallback(pregunta, session_id, "llm_unavailable")
+
+        try:
+            if stream:
+                respuesta = self._process_streaming(
+                    peticion.messages, pregunta, temperature, max_tokens, model, session_id,
+                    flight_key=peticion.prompt_key,
+                )
+            else:
+                respuesta = self._process_non_streaming(
+                    peticion.messages, pregunta, temperature, max_tokens, model, session_id,
+                    flight_key=peticion.prompt_key,
+                )
+        except Exception as e:
+            return self._fallback(pregunta, session_id, _fallback_reason(e), e)
+        self._store_response(peticion, respuesta)
+        return respuesta
+
+    def preguntar_con_rag_stream(
+        self,
+        pregunta: str,
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        model: str = "gpt-4o",
+        session_id: str = None,
+    ):
+        """
+        Igual que ``preguntar_con_rag`` pero devuelve un generador con cada fragmento
+        de la respuesta a medida que llega del modelo (para reenviarlo al navegador).
+
+        El turno se guarda en el historial al terminar el stream; si el consumidor lo
+        cierra antes (por ejemplo, el cliente se desconecta) se guarda lo generado hasta ese momento.
+        """
+        peticion = self._preparar_mensajes(
+            pregunta, session_id, temperature=temperature, max_tokens=max_tokens, model=model
+        )
+
+        cached = self._cached_response(peticion)
+        if cached is not None:
+            self._commit_turn(pregunta, cached, session_id)
+            yield cached
+            return
+
+        if get_client() is None:
+            yield self._fallback(pregunta, session_id, "llm_unavailable")
+            return
+
+        respuesta = ""
+        try:
+            for fragment in self._stream_deltas(
+                peticion.messages, temperature, max_tokens, model,
+                flight_key=peticion.prompt_key,
+                first_timeout=self.latency_budget,
+            ):
+                respuesta += fragment
+                yield fragment
+        except GeneratorExit:
+            # El consumidor cerró el stream: guardar la respuesta parcial ya entregada
+            if respuesta:
+                self._commit_turn(pregunta, respuesta, session_id)
+            raise
+        except Exception as e:
+            # Si el modelo no llegó a responder, contestar solo con la búsqueda; si falló
+            # a mitad, guardar la respuesta parcial ya entregada (como al desconectarse)
+            if respuesta:
+                self._commit_turn(pregunta, respuesta, session_id)
+                raise
+            yield self._fallback(pregunta, session_id, _fallback_reason(e), e)
+            return
+
+        self._commit_turn(pregunta, respuesta, session_id)
+        self._store_response(peticion, respuesta)
+
+    async def preguntar_con_rag_async(
+        self,
+        pregunta: str,
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        model: str = "gpt-4o",
+        session_id: str = None,
+    ):
+        """
+        Versión asíncrona de ``preguntar_con_rag`` (usa ``azure.ai.inference.aio``).
+
+        La búsqueda en la base de conocimiento y el armado del prompt se ejecutan en
+        un hilo aparte para no bloquear el event loop (también la búsqueda de la
+        respuesta degradada).
+        """
+        peticion = await asyncio.to_thread(
+            self._preparar_mensajes,
+            pregunta,
+            session_id,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            model=model,
+        )
+
+        cached = self._cached_response(peticion)
+        if cached is not None:
+            await self._commit_turn_async(pregunta, cached, session_id)
+            return cached
+
+        aclient = get_async_client()
+        if aclient is None:
+            return await self._fallback_async(pregunta, session_id, "llm_unavailable")
+
+        try:
+            assistant_content = await self._generate_async(aclient, peticion, temperature, max_tokens, model)
+        except Exception as e:
+            return await self._fallback_async(pregunta, session_id, _fallback_reason(e), e)
+
+        await self._commit_turn_async(pregunta, assistant_content, session_id)
+        self._store_response(peticion, assistant_content)
+        return assistant_content
+
+    async def _generate_async(self, aclient, peticion, temperature, max_tokens, model):
+        """Versión asíncrona de ``_generate``"""
+        if self.latency_budget > 0:
+            # Con límite de latencia se usa streaming para saber cuándo empieza a responder
+            return "".join([
+                fragment
+                async for fragment in self._stream_deltas_async(
+                    aclient, peticion.messages, temperature, max_tokens, model,
+                    flight_key=peticion.prompt_key,
+                    first_timeout=self.latency_budget,
+                )
+            ])
+        return await self.async_coalescer.do(
+            peticion.prompt_key,
+            lambda: self._complete_async(
+                aclient, peticion.messages, temperature, max_tokens, model
+            ),
+        )
+
+    async def preguntar_lote_async(
+        self,
+        preguntas: List[str],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        model: str = "gpt-4o",
+        max_workers: Optional[int] = None,
+        admit=None,
+    ):
+        """Versión asíncrona de ``preguntar_lote``: hasta ``max_workers`` llamadas al modelo a la vez.
+
+        ``admit`` es una corrutina que devuelve el hueco de cada llamada (``ADMISSION.acquire_async``).
+        """
+        contextos = await asyncio.to_thread(self.rag_system.get_recommendations_contexts, preguntas)
+        limite = asyncio.Semaphore(max_workers or BATCH_MAX_WORKERS)
+
+        async def responder(i, pregunta, contexto):
+            async with limite:
+                try:
+                    item = await self._responder_item_async(
+                        pregunta, contexto, temperature, max_tokens, model, admit
+                    )
+                except Exception as e:
+                    item = {"status": "error", "error": str(e)}
+            return {"index": i, "question": pregunta, **item}
+
+        tareas = [
+            asyncio.ensure_future(responder(i, pregunta, contexto))
+            for i, (pregunta, contexto) in enumerate(zip(preguntas, contextos))
+        ]
+        try:
+            for siguiente in asyncio.as_completed(tareas):
+                yield await siguiente
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+
+    async def _responder_item_async(self, pregunta, contexto_rag, temperature, max_tokens, model, admit=None):
+        """Versión asíncrona de ``_responder_item``"""
+        inicio = time.perf_counter()
+        peticion = await asyncio.to_thread(
+            self._preparar_mensajes,
+            pregunta,
+            contexto_rag=contexto_rag,
+            con_historial=False,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            model=model,
+        )
+        item = {"status": "ok"}
+        respuesta = self._cached_response(peticion)
+        aclient = get_async_client() if respuesta is None else None
+        if respuesta is not None:
+            item["status"] = "cached"
+        elif aclient is None:
+            respuesta = await asyncio.to_thread(self._fallback_answer, pregunta, "llm_unavailable")
+        else:
+            try:
+                async with (await admit() if admit is not None else nullcontext()):
+                    respuesta = await self._generate_async(aclient, peticion, temperature, max_tokens, model)
+                self._store_response(peticion, respuesta)
+            except AdmissionRejected as e:
+                return _rejected_item(e, inicio)
+            except Exception as e:
+                respuesta = await asyncio.to_thread(self._fallback_answer, pregunta, _fallback_reason(e), e)
+        if isinstance(respuesta, FallbackAnswer):
+            item.update(status="degraded", reason=respuesta.reason)
+        item.update(response=str(respuesta), seconds=round(time.perf_counter() - inicio, 3))
+        return item
+
+    async def preguntar_con_rag_stream_async(
+        self,
+        pregunta: str,
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        model: str = "gpt-4o",
+        session_id: str = None,
+    ):
+        """Versión asíncrona de ``preguntar_con_rag_stream`` (generador asíncrono de fragmentos)"""
+        peticion = await asyncio.to_thread(
+            self._preparar_mensajes,
+            pregunta,
+            session_id,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            model=model,
+        )
+
+        cached = self._cached_response(peticion)
+        if cached is not None:
+            await self._commit_turn_async(pregunta, cached, session_id)
+            yield cached
+            return
+
+        aclient = get_async_client()
+        if aclient is None:
+            yield await self._fallback_async(pregunta, session_id, "llm_unavailable")
+            return
+
+        fragmentos = self._stream_deltas_async(
+            aclient, peticion.messages, temperature, max_tokens, model,
+            flight_key=peticion.prompt_key,
+            first_timeout=self.latency_budget,
+        )
+        respuesta = ""
+        try:
+            async for fragment in fragmentos:
+                respuesta += fragment
+                yield fragment
+        except (GeneratorExit, asyncio.CancelledError):
+            # El cliente se desconectó: guardar la respuesta parcial ya entregada (sin
+            # esperar a otro hilo: la tarea ya se está cancelando)
+            if respuesta:
+                self._commit_turn(pregunta, respuesta, session_id)
+            raise
+        except Exception as e:
+            # Si el modelo no llegó a responder, contestar solo con la búsqueda; si falló
+            # a mitad, guardar la respuesta parcial ya entregada (como al desconectarse)
+            if respuesta:
+                await self._commit_turn_async(pregunta, respuesta, session_id)
+                raise
+            yield await self._fallback_async(pregunta, session_id, _fallback_reason(e), e)
+            return
+        finally:
+            await fragmentos.aclose()
+
+        await self._commit_turn_async(pregunta, respuesta, session_id)
+        self._store_response(peticion, respuesta)
+
+    async def _stream_deltas_async(
+        self, aclient, messages_for_request, temperature, max_tokens, model, flight_key=None,
+        first_timeout=None,
+    ):
+        """Versión asíncrona de ``_stream_deltas``"""
+        call = _StreamCall()
+        fragments = self.async_coalescer.stream(
+            flight_key,
+            lambda: self._upstream_deltas_async(
+                aclient, messages_for_request, temperature, max_tokens, model, call
+            ),
+            first_timeout=first_timeout or None,
+        )
+        try:
+            async for fragment in fragments:
+                yield fragment
+        except FirstFragmentTimeout:
+            call.give_up()
+            raise
+        finally:
+            await fragments.aclose()
+
+    async def _upstream_deltas_async(
+        self, aclient, messages_for_request, temperature, max_tokens, model, call=None
+    ):
+        """Generador asíncrono con los fragmentos que devuelve el modelo en streaming"""
+        medicion = _LLMCallMetrics(messages_for_request)
+        stream_iter = await aclient.complete(
+            model=model,
+            messages=messages_for_request,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        if call is not None:
+            call.attach(stream_iter)
+        completed = False
+        try:
+            async for event in stream_iter:
+                fragment = _delta_content(event)
+                if fragment:
+                    medicion.fragment(fragment)
+                    yield fragment
+            completed = True
+        finally:
+            medicion.finish(completed)
+            await stream_iter.aclose()
+
+    async def _complete_async(self, aclient, messages_for_request, temperature, max_tokens, model):
+        """Llamada sin streaming al modelo (asíncrona); devuelve el texto de la respuesta"""
+        medicion = _LLMCallMetrics(messages_for_request)
+        response = await aclient.complete(
+            model=model,
+            messages=messages_for_request,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        medicion.fragment(response.choices[0].message.content or "")
+        medicion.finish()
+        return response.choices[0].message.content
+
+    def _fallback(self, pregunta, session_id, reason, error=None):
+        """Respuesta degradada solo con la búsqueda (el modelo no está disponible o tarda demasiado).
+
+        No se guarda en el historial: no la escribió el modelo y no debe volver a él
+        como turno del asistente en las siguientes preguntas.
+        """
+        return self._fallback_answer(pregunta, reason, error)
+
+    async def _fallback_async(self, pregunta, session_id, reason, error=None):
+        """``_fallback`` en un hilo: su búsqueda no debe bloquear el event loop"""
+        # En una caída del modelo todas las peticiones pasan por aquí a la vez
+        return await asyncio.to_thread(self._fallback, pregunta, session_id, reason, error)
+
+    def _fallback_answer(self, pregunta, reason, error=None):
+        print(f"⚠️ Respuesta degradada ({reason}){': ' + str(error) if error else ''}")
+        DEGRADED_RESPONSES.inc(reason=reason)
+        return FallbackAnswer(self.rag_system.get_fallback_answer(pregunta), reason)
+
+    def _cached_response(self, peticion):
+        """Respuesta guardada para la petición (None si no es cacheable o no existe)"""
+        if peticion.cache_key is None or not self.response_cache.enabled:
+            return None
+        return self.response_cache.get(peticion.cache_key)
+
+    def _store_response(self, peticion, respuesta):
+        """Guarda una respuesta completa en la caché si la petición es cacheable"""
+        if peticion.cache_key is not None:
+            self.response_cache.set(peticion.cache_key, respuesta)
+
+    def _preparar_mensajes(self, pregunta, session_id=None, contexto_rag=None, con_historial=True, **model_params):
+        """Construye la petición: mensajes (sistema, historial y prompt con contexto RAG) y clave de caché.
+
+        ``contexto_rag`` evita repetir la búsqueda si ya se hizo (lotes); con
+        ``con_historial=False`` la pregunta se trata como independiente.
         """
         # 1. Obtener contexto relevante de la base de conocimiento
-        contexto_rag = self.rag_system.get_recommendations_context(pregunta)
+        if contexto_rag is None:
+            with STAGE_SECONDS.time(stage="retrieval"):
+                contexto_rag = self.rag_system.get_recommendations_context(pregunta)
+        inicio = time.perf_counter()
 
         # 1.a Añadir resumen de lo que contiene la base de conocimiento para que el
         # modelo sepa cuántos recursos hay y de qué tipo (esto ayuda cuando el
         # contexto RAG está vacío o es corto).
         try:
+            # Conteos precalculados al cargar la base (no se recorre el corpus en cada pregunta)
             total_docs = len(self.rag_system.documents)
-            cursos = len([d for d in self.rag_system.documents if d.get("type") == "curso"]) if total_docs else 0
-            articulos = len([d for d in self.rag_system.documents if d.get("type") == "articulo"]) if total_docs else 0
-            revistas = len([d for d in self.rag_system.documents if d.get("type") == "revista"]) if total_docs else 0
+            conteos = self.rag_system.count_by_type()
+            cursos = conteos.get("curso", 0)
+            articulos = conteos.get("articulo", 0)
+            revistas = conteos.get("revista", 0)
             resumen_base = (
                 f"BASE_DE_CONOCIMIENTO: total={total_docs}; cursos={cursos}; articulos={articulos}; revistas={revistas}."
             )
         except Exception:
             resumen_base = "BASE_DE_CONOCIMIENTO: información de recursos no disponible." 
 
-        # 2. Construir prompt enriquecido con contexto y el resumen
-        prompt_enriquecido = f"""
+        # 2. Ajustar historial y contexto al presupuesto de tokens
+        history = self._history_turns(session_id) if con_historial else []
+        system_prompt = self._system_prompt_for(session_id) if con_historial else self.system_prompt
+        packed = self.packer.pack(
+            system_prompt,
+            history,
+            contexto_rag,
+            self._build_prompt("", resumen_base, pregunta),
+        )
+        # El uso de tokens de cada petición viaja en su PreparedRequest (no en el asistente,
+        # que comparten los hilos y corrutinas de las peticiones simultáneas)
+        logging.debug(
+            "📏 Tokens del prompt: historial=%(history)s contexto=%(context)s "
+            "pregunta=%(question)s total=%(total)s/%(budget)s",
+            packed.usage,
+        )
+
+        # 3. Construir mensajes para la petición (prompt enriquecido con contexto y resumen)
+        user_msg = UserMessage(
+            content=self._build_prompt(packed.context, resumen_base, pregunta)
+        )
+        messages_for_request = [
+            SystemMessage(content=system_prompt)
+        ] + [
+            _MESSAGE_TYPES[role](content=content) for role, content in packed.history
+        ] + [
+            user_msg
+        ]  # Crea una lista con el mensaje de rol sistema, el historial y rol usuario
+
+        # 4. Solo las preguntas sin turnos previos del usuario se pueden responder desde caché
+        cache_key = None
+        if not any(role == "user" for role, _ in history):
+            cache_key = make_cache_key(
+                pregunta,
+                contexto_rag,
+                kb_version=self.rag_system.version,
+                system_prompt=system_prompt,
+                **model_params,
+            )
+
+        peticion = PreparedRequest(
+            messages=messages_for_request,
+            cache_key=cache_key,
+            prompt_key=_prompt_key(messages_for_request, **model_params),
+            usage=packed.usage,
+        )
+        STAGE_SECONDS.observe(time.perf_counter() - inicio, stage="prompt_assembly")
+        return peticion
+
+    def _build_prompt(self, contexto_rag, resumen_base, pregunta):
+        """Prompt enriquecido que se envía como mensaje del usuario"""
+        return f"""
         {contexto_rag}
 
         {resumen_base}
@@ -91,93 +798,227 @@ class AsistenteGreenDreamRAG:
         Por favor, proporciona una respuesta personalizada usando la información específica de Green Dream mostrada arriba. Si no hay coincidencias exactas en la base, ofrece recomendaciones prácticas y pasos siguientes en lugar de indicar que no tienes información.
         """
 
-        # 3. Construir mensajes para la petición
-        user_msg = UserMessage(content=prompt_enriquecido)
-        messages_for_request = list(self.messages) + [
-            user_msg
-        ]  # Crea una lista con el mensaje de rol sistema y rol usuario
+    def _system_prompt_for(self, session_id=None):
+        """Prompt del sistema de la sesión (el historial local puede tener uno propio)"""
+        if session_id is None and self.messages:
+            return self.messages[0].content
+        return self.system_prompt
 
-        if stream:
-            return self._process_streaming(
-                messages_for_request, user_msg, temperature, max_tokens, model
-            )
+    def _history_turns(self, session_id=None):
+        """Historial previo como ``(rol, contenido)``: el de la sesión o el local"""
+        if session_id is None:
+            return [
+                (_role_of(mensaje), mensaje.content)
+                for mensaje in self.messages[1:]
+                if _role_of(mensaje)
+            ]
+
+        turns = []
+        for pregunta, respuesta in self.sessions.get_history(session_id):
+            turns.append(("user", pregunta))
+            turns.append(("assistant", respuesta))
+        return turns
+
+    def _commit_turn(self, pregunta, respuesta, session_id=None):
+        """Guarda en el historial solo la pregunta original (sin el contexto RAG) y la respuesta"""
+        if session_id is None:
+            self.messages.append(UserMessage(content=pregunta))
+            self.messages.append(AssistantMessage(content=respuesta))
         else:
-            return self._process_non_streaming(
-                messages_for_request, user_msg, temperature, max_tokens, model
+            self.sessions.append_turn(session_id, pregunta, respuesta)
+
+    async def _commit_turn_async(self, pregunta, respuesta, session_id=None):
+        """``_commit_turn`` en un hilo: el almacén de sesiones puede esperar a SQLite"""
+        await asyncio.to_thread(self._commit_turn, pregunta, respuesta, session_id)
+
+    def _stream_deltas(
+        self, messages_for_request, temperature, max_tokens, model, flight_key=None,
+        first_timeout=None,
+    ):
+        """Fragmentos de la respuesta; con ``flight_key`` se comparte el stream entre peticiones iguales.
+
+        Si el primer fragmento no llega en ``first_timeout``, la llamada cuenta como
+        fallo para el circuit breaker (una vez por stream, aunque se comparta).
+        """
+        call = _StreamCall()
+        try:
+            yield from self.coalescer.stream(
+                flight_key,
+                lambda: self._upstream_deltas(
+                    messages_for_request, temperature, max_tokens, model, call
+                ),
+                first_timeout=first_timeout or None,
             )
+        except FirstFragmentTimeout:
+            call.give_up()
+            raise
+
+    def _upstream_deltas(self, messages_for_request, temperature, max_tokens, model, call=None):
+        """Generador con los fragmentos de texto que devuelve el modelo en streaming"""
+        medicion = _LLMCallMetrics(messages_for_request)
+        stream_iter = get_client().complete(
+            model=model,
+            messages=messages_for_request,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        if call is not None:
+            call.attach(stream_iter)
+        completed = False
+        try:
+            for event in stream_iter:
+                fragment = _delta_content(event)
+                if fragment:
+                    medicion.fragment(fragment)
+                    yield fragment
+            completed = True
+        finally:
+            medicion.finish(completed)
+            # Cerrar la conexión con Azure si el consumidor abandona el stream
+            close = getattr(stream_iter, "close", None)
+            if close:
+                close()
+
+    def _complete(self, messages_for_request, temperature, max_tokens, model):
+        """Llamada sin streaming al modelo; devuelve el texto de la respuesta"""
+        medicion = _LLMCallMetrics(messages_for_request)
+        response = get_client().complete(
+            model=model,
+            messages=messages_for_request,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        medicion.fragment(response.choices[0].message.content or "")
+        medicion.finish()
+        return response.choices[0].message.content
 
     def _process_streaming(
-        self, messages_for_request, user_msg, temperature, max_tokens, model
+        self, messages_for_request, pregunta, temperature, max_tokens, model, session_id=None,
+        flight_key=None,
     ):
         """Procesa respuesta con streaming"""
         respuesta = ""
         try:
-            stream_iter = client.complete(
-                model=model,
-                messages=messages_for_request,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=True,
-            )
             print("🌱 ", end="", flush=True)
-            for event in stream_iter:
-                if (
-                    hasattr(event, "choices") and event.choices
-                ):  # hasattr verifica que choices existe y no es None
-                    choice = event.choices[0]
-                    if hasattr(choice, "delta") and choice.delta:
-                        if hasattr(choice.delta, "content") and choice.delta.content:
-                            fragment = choice.delta.content
-                            print(fragment, end="", flush=True)
-                            respuesta += fragment
+            for fragment in self._stream_deltas(
+                messages_for_request, temperature, max_tokens, model, flight_key,
+                first_timeout=self.latency_budget,
+            ):
+                print(fragment, end="", flush=True)
+                respuesta += fragment
             print()
         except Exception as e:
             print(f"\n❌ Error en streaming: {e}")
+            # Lo ya mostrado queda en el historial; la respuesta degradada que siga no
+            if respuesta:
+                self._commit_turn(pregunta, respuesta, session_id)
             raise
 
         # Guardar en historial (solo la pregunta original, no el contexto RAG)
-        original_user_msg = UserMessage(
-            content=(
-                user_msg.content.split("CONSULTA DEL JOVEN: ")[1]
-                if "CONSULTA DEL JOVEN: " in user_msg.content
-                else user_msg.content
-            )
-        )
-        self.messages.append(
-            original_user_msg
-        )  # Guarda solo mensaje del usuario original
-        self.messages.append(
-            AssistantMessage(content=respuesta)
-        )  # Guarda respuesta del asistente
+        self._commit_turn(pregunta, respuesta, session_id)
 
         return respuesta
 
     def _process_non_streaming(
-        self, messages_for_request, user_msg, temperature, max_tokens, model
+        self, messages_for_request, pregunta, temperature, max_tokens, model, session_id=None,
+        flight_key=None,
     ):
         """Procesa respuesta sin streaming"""
-        response = client.complete(
-            model=model,
-            messages=messages_for_request,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        assistant_content = response.choices[0].message.content
+        assistant_content = self._generate(messages_for_request, temperature, max_tokens, model, flight_key)
 
         # Guardar en historial (solo la pregunta original, no el contexto RAG)
-        original_user_msg = UserMessage(
-            content=(
-                user_msg.content.split("CONSULTA DEL JOVEN: ")[1]
-                if "CONSULTA DEL JOVEN: " in user_msg.content
-                else user_msg.content
-            )
-        )
-        self.messages.append(original_user_msg)
-        self.messages.append(AssistantMessage(content=assistant_content))
+        self._commit_turn(pregunta, assistant_content, session_id)
 
         print("🌱", assistant_content)
         return assistant_content
 
+    def _generate(self, messages_for_request, temperature, max_tokens, model, flight_key=None):
+        """Texto completo de la respuesta del modelo (respetando el límite de latencia)"""
+        if self.latency_budget > 0:
+            # Con límite de latencia se usa streaming para saber cuándo empieza a responder
+            return "".join(
+                self._stream_deltas(
+                    messages_for_request, temperature, max_tokens, model, flight_key,
+                    first_timeout=self.latency_budget,
+                )
+            )
+        return self.coalescer.do(
+            flight_key,
+            lambda: self._complete(messages_for_request, temperature, max_tokens, model),
+        )
+
+    def preguntar_lote(
+        self,
+        preguntas: List[str],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        model: str = "gpt-4o",
+        max_workers: Optional[int] = None,
+        admit=None,
+    ):
+        """
+        Responde una lista de preguntas independientes (sin historial) en paralelo.
+
+        La búsqueda se hace para todo el lote de una vez y las llamadas al modelo
+        se reparten en un pool de ``max_workers`` hilos (``BATCH_MAX_WORKERS``).
+        Genera un resultado por pregunta a medida que terminan, no en el orden
+        de entrada: ``{"index", "question", "status", "response", "seconds"}``
+        con status ``ok``, ``cached``, ``degraded`` (más ``reason``) o ``error``
+        (más ``error``). Si se deja de consumir, las preguntas pendientes se cancelan.
+
+        ``admit`` da el hueco de cada llamada al modelo (``ADMISSION.acquire`` en
+        la API, para que los lotes compartan el límite de /api/chat); si no lo
+        hay, la pregunta queda con status ``rejected`` (más ``reason`` y
+        ``retry_after``) y se puede volver a enviar.
+        """
+        with STAGE_SECONDS.time(stage="retrieval"):
+            contextos = self.rag_system.get_recommendations_contexts(preguntas)
+        model_params = dict(temperature=temperature, max_tokens=max_tokens, model=model, admit=admit)
+
+        pool = ThreadPoolExecutor(max_workers=max_workers or BATCH_MAX_WORKERS, thread_name_prefix="batch")
+        try:
+            futures = {
+                pool.submit(self._responder_item, pregunta, contexto, **model_params): i
+                for i, (pregunta, contexto) in enumerate(zip(preguntas, contextos))
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    item = future.result()
+                except Exception as e:
+                    item = {"status": "error", "error": str(e)}
+                yield {"index": i, "question": preguntas[i], **item}
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _responder_item(self, pregunta, contexto_rag, temperature, max_tokens, model, admit=None):
+        """Respuesta a una pregunta de un lote (no modifica ningún historial)"""
+        inicio = time.perf_counter()
+        peticion = self._preparar_mensajes(
+            pregunta, contexto_rag=contexto_rag, con_historial=False,
+            temperature=temperature, max_tokens=max_tokens, model=model,
+        )
+        item = {"status": "ok"}
+        respuesta = self._cached_response(peticion)
+        if respuesta is not None:
+            item["status"] = "cached"
+        elif get_client() is None:
+            respuesta = self._fallback_answer(pregunta, "llm_unavailable")
+        else:
+            try:
+                with admit() if admit is not None else nullcontext():
+                    respuesta = self._generate(peticion.messages, temperature, max_tokens, model, peticion.prompt_key)
+                self._store_response(peticion, respuesta)
+            except AdmissionRejected as e:
+                return _rejected_item(e, inicio)
+            except Exception as e:
+                respuesta = self._fallback_answer(pregunta, _fallback_reason(e), e)
+        if isinstance(respuesta, FallbackAnswer):
+            item.update(status="degraded", reason=respuesta.reason)
+        item.update(response=str(respuesta), seconds=round(time.perf_counter() - inicio, 3))
+        return item
+
     def _format_search_results(self, results, tipo):
         """Formatea los resultados de búsqueda"""
         if not results:
@@ -204,11 +1045,19 @@ class AsistenteGreenDreamRAG:
 
         return formatted
 
-    def limpiar_historial(self):
+    def limpiar_historial(self, session_id=None):
         """Limpia el historial manteniendo solo el mensaje del sistema"""
-        self.messages = [self.messages[0]]
+        if session_id is not None:
+            self.sessions.clear(session_id)
+        else:
+            self.messages = [self.messages[0]]
         print("✅ Historial limpiado")
 
+    def saludo_para_sesion(self, session_id=None):
+        """Devuelve ``(session_id, saludo)``; el saludo se entrega una sola vez por sesión"""
+        session_id, first = self.sessions.mark_greeted(session_id)
+        return session_id, self.greeting if first else None
+
     def ver_historial(self):
         """Muestra el historial de conversación"""
         print("\n📝 **HISTORIAL DE CONVERSACIÓN GREEN DREAM:**")
@@ -252,11 +1101,10 @@ class AsistenteGreenDreamRAG:
     def estadisticas_conocimiento(self):
         """Muestra estadísticas de la base de conocimiento"""
         total_docs = len(self.rag_system.documents)
-        cursos = len([d for d in self.rag_system.documents if d["type"] == "curso"])
-        articulos = len(
-            [d for d in self.rag_system.documents if d["type"] == "articulo"]
-        )
-        revistas = len([d for d in self.rag_system.documents if d["type"] == "revista"])
+        conteos = self.rag_system.count_by_type()
+        cursos = conteos.get("curso", 0)
+        articulos = conteos.get("articulo", 0)
+        revistas = conteos.get("revista", 0)
 
         print("📊 **ESTADÍSTICAS BASE DE CONOCIMIENTO GREEN DREAM:**")
         print("=" * 50)
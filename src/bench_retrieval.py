@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+bench_retrieval.py - Micro-benchmark de recuperación de GreenDreamRAG
+
+Genera bases de conocimiento sintéticas (cursos, artículos y revistas con los
+mismos campos que knowledge_base/) de 1k a 1M documentos y mide, para cada
+tamaño y en un proceso nuevo:
+
+- tiempo de ``load_knowledge_base`` (lectura de JSON + índice)
+- memoria máxima (RSS) del proceso al cargar
+- latencia por consulta de ``search_simple`` y de ``get_recommendations_context``
+
+Los resultados se emiten en JSON para comparar versiones:
+
+    python src/bench_retrieval.py --sizes 1000,10000,100000 --json bench_retrieval.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from kb_snapshot import SNAPSHOT_FILENAME, build_snapshot
+from load_test import percentile, synthetic_corpus
+from rag_system import GreenDreamRAG, split_words
+
+try:
+    import resource  # No disponible en Windows
+except ImportError:
+    resource = None
+
+KNOWLEDGE_BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "knowledge_base")
+
+# Archivo de cada tipo y proporción en la base sintética
+KB_FILES = {"cursos": 0.4, "articulos": 0.4, "revistas": 0.2}
+
+# Campos de texto libre que se generan (palabras aproximadas); el resto se copia de un registro real
+_TEXT_FIELDS = {"descripcion": 30, "resumen": 25, "contenido": 60}
+# Campos de lista: (máximo de elementos, máximo de palabras por elemento - 1)
+_LIST_FIELDS = {"objetivos": (3, 8), "contenido": (4, 8), "contenido_destacado": (4, 10),
+                "tags": (4, 1), "temas_principales": (3, 2)}
+
+
+class TextGenerator:
+    """Genera texto con frecuencias tipo Zipf a partir del vocabulario real.
+
+    El vocabulario crece con el tamaño del corpus (ley de Heaps) añadiendo
+    términos sintéticos de baja frecuencia, como ocurre en corpus reales.
+    """
+
+    def __init__(self, seed_words: List[str], n_docs: int, seed: int = 42):
+        self.rng = random.Random(seed)
+        extra = int(40 * n_docs ** 0.5)
+        self.vocab = list(dict.fromkeys(seed_words)) + [f"term{i:x}" for i in range(extra)]
+        weights = [1.0 / rank for rank in range(1, len(self.vocab) + 1)]
+        self.cum_weights = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            self.cum_weights.append(total)
+
+    def words(self, count: int) -> str:
+        return " ".join(self.rng.choices(self.vocab, cum_weights=self.cum_weights, k=count))
+
+    def sentence(self, count: int) -> str:
+        return self.words(count).capitalize() + "."
+
+
+def _load_templates() -> Dict[str, List[Dict]]:
+    templates = {}
+    for name in KB_FILES:
+        with open(os.path.join(KNOWLEDGE_BASE_DIR, f"{name}.json"), encoding="utf-8") as f:
+            templates[name] = json.load(f)
+    return templates
+
+
+def _seed_words(templates: Dict[str, List[Dict]]) -> List[str]:
+    """Palabras de la base real ordenadas por frecuencia (las más comunes primero)"""
+    counts: Dict[str, int] = {}
+    for records in templates.values():
+        for record in records:
+            for word in split_words(json.dumps(record, ensure_ascii=False)):
+                if len(word) > 2:
+                    counts[word] = counts.get(word, 0) + 1
+    return sorted(counts, key=counts.get, reverse=True)
+
+
+def _synthetic_record(template: Dict, prefix: str, index: int, gen: TextGenerator) -> Dict:
+    record = dict(template)
+    record["id"] = f"{prefix}_{index:07d}"
+    record["titulo"] = gen.words(gen.rng.randint(4, 9)).title()
+    for key, length in _TEXT_FIELDS.items():
+        if isinstance(template.get(key), str):
+            record[key] = " ".join(gen.sentence(gen.rng.randint(8, 16)) for _ in range(length // 10 + 1))
+    for key, (items, words) in _LIST_FIELDS.items():
+        if isinstance(template.get(key), list):
+            record[key] = [gen.words(gen.rng.randint(1, words + 1)) for _ in range(gen.rng.randint(2, items))]
+    record["url"] = f"https://greendream.org/{prefix}/{index}"
+    return record
+
+
+def generate_knowledge_base(out_dir: str, n_docs: int, seed: int = 42) -> str:
+    """Escribe cursos.json, articulos.json y revistas.json sintéticos en ``out_dir``"""
+    templates = _load_templates()
+    gen = TextGenerator(_seed_words(templates), n_docs, seed)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, share in KB_FILES.items():
+        count = max(1, int(n_docs * share))
+        prefix = name.rstrip("s")
+        # Escritura incremental para no tener todo el corpus en memoria
+        with open(os.path.join(out_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+            f.write("[\n")
+            for i in range(count):
+                record = _synthetic_record(gen.rng.choice(templates[name]), prefix, i, gen)
+                f.write(("" if i == 0 else ",\n") + json.dumps(record, ensure_ascii=False))
+            f.write("\n]\n")
+    return out_dir
+
+
+def _latencies(fn, queries: List[str], warmup: int = 10) -> Dict[str, float]:
+    for query in queries[:warmup]:
+        fn(query)
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    return {
+        "queries": len(samples),
+        "mean_ms": total / len(samples) * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "qps": len(samples) / total if total else 0.0,
+    }
+
+
+def _max_rss_mb():
+    # VmHWM es propio del proceso; ru_maxrss en Linux hereda el máximo del proceso padre
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def measure(kb_dir: str, n_queries: int = 200, seed: int = 42, snapshot: bool = False) -> Dict:
+    """Mide carga, memoria y latencias de búsqueda sobre la base de ``kb_dir``"""
+    queries = synthetic_corpus(n_queries, seed)
+    snapshot_path = os.path.join(kb_dir, SNAPSHOT_FILENAME) if snapshot else ""
+    rss_before = _max_rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        rag = GreenDreamRAG(kb_dir, snapshot_path=snapshot_path)
+    load_seconds = time.perf_counter() - start
+    rss_after = _max_rss_mb()
+    return {
+        "load_from": "snapshot" if snapshot else "json",
+        "retrieval_mode": rag.retrieval_mode,
+        "documents": len(rag.documents),
+        "terms": rag.index.num_terms,
+        "passages": len(rag.index),
+        "load_seconds": load_seconds,
+        "peak_rss_mb": rss_after,
+        "load_rss_delta_mb": rss_after - rss_before if rss_after is not None else None,
+        "search_simple": _latencies(rag.search_simple, queries),
+        "get_recommendations_context": _latencies(rag.get_recommendations_context, queries),
+    }
+
+
+def _run_isolated(kb_dir: str, n_queries: int, seed: int, snapshot: bool = False) -> Dict:
+    """Ejecuta ``measure`` en un proceso nuevo para que la memoria de un tamaño no afecte al siguiente"""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", kb_dir,
+         "--queries", str(n_queries), "--seed", str(seed)] + (["--snapshot"] if snapshot else []),
+        check=True, stdout=subprocess.PIPE,
+    )
+    return json.loads(completed.stdout.decode("utf-8").strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recuperación de Green Dream")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Tamaños de la base sintética separados por comas (hasta 1000000)")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas medidas por tamaño")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--kb-dir", help="Carpeta donde guardar/reutilizar las bases generadas")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Carga desde el snapshot binario (kb_snapshot.py) en lugar de los JSON")
+    parser.add_argument("--json", help="Guarda los resultados en JSON (use - para stdout)")
+    parser.add_argument("--measure", metavar="KB_DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.queries, args.seed, args.snapshot)))
+        return
+
+    base_dir = args.kb_dir or tempfile.mkdtemp(prefix="greendream_bench_")
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        kb_dir = os.path.join(base_dir, f"kb_{size}_{args.seed}")
+        if not os.path.exists(os.path.join(kb_dir, "revistas.json")):
+            print(f"🏗️ Generando base sintética de {size} documentos...", file=sys.stderr)
+            start = time.perf_counter()
+            generate_knowledge_base(kb_dir, size, args.seed)
+            print(f"   lista en {time.perf_counter() - start:.1f} s", file=sys.stderr)
+        if args.snapshot:
+            with contextlib.redirect_stdout(sys.stderr):
+                build_snapshot(kb_dir)
+        result = dict(size=size, **_run_isolated(kb_dir, args.queries, args.seed, args.snapshot))
+        results.append(result)
+        search, context = result["search_simple"], result["get_recommendations_context"]
+        print(
+            f"📚 {result['documents']:>8} docs | carga {result['load_seconds']:.2f} s | "
+            f"RSS {result['peak_rss_mb'] or 0:.0f} MB | search p50={search['p50_ms']:.2f} ms "
+            f"p99={search['p99_ms']:.2f} ms | contexto p50={context['p50_ms']:.2f} ms",
+            file=sys.stderr,
+        )
+
+    report = {
+        "benchmark": "retrieval",
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.json and args.json != "-":
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Resultados guardados en {args.json}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
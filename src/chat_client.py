@@ -1,11 +1,21 @@
 
 # chat_client.py - Cliente de Azure AI Foundry
+#
+# El SDK de Azure y requests se importan al crear el cliente (primer uso), no al
+# importar el módulo: así el arranque y los scripts que no llaman al modelo no los cargan.
 import os
+import threading
 from dotenv import load_dotenv
-from azure.ai.inference import ChatCompletionsClient
-from azure.core.credentials import AzureKeyCredential
 import logging
 
+from llm_client import (
+    AsyncManagedChatClient,
+    CircuitBreaker,
+    ClientStats,
+    ManagedChatClient,
+    RetryPolicy,
+)
+
 # Intentar leer variables del entorno primero; si no existen, cargar config/.env
 env_endpoint = os.getenv("AZURE_AI_ENDPOINT")
 env_key = os.getenv("AZURE_AI_KEY")
@@ -25,16 +35,131 @@ def _strip_quotes(val: str | None) -> str | None:
 API_KEY = _strip_quotes(API_KEY)
 ENDPOINT = _strip_quotes(ENDPOINT)
 
-# Por seguridad, no fallar en la importación: si faltan las variables, exponer client=None
+# Parámetros de conexión y resiliencia (configurables por variables de entorno)
+POOL_SIZE = int(os.getenv("AZURE_AI_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("AZURE_AI_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("AZURE_AI_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("AZURE_AI_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("AZURE_AI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("AZURE_AI_BACKOFF_MAX", "8"))
+BREAKER_THRESHOLD = int(os.getenv("AZURE_AI_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("AZURE_AI_BREAKER_COOLDOWN", "30"))
+
+# Circuito y contadores compartidos por el cliente síncrono y el asíncrono
+breaker = CircuitBreaker(failure_threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_COOLDOWN)
+client_stats = ClientStats()
+retry_policy = RetryPolicy(
+    breaker,
+    client_stats,
+    max_retries=MAX_RETRIES,
+    backoff_base=BACKOFF_BASE,
+    backoff_max=BACKOFF_MAX,
+)
+
+
+def _build_transport():
+    """Transporte HTTP con pool de conexiones persistentes y timeouts explícitos"""
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+    from requests.adapters import HTTPAdapter
+
+    global _session
+    _session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    _session.mount("https://", adapter)
+    _session.mount("http://", adapter)
+    return RequestsTransport(
+        session=_session,
+        session_owner=False,
+        connection_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+    )
+
+# Por seguridad, no fallar en la importación: si faltan las variables, get_client() devuelve None
 if not API_KEY or not ENDPOINT:
     logging.warning("AZURE_AI_KEY o AZURE_AI_ENDPOINT no configurados. El cliente de Azure no estará disponible hasta configurar las variables de entorno.")
-    client = None
-else:
+elif "/api/projects/" in ENDPOINT:
     # Normalizar endpoint si contiene /api/projects/
-    if "/api/projects/" in ENDPOINT:
-        ENDPOINT = ENDPOINT.split("/api/projects/")[0]
+    ENDPOINT = ENDPOINT.split("/api/projects/")[0]
 
-    client = ChatCompletionsClient(
-        endpoint=ENDPOINT,
-        credential=AzureKeyCredential(API_KEY)
-    )
+# Cliente síncrono y su sesión HTTP; se crean en la primera llamada a get_client()
+client = None
+_session = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Devuelve el cliente de Azure (None si faltan las credenciales)"""
+    global client
+    if client is None and API_KEY and ENDPOINT:
+        with _client_lock:
+            if client is None:
+                from azure.ai.inference import ChatCompletionsClient
+                from azure.core.credentials import AzureKeyCredential
+
+                # Los reintentos los gestiona ManagedChatClient (con jitter y circuit breaker)
+                client = ManagedChatClient(
+                    ChatCompletionsClient(
+                        endpoint=ENDPOINT,
+                        credential=AzureKeyCredential(API_KEY),
+                        transport=_build_transport(),
+                        retry_total=0,
+                    ),
+                    retry_policy,
+                )
+    return client
+
+
+def warm_up_connection() -> bool:
+    """Crea el cliente y abre una conexión del pool con el endpoint (TCP + TLS).
+
+    Cualquier respuesta HTTP deja la conexión lista para la primera pregunta;
+    devuelve False si no hay credenciales o el endpoint no responde.
+    """
+    if get_client() is None:
+        return False
+    try:
+        _session.head(ENDPOINT, timeout=(CONNECT_TIMEOUT, CONNECT_TIMEOUT))
+        return True
+    except Exception as e:
+        logging.warning(f"No se pudo abrir la conexión con {ENDPOINT}: {e}")
+        return False
+
+
+def reset_client():
+    """Descarta el cliente y sus conexiones (antes de hacer fork: cada proceso abre las suyas)"""
+    global client, _session
+    with _client_lock:
+        if _session is not None:
+            _session.close()
+        client = _session = None
+
+# Cliente asíncrono (azure.ai.inference.aio) para el modo ASGI; se crea bajo demanda
+async_client = None
+
+
+def get_async_client():
+    """Devuelve el cliente asíncrono de Azure (None si faltan las credenciales)"""
+    global async_client
+    if async_client is None and API_KEY and ENDPOINT:
+        import aiohttp
+        from azure.ai.inference.aio import ChatCompletionsClient as AsyncChatCompletionsClient
+        from azure.core.credentials import AzureKeyCredential
+        from azure.core.pipeline.transport import AioHttpTransport
+
+        transport = AioHttpTransport(
+            session=aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=POOL_SIZE)),
+            session_owner=False,
+            connection_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+        )
+        async_client = AsyncManagedChatClient(
+            AsyncChatCompletionsClient(
+                endpoint=ENDPOINT,
+                credential=AzureKeyCredential(API_KEY),
+                transport=transport,
+                retry_total=0,
+            ),
+            retry_policy,
+        )
+    return async_client
@@ -0,0 +1,253 @@
+# dense_index.py - Recuperación semántica local: vectores densos e índice IVF
+import math
+import os
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# numpy es opcional (sin él solo está disponible la búsqueda léxica) y se importa
+# en la primera llamada a available(): el modo léxico arranca sin cargarlo
+np = None
+_numpy_checked = False
+
+# Dimensión de los vectores y listas de la IVF que se revisan por consulta
+DENSE_DIM = int(os.getenv("RAG_DENSE_DIM", "128"))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+# Por debajo de este número de documentos la búsqueda exacta es más rápida que la IVF
+IVF_MIN_DOCS = 2048
+KMEANS_ITERATIONS = 8
+# Los términos de la consulta que no están en el vocabulario se aproximan con
+# los que comparten este prefijo ("paneles" -> "panel")
+OOV_PREFIX = 5
+# Vectores que se asignan a su lista por bloque (acota la matriz de similitudes)
+_ASSIGN_BATCH = 65536
+
+
+def available() -> bool:
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np, _numpy_checked = numpy, True
+    return np is not None
+
+
+def _sparse_dense(rows, cols, weights, dense, n_rows):
+    """``out[r] = sum(w * dense[c])`` para las entradas ``(r, c, w)`` de una matriz dispersa"""
+    # Un bincount por dimensión es mucho más rápido que reduceat/add.at sobre filas
+    columns = np.ascontiguousarray(dense.T)
+    out = np.empty((n_rows, dense.shape[1]), dtype=np.float32)
+    for j in range(dense.shape[1]):
+        out[:, j] = np.bincount(rows, weights=columns[j][cols] * weights, minlength=n_rows)
+    return out
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class DenseIndex:
+    """Vectores densos por documento con un índice IVF (k-means) para buscar vecinos.
+
+    Los vectores de término se aprenden del propio corpus sin red ni modelos
+    externos (indexación aleatoria): cada término recibe un vector aleatorio y
+    su vector final suma los de los términos con los que aparece en los mismos
+    pasajes, de modo que términos que se usan juntos ("paneles", "solar",
+    "renovables") quedan cerca. Documentos y consultas son la suma ponderada
+    (tf-idf) de los vectores de sus términos.
+
+    La IVF agrupa los documentos en ~sqrt(N) listas; una consulta solo compara
+    con los documentos de las ``IVF_NPROBE`` listas más cercanas.
+    """
+
+    def __init__(self, vocabulary: Sequence[str], term_vectors, term_idf, vectors, order, offsets, centroids=None):
+        # Términos ordenados (fila i de term_vectors = vocabulary[i]): mismo orden que el snapshot
+        self.vocabulary = vocabulary
+        self.term_vectors = term_vectors
+        self.term_idf = term_idf
+        # Vectores agrupados por lista: la lista i ocupa vectors[offsets[i]:offsets[i + 1]]
+        # y order[j] es el doc_id del vector j
+        self.vectors = vectors
+        self.order = order
+        self.offsets = offsets
+        self.centroids = centroids
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    @property
+    def dim(self) -> int:
+        return self.term_vectors.shape[1]
+
+    @classmethod
+    def build(cls, postings: Iterable[Tuple[str, Sequence[int], Sequence[int]]], idf: Callable[[str], float],
+              passage_parents, n_docs: int, dim: int = DENSE_DIM, seed: int = 42) -> "DenseIndex":
+        """Construye el índice a partir de los postings del índice BM25 (por pasaje)"""
+        entries = sorted(postings, key=lambda entry: entry[0])
+        vocabulary = [term for term, _, _ in entries]
+        term_idf = np.array([idf(term) for term in vocabulary], dtype=np.float32)
+        # Matriz dispersa término x pasaje en coordenadas, con pesos (1 + log tf) * idf
+        terms = np.repeat(np.arange(len(vocabulary)), [len(doc_ids) for _, doc_ids, _ in entries])
+        passages = np.concatenate([np.asarray(doc_ids, dtype=np.int64) for _, doc_ids, _ in entries] or [[]])
+        tfs = np.concatenate([np.asarray(tfs, dtype=np.float32) for _, _, tfs in entries] or [[]])
+        weights = (1 + np.log(tfs)) * term_idf[terms]
+        n_passages = len(passage_parents)
+
+        # Contexto de cada término: suma de los vectores aleatorios de sus pasajes
+        rng = np.random.default_rng(seed)
+        random_vectors = rng.standard_normal((len(vocabulary), dim), dtype=np.float32)
+        passage_random = _sparse_dense(passages, terms, weights, random_vectors, n_passages)
+        term_vectors = _sparse_dense(terms, passages, weights, passage_random, len(vocabulary))
+        # Sin el componente común a todos los términos las similitudes discriminan mejor
+        if len(vocabulary):
+            term_vectors -= term_vectors.mean(axis=0)
+        term_vectors = _normalize(term_vectors)
+
+        passage_vectors = _sparse_dense(passages, terms, weights, term_vectors, n_passages)
+        parents = np.asarray(passage_parents, dtype=np.int64)
+        doc_vectors = _normalize(
+            _sparse_dense(parents, np.arange(n_passages), np.ones(n_passages), passage_vectors, n_docs)
+        )
+
+        centroids = _kmeans(doc_vectors, rng) if n_docs >= IVF_MIN_DOCS else None
+        empty = cls(vocabulary, term_vectors, term_idf, doc_vectors[:0], np.zeros(0, np.uint32), None, centroids)
+        return empty._with_rows(np.arange(n_docs, dtype=np.uint32), doc_vectors)
+
+    def _assign(self, vectors):
+        """Lista (centroide más cercano) de cada vector"""
+        if self.centroids is None or not len(vectors):
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.concatenate([
+            np.argmax(vectors[i:i + _ASSIGN_BATCH] @ self.centroids.T, axis=1)
+            for i in range(0, len(vectors), _ASSIGN_BATCH)
+        ])
+
+    def _with_rows(self, doc_ids, vectors) -> "DenseIndex":
+        """Índice con los mismos vectores de término y estos documentos agrupados por lista"""
+        n_lists = 1 if self.centroids is None else len(self.centroids)
+        assignment = self._assign(vectors)
+        permutation = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[permutation], np.arange(n_lists + 1)).astype(np.uint32)
+        return DenseIndex(
+            self.vocabulary, self.term_vectors, self.term_idf,
+            np.ascontiguousarray(vectors[permutation]), doc_ids[permutation], offsets, self.centroids,
+        )
+
+    def with_changes(self, removed: Set[int], added: List[Tuple[int, List[List[str]]]]) -> "DenseIndex":
+        """Índice nuevo sin los documentos ``removed`` y con los ``added`` (``(doc_id, términos por pasaje)``).
+
+        Los documentos nuevos se codifican con los vectores de término actuales
+        y se asignan a la lista más cercana (el vocabulario y las listas se
+        recalculan en la siguiente carga completa).
+        """
+        keep = ~np.isin(self.order, np.fromiter(removed, dtype=np.uint32, count=len(removed)))
+        doc_ids = self.order[keep]
+        vectors = self.vectors[keep]
+        if added:
+            doc_ids = np.concatenate((doc_ids, np.array([doc_id for doc_id, _ in added], dtype=np.uint32)))
+            vectors = np.concatenate((vectors, self.encode_documents([passages for _, passages in added])))
+        return self._with_rows(doc_ids, vectors)
+
+    def _term_weights(self, terms: List[str]) -> Dict[int, float]:
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        weights: Dict[int, float] = {}
+        for term, tf in counts.items():
+            term_id = self._term_id(term)
+            ids = [term_id] if term_id is not None else self._oov_ids(term)
+            for term_id in ids:
+                weights[term_id] = weights.get(term_id, 0.0) + (1 + math.log(tf)) * float(self.term_idf[term_id]) / len(ids)
+        return weights
+
+    def _term_id(self, term: str) -> Optional[int]:
+        i = bisect_left(self.vocabulary, term)
+        return i if i < len(self.vocabulary) and self.vocabulary[i] == term else None
+
+    def _oov_ids(self, term: str) -> List[int]:
+        if len(term) < OOV_PREFIX:
+            return []
+        prefix = term[:OOV_PREFIX]
+        ids = []
+        i = bisect_left(self.vocabulary, prefix)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix) and len(ids) < 4:
+            ids.append(i)
+            i += 1
+        return ids
+
+    def encode(self, queries: List[List[str]]):
+        """Vectores (normalizados) de un lote de consultas ya tokenizadas"""
+        matrix = np.zeros((len(queries), self.dim), dtype=np.float32)
+        for row, terms in enumerate(queries):
+            weights = self._term_weights(terms)
+            if weights:
+                ids = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+                values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+                matrix[row] = values @ self.term_vectors[ids]
+        return _normalize(matrix)
+
+    def encode_documents(self, documents: List[List[List[str]]]):
+        """Vectores de documentos dados como términos por pasaje (igual que en ``build``)"""
+        matrix = np.zeros((len(documents), self.dim), dtype=np.float32)
+        for row, passages in enumerate(documents):
+            for terms in passages:
+                weights = self._term_weights([t for t in terms if self._term_id(t) is not None])
+                if weights:
+                    ids = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+                    values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+                    matrix[row] += values @ self.term_vectors[ids]
+        return _normalize(matrix)
+
+    def search(self, query_vectors, top_k: int = 3, allowed: Optional[Set[int]] = None,
+               nprobe: int = IVF_NPROBE) -> List[List[Tuple[float, int]]]:
+        """``[(similitud, doc_id), ...]`` de cada consulta del lote, de mayor a menor"""
+        if self.centroids is not None:
+            list_scores = query_vectors @ self.centroids.T
+            nprobe = min(nprobe, len(self.centroids))
+        if allowed is not None:
+            allowed_ids = np.fromiter(allowed, dtype=np.uint32, count=len(allowed))
+        results = []
+        for row, query in enumerate(query_vectors):
+            if not query.any():
+                results.append([])
+                continue
+            if self.centroids is None:
+                spans = [(0, len(self.order))]
+            else:
+                lists = np.argpartition(-list_scores[row], nprobe - 1)[:nprobe]
+                spans = [(int(self.offsets[i]), int(self.offsets[i + 1])) for i in lists]
+            doc_ids = np.concatenate([self.order[a:b] for a, b in spans])
+            sims = np.concatenate([self.vectors[a:b] @ query for a, b in spans])
+            if allowed is not None:
+                mask = np.isin(doc_ids, allowed_ids)
+                doc_ids, sims = doc_ids[mask], sims[mask]
+                if len(doc_ids) < top_k and self.centroids is not None:
+                    # Pocas coincidencias en las listas revisadas: se compara con todos los permitidos
+                    rows = np.flatnonzero(np.isin(self.order, allowed_ids))
+                    doc_ids, sims = self.order[rows], self.vectors[rows] @ query
+            k = min(top_k, len(sims))
+            if k == 0:
+                results.append([])
+                continue
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.argsort(-sims[top], kind="stable")]
+            results.append([(float(sims[i]), int(doc_ids[i])) for i in top])
+        return results
+
+
+def _kmeans(vectors, rng, iterations: int = KMEANS_ITERATIONS):
+    """Centroides (normalizados) de ~sqrt(N) listas, entrenados sobre una muestra"""
+    n_lists = max(1, int(math.sqrt(len(vectors))))
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), n_lists * 64), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=n_lists)
+        nonempty = counts > 0
+        centroids[nonempty] = _normalize(sums[nonempty])
+    return centroids
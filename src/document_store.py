@@ -0,0 +1,315 @@
+# document_store.py - Almacén compacto de documentos de la base de conocimiento
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+# Los textos cortos (categoría, nivel, modalidad, precio, tags...) se repiten en
+# muchos documentos: se internan para guardar una sola copia de cada valor
+INTERN_MAX_LENGTH = 64
+
+# Campos largos que se dividen en pasajes con solapamiento (por tipo de documento);
+# el resto del documento forma un pasaje "cabecera"
+CHUNKED_FIELDS = {
+    "curso": ("objetivos", "contenido"),
+    "articulo": ("contenido",),
+    "revista": ("contenido_destacado",),
+}
+PASSAGE_WORDS = 40
+PASSAGE_OVERLAP = 10
+
+# Código de campo de cada pasaje: 0 es la cabecera, el resto los campos divididos
+HEAD = ""
+PASSAGE_FIELDS = [HEAD] + sorted({f for fields in CHUNKED_FIELDS.values() for f in fields})
+_FIELD_CODES = {name: code for code, name in enumerate(PASSAGE_FIELDS)}
+
+
+def _compact(value: Any) -> Any:
+    """Versión compacta e inmutable de un valor de metadata"""
+    if isinstance(value, str):
+        return sys.intern(value) if len(value) <= INTERN_MAX_LENGTH else value
+    if isinstance(value, list):
+        return tuple(_compact(item) for item in value)
+    return value
+
+
+def passage_bounds(n_words: int, size: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP) -> List[Tuple[int, int]]:
+    """Ventanas ``(inicio, fin)`` en palabras que cubren un texto de ``n_words`` palabras"""
+    bounds = []
+    step = max(1, size - overlap)
+    for start in range(0, n_words, step):
+        end = min(start + size, n_words)
+        bounds.append((start, end))
+        if end == n_words:
+            break
+    return bounds
+
+
+def field_words(value: Any) -> List[str]:
+    """Palabras de un campo (las listas se leen como en el texto formateado: ``- elemento``)"""
+    if isinstance(value, (list, tuple)):
+        return " ".join(f"- {item}" for item in value).split()
+    return str(value).split()
+
+
+class _Schema:
+    """Claves de metadata compartidas por todos los documentos con los mismos campos"""
+
+    __slots__ = ("keys", "positions")
+
+    def __init__(self, keys: Tuple[str, ...]):
+        self.keys = keys
+        self.positions = {key: i for i, key in enumerate(keys)}
+
+
+class MetadataView(Mapping):
+    """Metadata de un documento como mapeo de solo lectura (sin copiar el dict original)"""
+
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema: _Schema, values: tuple):
+        self._schema = schema
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._schema.positions[key]]
+
+    def __contains__(self, key):
+        return key in self._schema.positions
+
+    def __iter__(self):
+        return iter(self._schema.keys)
+
+    def __len__(self):
+        return len(self._schema.keys)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(self._schema.keys, self._values))
+
+    def __repr__(self):
+        return f"MetadataView({self.to_dict()!r})"
+
+
+class DocumentView:
+    """Documento (o resultado de búsqueda) que lee directamente del almacén"""
+
+    __slots__ = ("_store", "doc_id", "relevance_score", "passage_id")
+
+    def __init__(
+        self,
+        store: "DocumentStore",
+        doc_id: int,
+        relevance_score: float = 0.0,
+        passage_id: Optional[int] = None,
+    ):
+        self._store = store
+        self.doc_id = doc_id
+        self.relevance_score = relevance_score
+        # Pasaje que obtuvo la mejor puntuación (None fuera de una búsqueda)
+        self.passage_id = passage_id
+
+    @property
+    def type(self) -> str:
+        return self._store.type_of(self.doc_id)
+
+    @property
+    def source(self) -> str:
+        return self._store.source(self.doc_id)
+
+    @property
+    def metadata(self) -> MetadataView:
+        return self._store.metadata(self.doc_id)
+
+    @property
+    def content(self) -> str:
+        """Texto formateado del documento (se genera al pedirlo, no se guarda)"""
+        return self._store.content(self.doc_id)
+
+    @property
+    def passage(self) -> Optional[Tuple[str, str]]:
+        """``(campo, texto)`` del pasaje más relevante; el campo es ``HEAD`` para la cabecera"""
+        if self.passage_id is None:
+            return None
+        return self._store.passage(self.passage_id)
+
+    def __repr__(self):
+        return f"DocumentView(doc_id={self.doc_id}, source={self.source!r}, relevance_score={self.relevance_score})"
+
+
+class DocumentStore:
+    """Documentos en columnas: tipo, origen y metadata compacta por posición.
+
+    En lugar de un dict por documento con el contenido formateado y una copia
+    de la metadata, guarda una tupla de valores por documento (las claves se
+    comparten por esquema) y genera el contenido solo cuando se pide. Los
+    conteos por tipo se mantienen al añadir documentos.
+
+    Cada documento se divide además en pasajes (cabecera y ventanas de los
+    campos largos) que son la unidad del índice de búsqueda. De cada pasaje
+    solo se guardan el documento, el campo y el rango de palabras.
+
+    Los documentos borrados (recarga incremental) conservan su posición para no
+    renumerar el resto; se excluyen al iterar, indexar y contar.
+    """
+
+    def __init__(self, formatters: Optional[Dict[str, Callable[[Mapping], str]]] = None):
+        self.formatters = formatters or {}
+        self._type_names: List[str] = []
+        self._type_codes: Dict[str, int] = {}
+        self._schemas: List[_Schema] = []
+        self._schema_ids: Dict[Tuple[str, ...], int] = {}
+        self.types = array("B")
+        self.schema_ids = array("H")
+        self.sources: List[str] = []
+        self.values: List[tuple] = []
+        self.type_counts: Dict[str, int] = {}
+        self.deleted: Set[int] = set()
+        # Pasajes: documento, campo y palabras [inicio, fin); los de un documento son
+        # consecutivos, desde passage_offsets[doc_id] hasta passage_offsets[doc_id + 1]
+        self.passage_parents = array("I")
+        self.passage_fields = array("B")
+        self.passage_starts = array("I")
+        self.passage_ends = array("I")
+        self.passage_offsets = array("I", [0])
+
+    def __len__(self) -> int:
+        return len(self.types) - len(self.deleted)
+
+    def __iter__(self) -> Iterator[DocumentView]:
+        return (DocumentView(self, doc_id) for doc_id in self.doc_ids())
+
+    def __getitem__(self, item):
+        doc_ids = self.doc_ids()
+        if isinstance(item, slice):
+            return [DocumentView(self, doc_id) for doc_id in doc_ids[item]]
+        return DocumentView(self, doc_ids[item])
+
+    def doc_ids(self) -> Sequence[int]:
+        """Posiciones de los documentos vigentes, en orden"""
+        if not self.deleted:
+            return range(len(self.types))
+        return [doc_id for doc_id in range(len(self.types)) if doc_id not in self.deleted]
+
+    def add(self, doc_type: str, metadata: Dict[str, Any], source: str) -> int:
+        """Añade un documento y devuelve su posición (doc_id)"""
+        code = self._type_codes.get(doc_type)
+        if code is None:
+            code = self._type_codes[doc_type] = len(self._type_names)
+            self._type_names.append(sys.intern(doc_type))
+
+        keys = tuple(sys.intern(key) for key in metadata)
+        schema_id = self._schema_ids.get(keys)
+        if schema_id is None:
+            schema_id = self._schema_ids[keys] = len(self._schemas)
+            self._schemas.append(_Schema(keys))
+
+        self.types.append(code)
+        self.schema_ids.append(schema_id)
+        self.sources.append(source)
+        self.values.append(tuple(_compact(value) for value in metadata.values()))
+        self.type_counts[doc_type] = self.type_counts.get(doc_type, 0) + 1
+        doc_id = len(self.values) - 1
+        self._add_passages(doc_id, doc_type, metadata)
+        return doc_id
+
+    def _add_passages(self, doc_id: int, doc_type: str, metadata: Dict[str, Any]):
+        spans = [(HEAD, 0, 0)]
+        for name in CHUNKED_FIELDS.get(doc_type, ()):
+            if name in metadata:
+                spans.extend((name, start, end) for start, end in passage_bounds(len(field_words(metadata[name]))))
+        for name, start, end in spans:
+            self.passage_parents.append(doc_id)
+            self.passage_fields.append(_FIELD_CODES[name])
+            self.passage_starts.append(start)
+            self.passage_ends.append(end)
+        self.passage_offsets.append(len(self.passage_parents))
+
+    def delete(self, doc_id: int):
+        """Marca un documento como borrado (su posición no se reutiliza)"""
+        if doc_id not in self.deleted:
+            self.deleted.add(doc_id)
+            doc_type = self.type_of(doc_id)
+            self.type_counts[doc_type] -= 1
+
+    def copy(self) -> "DocumentStore":
+        """Copia independiente para aplicar cambios sin modificar esta versión.
+
+        Los valores de cada documento son inmutables y se comparten entre ambas.
+        """
+        other = DocumentStore(self.formatters)
+        other._type_names = list(self._type_names)
+        other._type_codes = dict(self._type_codes)
+        other._schemas = list(self._schemas)
+        other._schema_ids = dict(self._schema_ids)
+        other.types = array("B", self.types)
+        other.schema_ids = array("H", self.schema_ids)
+        other.sources = list(self.sources)
+        other.values = list(self.values)
+        other.type_counts = dict(self.type_counts)
+        other.deleted = set(self.deleted)
+        other.passage_parents = array("I", self.passage_parents)
+        other.passage_fields = array("B", self.passage_fields)
+        other.passage_starts = array("I", self.passage_starts)
+        other.passage_ends = array("I", self.passage_ends)
+        other.passage_offsets = array("I", self.passage_offsets)
+        return other
+
+    def same_metadata(self, doc_id: int, metadata: Dict[str, Any]) -> bool:
+        """True si ``metadata`` coincide con la guardada para el documento"""
+        keys = self._schemas[self.schema_ids[doc_id]].keys
+        return keys == tuple(metadata) and self.values[doc_id] == tuple(
+            _compact(value) for value in metadata.values()
+        )
+
+    @property
+    def type_names(self) -> List[str]:
+        return list(self._type_names)
+
+    def type_of(self, doc_id: int) -> str:
+        return self._type_names[self.types[doc_id]]
+
+    def source(self, doc_id: int) -> str:
+        return self.sources[doc_id]
+
+    def metadata(self, doc_id: int) -> MetadataView:
+        return MetadataView(self._schemas[self.schema_ids[doc_id]], self.values[doc_id])
+
+    def content(self, doc_id: int) -> str:
+        formatter = self.formatters.get(self.type_of(doc_id))
+        return formatter(self.metadata(doc_id)) if formatter else ""
+
+    def passages(self, doc_id: int) -> List[Tuple[int, str, str]]:
+        """``(passage_id, campo, texto)`` de cada pasaje del documento.
+
+        El texto de la cabecera es el documento formateado sin los campos
+        divididos; el de los demás pasajes, sus palabras del campo.
+        """
+        metadata = self.metadata(doc_id)
+        words: Dict[str, List[str]] = {}
+        return [
+            (passage_id,) + self._passage_text(doc_id, metadata, passage_id, words)
+            for passage_id in range(self.passage_offsets[doc_id], self.passage_offsets[doc_id + 1])
+        ]
+
+    def passage(self, passage_id: int) -> Tuple[str, str]:
+        """``(campo, texto)`` de un pasaje"""
+        doc_id = self.passage_parents[passage_id]
+        return self._passage_text(doc_id, self.metadata(doc_id), passage_id, {})
+
+    def _passage_text(self, doc_id: int, metadata: Mapping, passage_id: int, words: Dict[str, List[str]]):
+        name = PASSAGE_FIELDS[self.passage_fields[passage_id]]
+        if name == HEAD:
+            doc_type = self.type_of(doc_id)
+            head = dict(metadata)
+            for chunked in CHUNKED_FIELDS.get(doc_type, ()):
+                if chunked in head:
+                    head[chunked] = type(head[chunked])()
+            formatter = self.formatters.get(doc_type)
+            return name, formatter(head) if formatter else ""
+        if name not in words:
+            words[name] = field_words(metadata[name])
+        return name, " ".join(words[name][self.passage_starts[passage_id]:self.passage_ends[passage_id]])
+
+    def count_by_type(self) -> Dict[str, int]:
+        """Número de documentos de cada tipo (precalculado)"""
+        return dict(self.type_counts)
@@ -0,0 +1,278 @@
+# facets.py - Índices de facetas sobre la metadata estructurada y filtros de consulta
+import math
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from response_cache import normalize_question
+
+# Facetas categóricas indexadas (valores normalizados: minúsculas y sin tildes)
+FACETS = ("tipo", "categoria", "nivel", "modalidad", "precio", "tag")
+
+# Valor de la faceta "precio" para los recursos sin coste
+FREE = "gratuito"
+
+# Sinónimos de nivel (incluye la "dificultad" de los artículos)
+_LEVEL_ALIASES = {"facil": "principiante", "basico": "principiante", "inicial": "principiante", "dificil": "avanzado"}
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+_AGE_RANGE_RE = re.compile(r"(\d{1,2})\s*-\s*(\d{1,2})")
+
+# Expresiones de la consulta (sobre el texto normalizado) -> (faceta, valor)
+_QUERY_TERMS = [
+    (re.compile(r"\bcursos?\b"), "tipo", "curso"),
+    (re.compile(r"\barticulos?\b"), "tipo", "articulo"),
+    (re.compile(r"\brevistas?\b"), "tipo", "revista"),
+    (re.compile(r"\b(?:online|en linea|virtual(?:es)?|a distancia)\b"), "modalidad", "online"),
+    (re.compile(r"\bpresencial(?:es)?\b"), "modalidad", "presencial"),
+    (re.compile(r"\b(?:hibrid[oa]s?|semipresencial(?:es)?)\b"), "modalidad", "hibrido"),
+    (re.compile(r"\b(?:principiantes?|basic[oa]s?|inicial(?:es)?|desde cero|faciles?)\b"), "nivel", "principiante"),
+    (re.compile(r"\bintermedi[oa]s?\b"), "nivel", "intermedio"),
+    (re.compile(r"\bavanzad[oa]s?\b"), "nivel", "avanzado"),
+    (re.compile(r"\b(?:gratis|gratuit[oa]s?|sin (?:costo|coste|pagar))\b"), "precio", FREE),
+]
+# Importe con moneda antes o después ("$" se convierte en "dolares" al normalizar)
+_CURRENCY = r"(?:(?:usd|dolares)\s*(\d+(?:[.,]\d+)?)|(\d+(?:[.,]\d+)?)\s*(?:usd|dolares))"
+_MAX_PRICE_RE = re.compile(r"\b(?:menos de|hasta|maximo|por debajo de|no mas de)\s+" + _CURRENCY)
+_MIN_PRICE_RE = re.compile(r"\b(?:mas de|desde|minimo|por encima de)\s+" + _CURRENCY)
+_AGE_RE = re.compile(r"\b(\d{1,2})\s*anos\b")
+_CATEGORY_RE = re.compile(r"\bcategoria\s+(?:de\s+)?(.+)")
+_TAG_RE = re.compile(r"\b(?:etiquetas?|tags?)\s+(\w+)")
+
+
+def normalize(value: Any) -> str:
+    return normalize_question(str(value))
+
+
+def parse_price(text: Any) -> Optional[float]:
+    """Precio numérico de un texto como "50 USD" o "Gratuito" (None si no se entiende)"""
+    normalized = normalize(text)
+    if normalized.startswith(("gratis", "gratuit")):
+        return 0.0
+    match = _NUMBER_RE.search(str(text))
+    return float(match.group().replace(",", ".")) if match else None
+
+
+def parse_age_range(text: Any) -> Optional[Tuple[int, int]]:
+    """Rango de edad de un texto como "16-25 años" o "Jóvenes 15-30 años" """
+    match = _AGE_RANGE_RE.search(str(text))
+    if not match:
+        return None
+    low, high = int(match.group(1)), int(match.group(2))
+    return (low, high) if low <= high else None
+
+
+def facet_values(doc_type: str, metadata: Mapping) -> Iterable[Tuple[str, str]]:
+    """``(faceta, valor)`` de un documento"""
+    yield "tipo", doc_type
+    if metadata.get("categoria"):
+        yield "categoria", normalize(metadata["categoria"])
+    # "Intermedio-Avanzado" se normaliza a "intermedio avanzado": un valor por palabra
+    for level in normalize(metadata.get("nivel") or metadata.get("dificultad") or "").split():
+        if level != "y":
+            yield "nivel", _LEVEL_ALIASES.get(level, level)
+    if metadata.get("modalidad"):
+        yield "modalidad", normalize(metadata["modalidad"])
+    if "precio" in metadata and parse_price(metadata["precio"]) == 0:
+        yield "precio", FREE
+    for key in ("tags", "temas_principales"):
+        for tag in metadata.get(key) or ():
+            yield "tag", normalize(tag)
+
+
+@dataclass
+class FacetFilter:
+    """Restricciones de una consulta: valores aceptados por faceta (se cumplen todas) y rangos"""
+
+    values: Dict[str, Set[str]] = field(default_factory=dict)
+    max_price: Optional[float] = None
+    min_price: Optional[float] = None
+    age: Optional[int] = None
+
+    def __bool__(self):
+        return bool(self.values) or any(
+            value is not None for value in (self.max_price, self.min_price, self.age)
+        )
+
+    def add(self, facet: str, value: str):
+        self.values.setdefault(facet, set()).add(value)
+
+    def describe(self) -> str:
+        parts = [f"{facet}: {' o '.join(sorted(values))}" for facet, values in self.values.items()]
+        if self.min_price is not None:
+            parts.append(f"precio >= {self.min_price:g}")
+        if self.max_price is not None:
+            parts.append(f"precio <= {self.max_price:g}")
+        if self.age is not None:
+            parts.append(f"edad: {self.age} años")
+        return " · ".join(parts)
+
+
+class FacetIndex:
+    """Índices de facetas: doc_ids ordenados por valor, y precio y rango de edad por documento.
+
+    Los filtros se resuelven con operaciones de conjuntos sobre esas listas (y
+    búsqueda binaria para los rangos de precio y edad) antes de puntuar el texto.
+    Como el índice BM25, no se modifica en uso: ``with_changes`` devuelve uno nuevo.
+    """
+
+    # Edad sin rango conocido
+    NO_AGE = 0
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, array]] = {facet: {} for facet in FACETS}
+        self.prices = array("d")
+        self.age_min = array("H")
+        self.age_max = array("H")
+        # Documentos con precio / rango de edad, ordenados (se calculan al primer uso)
+        self._price_order: Optional[array] = None
+        self._age_order: Optional[array] = None
+
+    def add(self, doc_id: int, doc_type: str, metadata: Mapping):
+        for facet, value in facet_values(doc_type, metadata):
+            entry = self.postings[facet].setdefault(value, array("I"))
+            if not entry or entry[-1] != doc_id:
+                entry.append(doc_id)
+
+        missing = doc_id + 1 - len(self.prices)
+        if missing > 0:
+            self.prices.extend([math.nan] * missing)
+            self.age_min.extend([self.NO_AGE] * missing)
+            self.age_max.extend([self.NO_AGE] * missing)
+        price = parse_price(metadata["precio"]) if "precio" in metadata else None
+        self.prices[doc_id] = math.nan if price is None else price
+        ages = parse_age_range(metadata.get("edad_objetivo") or metadata.get("publico_objetivo") or "")
+        if ages:
+            self.age_min[doc_id], self.age_max[doc_id] = ages
+        self._price_order = self._age_order = None
+
+    def with_changes(
+        self,
+        removed: List[Tuple[int, str, Mapping]],
+        added: List[Tuple[int, str, Mapping]],
+    ) -> "FacetIndex":
+        """Índice nuevo sin los documentos ``removed`` y con los ``added`` (``(doc_id, tipo, metadata)``)"""
+        facets = FacetIndex()
+        facets.postings = {facet: dict(values) for facet, values in self.postings.items()}
+        facets.prices = array("d", self.prices)
+        facets.age_min = array("H", self.age_min)
+        facets.age_max = array("H", self.age_max)
+
+        removed_ids = {doc_id for doc_id, _, _ in removed}
+        touched = {pair for _, doc_type, metadata in removed for pair in facet_values(doc_type, metadata)}
+        for facet, value in touched:
+            doc_ids = array("I", (d for d in self.postings[facet].get(value, ()) if d not in removed_ids))
+            if doc_ids:
+                facets.postings[facet][value] = doc_ids
+            else:
+                facets.postings[facet].pop(value, None)
+        for doc_id in removed_ids:
+            facets.prices[doc_id] = math.nan
+            facets.age_min[doc_id] = facets.age_max[doc_id] = self.NO_AGE
+
+        # Los valores que reciben documentos nuevos se copian antes de ampliarlos
+        for _, doc_type, metadata in added:
+            for facet, value in facet_values(doc_type, metadata):
+                entry = facets.postings[facet].get(value)
+                if entry is not None and entry is self.postings[facet].get(value):
+                    facets.postings[facet][value] = array("I", entry)
+        for doc_id, doc_type, metadata in added:
+            facets.add(doc_id, doc_type, metadata)
+        return facets
+
+    def values(self, facet: str) -> List[str]:
+        return list(self.postings.get(facet, ()))
+
+    def _postings_for(self, facet: str, value: str):
+        return self.postings.get(facet, {}).get(value, ())
+
+    @property
+    def price_order(self):
+        if self._price_order is None:
+            prices = self.prices
+            self._price_order = array(
+                "I", sorted((d for d in range(len(prices)) if not math.isnan(prices[d])), key=prices.__getitem__)
+            )
+        return self._price_order
+
+    @property
+    def age_order(self):
+        if self._age_order is None:
+            age_min = self.age_min
+            self._age_order = array(
+                "I", sorted((d for d in range(len(age_min)) if self.age_max[d] != self.NO_AGE), key=age_min.__getitem__)
+            )
+        return self._age_order
+
+    def filter(self, flt: FacetFilter) -> Optional[Set[int]]:
+        """doc_ids que cumplen todas las restricciones (None si el filtro está vacío)"""
+        if not flt:
+            return None
+        # Se empieza por la faceta más selectiva para que las intersecciones sean pequeñas
+        groups = sorted(
+            (sum(len(self._postings_for(facet, value)) for value in values), facet, values)
+            for facet, values in flt.values.items()
+        )
+        result: Optional[Set[int]] = None
+        for _, facet, values in groups:
+            if result is None:
+                result = set()
+                for value in values:
+                    result.update(self._postings_for(facet, value))
+            else:
+                matching = set()
+                for value in values:
+                    matching.update(result.intersection(self._postings_for(facet, value)))
+                result = matching
+            if not result:
+                return result
+
+        if flt.min_price is not None or flt.max_price is not None:
+            order, price = self.price_order, self.prices.__getitem__
+            low = bisect_left(order, flt.min_price, key=price) if flt.min_price is not None else 0
+            high = bisect_right(order, flt.max_price, key=price) if flt.max_price is not None else len(order)
+            in_range = order[low:high]
+            result = set(in_range) if result is None else result.intersection(in_range)
+
+        if flt.age is not None:
+            order, age_max = self.age_order, self.age_max
+            candidates = order[:bisect_right(order, flt.age, key=self.age_min.__getitem__)]
+            in_range = {d for d in candidates if age_max[d] >= flt.age}
+            result = in_range if result is None else result & in_range
+        return result
+
+
+def parse_filters(query: str, facets: Optional[FacetIndex] = None) -> FacetFilter:
+    """Restricciones expresadas en la pregunta ("cursos online gratuitos para principiantes").
+
+    Reconoce tipo de recurso, modalidad, nivel, gratuidad, precio máximo o
+    mínimo ("menos de 40 USD"), edad ("tengo 17 años") y, con ``facets``,
+    categorías ("categoría energía") y etiquetas ("#compostaje").
+    """
+    text = normalize(query.replace("$", " dolares ").replace("#", " etiqueta "))
+    flt = FacetFilter()
+    for pattern, facet, value in _QUERY_TERMS:
+        if pattern.search(text):
+            flt.add(facet, value)
+
+    match = _MAX_PRICE_RE.search(text)
+    if match:
+        flt.max_price = float((match.group(1) or match.group(2)).replace(",", "."))
+    match = _MIN_PRICE_RE.search(text)
+    if match:
+        flt.min_price = float((match.group(1) or match.group(2)).replace(",", "."))
+    match = _AGE_RE.search(text)
+    if match:
+        flt.age = int(match.group(1))
+
+    if facets is not None:
+        match = _CATEGORY_RE.search(text)
+        if match:
+            for category in facets.values("categoria"):
+                if match.group(1).startswith(category) or category.startswith(match.group(1).split()[0]):
+                    flt.add("categoria", category)
+        for tag in _TAG_RE.findall(text):
+            if tag in facets.postings.get("tag", {}):
+                flt.add("tag", tag)
+    return flt
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+kb_snapshot.py - Snapshot binario de la base de conocimiento y su índice BM25
+
+Compila los JSON de knowledge_base/ (documentos + índice) en un único archivo
+que los workers abren con ``mmap`` de solo lectura: arrancan sin parsear JSON
+ni reconstruir el índice, y todos comparten las mismas páginas de memoria.
+Si el snapshot no existe o no corresponde a los JSON actuales se usa la carga
+desde JSON.
+
+    python src/kb_snapshot.py                      # genera knowledge_base/kb.snapshot
+    python src/kb_snapshot.py --kb-dir otra/base --output /tmp/kb.snapshot
+
+Formato (todo en el orden de bytes nativo, registrado en la cabecera):
+``MAGIC | versión (uint32) | longitud de la cabecera (uint32) | cabecera JSON``
+seguido de secciones alineadas a 8 bytes descritas en la cabecera.
+"""
+import argparse
+import functools
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from types import MappingProxyType
+from typing import Mapping, Optional, Sequence, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import dense_index
+from document_store import DocumentStore
+from facets import FacetIndex
+from rag_system import INDEX_VERSION, KNOWLEDGE_BASE_FILES, BM25Index, GreenDreamRAG
+
+MAGIC = b"GDKBSNAP"
+FORMAT_VERSION = 1
+SNAPSHOT_FILENAME = "kb.snapshot"
+_PREAMBLE = struct.Struct("=8sII")
+_ALIGN = 8
+# Documentos cuya metadata decodificada se mantiene en memoria (por proceso)
+METADATA_CACHE_SIZE = 1024
+
+
+def source_hash(kb_dir: str) -> str:
+    """Huella de los archivos JSON de la base (detecta snapshots desactualizados)"""
+    digest = hashlib.sha256()
+    for filename, _, _ in KNOWLEDGE_BASE_FILES:
+        path = os.path.join(kb_dir, filename)
+        digest.update(filename.encode("utf-8"))
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def _blob(items) -> Tuple[array, bytes]:
+    """Concatena cadenas UTF-8 y devuelve ``(offsets, datos)``"""
+    offsets = array("Q", [0])
+    parts = []
+    total = 0
+    for item in items:
+        data = item.encode("utf-8")
+        parts.append(data)
+        total += len(data)
+        offsets.append(total)
+    return offsets, b"".join(parts)
+
+
+def build_snapshot(kb_dir: Optional[str] = None, output: Optional[str] = None) -> str:
+    """Carga la base desde JSON y escribe el snapshot (de forma atómica)"""
+    rag = GreenDreamRAG(kb_dir, snapshot_path="")
+    kb_dir = rag.knowledge_base_path
+    output = output or os.path.join(kb_dir, SNAPSHOT_FILENAME)
+    store, index, facets = rag.documents, rag.index, rag.facets
+    n_docs = len(store)
+
+    terms = sorted(index.postings, key=lambda term: term.encode("utf-8"))
+    posting_offsets = array("Q", [0])
+    doc_ids, tfs = array("I"), array("I")
+    for term in terms:
+        term_doc_ids, term_tfs = index.postings[term]
+        doc_ids.extend(term_doc_ids)
+        tfs.extend(term_tfs)
+        posting_offsets.append(len(doc_ids))
+
+    term_offsets, term_blob = _blob(terms)
+    meta_offsets, meta_blob = _blob(
+        json.dumps(store.metadata(doc_id).to_dict(), ensure_ascii=False, separators=(",", ":"))
+        for doc_id in range(n_docs)
+    )
+    source_offsets, source_blob = _blob(store.source(doc_id) for doc_id in range(n_docs))
+
+    # Facetas: directorio {faceta: {valor: [inicio, fin]}} sobre un array de doc_ids
+    facet_directory, facet_postings = {}, array("I")
+    for facet, values in facets.postings.items():
+        facet_directory[facet] = {}
+        for value, value_doc_ids in values.items():
+            facet_directory[facet][value] = [len(facet_postings), len(facet_postings) + len(value_doc_ids)]
+            facet_postings.extend(value_doc_ids)
+    facet_directory = json.dumps(facet_directory, ensure_ascii=False).encode("utf-8")
+
+    sections = [
+        ("types", array("B", store.types).tobytes(), "B"),
+        ("doc_lengths", index.doc_lengths.tobytes(), "I"),
+        ("norms", index._doc_norms().tobytes(), "d"),
+        ("meta_offsets", meta_offsets.tobytes(), "Q"),
+        ("meta_blob", meta_blob, "B"),
+        ("source_offsets", source_offsets.tobytes(), "Q"),
+        ("source_blob", source_blob, "B"),
+        ("passage_parents", store.passage_parents.tobytes(), "I"),
+        ("passage_fields", store.passage_fields.tobytes(), "B"),
+        ("passage_starts", store.passage_starts.tobytes(), "I"),
+        ("passage_ends", store.passage_ends.tobytes(), "I"),
+        ("passage_offsets", store.passage_offsets.tobytes(), "I"),
+        ("facet_directory", facet_directory, "B"),
+        ("facet_postings", facet_postings.tobytes(), "I"),
+        ("prices", facets.prices.tobytes(), "d"),
+        ("age_min", facets.age_min.tobytes(), "H"),
+        ("age_max", facets.age_max.tobytes(), "H"),
+        ("price_order", facets.price_order.tobytes(), "I"),
+        ("age_order", facets.age_order.tobytes(), "I"),
+        ("term_offsets", term_offsets.tobytes(), "Q"),
+        ("term_blob", term_blob, "B"),
+        ("posting_offsets", posting_offsets.tobytes(), "Q"),
+        ("posting_doc_ids", doc_ids.tobytes(), "I"),
+        ("posting_tfs", tfs.tobytes(), "I"),
+    ]
+
+    # Vectores densos (si numpy está disponible): filas de término en el mismo orden que term_blob
+    dense = rag.dense
+    if dense is None and dense_index.available():
+        dense = dense_index.DenseIndex.build(index.iter_postings(), index.idf, store.passage_parents, n_docs)
+    if dense is not None:
+        sections += [
+            ("dense_term_vectors", dense.term_vectors.tobytes(), "f"),
+            ("dense_term_idf", dense.term_idf.tobytes(), "f"),
+            ("dense_vectors", dense.vectors.tobytes(), "f"),
+            ("dense_order", dense.order.astype("uint32").tobytes(), "I"),
+            ("dense_offsets", dense.offsets.astype("uint32").tobytes(), "I"),
+        ]
+        if dense.centroids is not None:
+            sections.append(("dense_centroids", dense.centroids.tobytes(), "f"))
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "index_version": INDEX_VERSION,
+        "byteorder": sys.byteorder,
+        "source_hash": source_hash(kb_dir),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "documents": n_docs,
+        "terms": len(terms),
+        "passages": len(store.passage_parents),
+        "type_names": store.type_names,
+        "type_counts": store.count_by_type(),
+        "k1": index.k1,
+        "b": index.b,
+        "total_length": index.total_length,
+        "dense_dim": dense.dim if dense is not None else None,
+        "sections": {},
+    }
+    # La cabecera incluye los offsets de las secciones: se calcula con un tamaño fijo reservado
+    header_size = 4096 + 64 * len(sections)
+    offset = _align(_PREAMBLE.size + header_size)
+    for name, data, fmt in sections:
+        header["sections"][name] = [offset, len(data), fmt]
+        offset = _align(offset + len(data))
+    header_bytes = json.dumps(header).encode("utf-8")
+    if len(header_bytes) > header_size:
+        raise ValueError("Cabecera del snapshot demasiado grande")
+
+    tmp_path = f"{output}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, data, _ in sections:
+            f.seek(header["sections"][name][0])
+            f.write(data)
+        f.truncate(offset)
+    # Reemplazo atómico: los procesos con el snapshot anterior abierto siguen leyéndolo
+    os.replace(tmp_path, output)
+    return output
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class SnapshotDocumentStore(DocumentStore):
+    """``DocumentStore`` de solo lectura sobre un snapshot mapeado en memoria.
+
+    La metadata se decodifica solo para los documentos que se consultan (con una
+    pequeña caché para los más frecuentes).
+    """
+
+    def __init__(self, snapshot: "Snapshot", formatters=None):
+        super().__init__(formatters)
+        self._snapshot = snapshot
+        self._type_names = list(snapshot.header["type_names"])
+        self._type_codes = {name: i for i, name in enumerate(self._type_names)}
+        self.types = snapshot.section("types")
+        self.type_counts = dict(snapshot.header["type_counts"])
+        self._meta_offsets = snapshot.section("meta_offsets")
+        self._meta_blob = snapshot.section("meta_blob")
+        self._source_offsets = snapshot.section("source_offsets")
+        self._source_blob = snapshot.section("source_blob")
+        self.passage_parents = snapshot.section("passage_parents")
+        self.passage_fields = snapshot.section("passage_fields")
+        self.passage_starts = snapshot.section("passage_starts")
+        self.passage_ends = snapshot.section("passage_ends")
+        self.passage_offsets = snapshot.section("passage_offsets")
+        self._decode_metadata = functools.lru_cache(maxsize=METADATA_CACHE_SIZE)(self._decode_metadata)
+
+    def add(self, doc_type, metadata, source):
+        raise TypeError("El snapshot de la base de conocimiento es de solo lectura")
+
+    def copy(self):
+        raise TypeError("El snapshot de la base de conocimiento es de solo lectura")
+
+    def source(self, doc_id: int) -> str:
+        offsets = self._source_offsets
+        return str(self._source_blob[offsets[doc_id]:offsets[doc_id + 1]], "utf-8")
+
+    def metadata(self, doc_id: int) -> Mapping:
+        return self._decode_metadata(doc_id)
+
+    def _decode_metadata(self, doc_id: int) -> Mapping:
+        offsets = self._meta_offsets
+        raw = str(self._meta_blob[offsets[doc_id]:offsets[doc_id + 1]], "utf-8")
+        return MappingProxyType(json.loads(raw))
+
+
+class SnapshotIndex(BM25Index):
+    """Índice BM25 de solo lectura cuyos arrays apuntan al snapshot (sin copias)"""
+
+    def __init__(self, snapshot: "Snapshot"):
+        header = snapshot.header
+        super().__init__(k1=header["k1"], b=header["b"])
+        self._snapshot = snapshot
+        self.postings = {}
+        self.doc_lengths = snapshot.section("doc_lengths")
+        self.total_length = header["total_length"]
+        self.num_docs = len(self.doc_lengths)
+        self._norms = snapshot.section("norms")
+        self._term_offsets = snapshot.section("term_offsets")
+        self._term_blob = snapshot.section("term_blob")
+        self._posting_offsets = snapshot.section("posting_offsets")
+        self._doc_ids = snapshot.section("posting_doc_ids")
+        self._tfs = snapshot.section("posting_tfs")
+
+    @property
+    def num_terms(self) -> int:
+        return len(self._term_offsets) - 1
+
+    def add_document(self, doc_id, terms):
+        raise TypeError("El índice del snapshot es de solo lectura")
+
+    def _doc_norms(self):
+        return self._norms
+
+    @property
+    def terms(self) -> Sequence[str]:
+        """Términos del snapshot en orden (se decodifican al leerlos)"""
+        return _TermList(self._term_offsets, self._term_blob)
+
+    def iter_postings(self):
+        offsets = self._posting_offsets
+        for term_id, term in enumerate(self.terms):
+            start, end = offsets[term_id], offsets[term_id + 1]
+            yield term, self._doc_ids[start:end], self._tfs[start:end]
+
+    def _term_id(self, term: str) -> Optional[int]:
+        """Búsqueda binaria del término en la lista ordenada del snapshot"""
+        key = term.encode("utf-8")
+        offsets, blob = self._term_offsets, self._term_blob
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = blob[offsets[mid]:offsets[mid + 1]].tobytes()
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _postings_for(self, term: str):
+        term_id = self._term_id(term)
+        if term_id is None:
+            return None
+        start, end = self._posting_offsets[term_id], self._posting_offsets[term_id + 1]
+        return self._doc_ids[start:end], self._tfs[start:end]
+
+
+class _TermList(Sequence):
+    """Lista ordenada de términos sobre ``term_offsets``/``term_blob`` del snapshot"""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+
+def _open_dense(snapshot: "Snapshot", index: SnapshotIndex):
+    """Índice denso sobre las secciones del snapshot (None si no las tiene o falta numpy)"""
+    dim = snapshot.header.get("dense_dim")
+    if not dim or not dense_index.available():
+        return None
+    np = dense_index.np
+
+    def matrix(name):
+        return np.frombuffer(snapshot.section(name), dtype=np.float32).reshape(-1, dim)
+
+    sections = snapshot.header["sections"]
+    return dense_index.DenseIndex(
+        index.terms,
+        matrix("dense_term_vectors"),
+        np.frombuffer(snapshot.section("dense_term_idf"), dtype=np.float32),
+        matrix("dense_vectors"),
+        np.frombuffer(snapshot.section("dense_order"), dtype=np.uint32),
+        np.frombuffer(snapshot.section("dense_offsets"), dtype=np.uint32),
+        matrix("dense_centroids") if "dense_centroids" in sections else None,
+    )
+
+
+class SnapshotFacetIndex(FacetIndex):
+    """Índice de facetas de solo lectura sobre el snapshot"""
+
+    def __init__(self, snapshot: "Snapshot"):
+        super().__init__()
+        directory = json.loads(str(snapshot.section("facet_directory"), "utf-8"))
+        postings = snapshot.section("facet_postings")
+        self.postings = {
+            facet: {value: postings[start:end] for value, (start, end) in values.items()}
+            for facet, values in directory.items()
+        }
+        self.prices = snapshot.section("prices")
+        self.age_min = snapshot.section("age_min")
+        self.age_max = snapshot.section("age_max")
+        self._price_order = snapshot.section("price_order")
+        self._age_order = snapshot.section("age_order")
+
+    def add(self, doc_id, doc_type, metadata):
+        raise TypeError("Las facetas del snapshot son de solo lectura")
+
+
+class Snapshot:
+    """Archivo de snapshot abierto con mmap de solo lectura"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, header_len = _PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("No es un snapshot de la base de conocimiento")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Versión de snapshot {version} no soportada (se espera {FORMAT_VERSION})")
+        start = _PREAMBLE.size
+        self.header = json.loads(self._mmap[start:start + header_len].decode("utf-8"))
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError("Snapshot generado con otro orden de bytes")
+        if self.header["index_version"] != INDEX_VERSION:
+            raise ValueError("Snapshot generado con otra versión del índice")
+
+    def section(self, name: str) -> memoryview:
+        offset, length, fmt = self.header["sections"][name]
+        return self._view[offset:offset + length].cast(fmt)
+
+
+def open_snapshot(path: str, kb_dir: str, formatters=None, dense: bool = True):
+    """Devuelve ``(documentos, índice, facetas, vectores densos, cabecera)`` o None si no hay un snapshot válido para ``kb_dir``.
+
+    Con ``dense=False`` no se abren los vectores densos (ni se importa numpy).
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path)
+        if any(os.path.exists(os.path.join(kb_dir, f)) for f, _, _ in KNOWLEDGE_BASE_FILES):
+            if snapshot.header["source_hash"] != source_hash(kb_dir):
+                print(f"⚠️ Snapshot {path} desactualizado respecto a los JSON: se cargan los JSON")
+                return None
+        index = SnapshotIndex(snapshot)
+        return (
+            SnapshotDocumentStore(snapshot, formatters),
+            index,
+            SnapshotFacetIndex(snapshot),
+            _open_dense(snapshot, index) if dense else None,
+            snapshot.header,
+        )
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"⚠️ Snapshot {path} no válido ({e}): se cargan los JSON")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el snapshot binario de la base de conocimiento")
+    parser.add_argument("--kb-dir", help="Carpeta con cursos.json, articulos.json y revistas.json")
+    parser.add_argument("--output", help=f"Archivo de salida (por defecto <kb-dir>/{SNAPSHOT_FILENAME})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    path = build_snapshot(args.kb_dir, args.output)
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(f"📦 Snapshot generado: {path} ({size_mb:.1f} MB) en {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+# llm_client.py - Capa de resiliencia para las llamadas al modelo (reintentos y circuit breaker)
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from azure.core.exceptions import (
+    HttpResponseError,
+    ServiceRequestError,
+    ServiceResponseError,
+)
+
+
+# Códigos HTTP que justifican reintentar (limitación de tasa y errores del servidor)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito está abierto: el modelo se considera no disponible temporalmente"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            f"Servicio de IA no disponible temporalmente (reintentar en {retry_after:.0f}s)"
+        )
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuit breaker de tres estados (cerrado, abierto, semiabierto).
+
+    Tras ``failure_threshold`` fallos consecutivos se abre durante
+    ``reset_timeout`` segundos y rechaza las llamadas sin contactar al modelo;
+    después deja pasar una sola llamada de prueba que decide si se cierra de
+    nuevo o vuelve a abrirse.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._cooldown_left() <= 0:
+                return self.HALF_OPEN
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def _cooldown_left(self) -> float:
+        return self.reset_timeout - (time.monotonic() - self._opened_at)
+
+    def before_call(self):
+        """Lanza ``CircuitOpenError`` si la llamada no debe intentarse"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN:
+                left = self._cooldown_left()
+                if left > 0:
+                    raise CircuitOpenError(left)
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                raise CircuitOpenError(self.reset_timeout)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class ClientStats:
+    """Contadores por resultado de las llamadas al modelo"""
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """Tipo de fallo reintentable (None si el error no se debe reintentar)"""
+    if isinstance(error, HttpResponseError) and error.status_code is not None:
+        if error.status_code == 429:
+            return "throttled"
+        if error.status_code in RETRYABLE_STATUS:
+            return "server_error"
+        return None
+    if isinstance(error, ServiceResponseError):
+        return "timeout"
+    if isinstance(error, ServiceRequestError):
+        return "connection_error"
+    return None
+
+
+def _retry_after_seconds(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Parámetros y cálculo de espera compartidos por los clientes síncrono y asíncrono"""
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        stats: ClientStats,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+    ):
+        self.breaker = breaker
+        self.stats = stats
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Backoff exponencial con jitter completo (respeta Retry-After si viene)"""
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def on_error(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Registra un fallo; devuelve la espera antes de reintentar o None si hay que propagarlo"""
+        outcome = classify_error(error)
+        if outcome is None:
+            # Error del cliente (4xx): el servicio responde, no cuenta para el circuito
+            self.stats.incr("client_error")
+            self.breaker.record_success()
+            return None
+
+        self.stats.incr(outcome)
+        if attempt >= self.max_retries or self.breaker.is_open:
+            self.stats.incr("failure")
+            self.breaker.record_failure()
+            return None
+        self.stats.incr("retry")
+        return self.backoff(attempt, error)
+
+    def on_success(self):
+        self.stats.incr("success")
+        self.breaker.record_success()
+
+    def on_stream_failure(self, error: Optional[BaseException] = None):
+        """Registra un stream que falló (``error``) o se abandonó después de establecerse"""
+        if error is None:
+            self.stats.incr("abandoned")
+        else:
+            self.stats.incr(classify_error(error) or "stream_error")
+        self.stats.incr("failure")
+        self.breaker.record_failure()
+
+    def before_call(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats.incr("circuit_rejected")
+            raise
+
+
+class _StreamOutcome:
+    """Resultado de un stream para el circuit breaker: se registra una sola vez.
+
+    Establecer el stream no basta para contar como éxito: cuenta al leerlo
+    hasta el final, o al cerrarlo antes si el modelo llegó a enviar algo. Un
+    error al iterar cuenta como fallo, igual que ``give_up()`` (quien esperaba
+    el primer fragmento se rindió por el límite de latencia).
+    """
+
+    def __init__(self, policy: RetryPolicy):
+        self._policy = policy
+        self._received = False
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def give_up(self):
+        self._settle(False)
+
+    def _settle(self, success: bool, error: Optional[BaseException] = None):
+        with self._lock:
+            if self._settled:
+                return
+            self._settled = True
+        if success:
+            self._policy.on_success()
+        else:
+            self._policy.on_stream_failure(error)
+
+
+class BreakerStream(_StreamOutcome):
+    """Stream síncrono del modelo que registra su resultado en el circuit breaker"""
+
+    def __init__(self, stream: Any, policy: RetryPolicy):
+        super().__init__(policy)
+        self._stream = stream
+        self._iterator = iter(stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            event = next(self._iterator)
+        except StopIteration:
+            self._settle(True)
+            raise
+        except Exception as e:
+            self._settle(False, e)
+            raise
+        self._received = True
+        return event
+
+    def close(self):
+        self._settle(self._received)
+        close = getattr(self._stream, "close", None)
+        if close:
+            close()
+
+
+class AsyncBreakerStream(_StreamOutcome):
+    """Versión asíncrona de ``BreakerStream``"""
+
+    def __init__(self, stream: Any, policy: RetryPolicy):
+        super().__init__(policy)
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            event = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._settle(True)
+            raise
+        except Exception as e:
+            self._settle(False, e)
+            raise
+        self._received = True
+        return event
+
+    async def aclose(self):
+        self._settle(self._received)
+        await self._stream.aclose()
+
+
+class ManagedChatClient:
+    """Envuelve un ``ChatCompletionsClient`` con reintentos, backoff y circuit breaker.
+
+    Expone el mismo ``complete(**kwargs)``; con ``stream=True`` los reintentos
+    solo cubren el establecimiento del stream (antes del primer fragmento) y
+    devuelve un ``BreakerStream``, que registra el resultado al leerlo.
+    """
+
+    def __init__(self, client: Any, policy: RetryPolicy):
+        self._client = client
+        self.policy = policy
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self.policy.breaker
+
+    def complete(self, **kwargs):
+        self.policy.before_call()
+        attempt = 0
+        while True:
+            try:
+                response = self._client.complete(**kwargs)
+            except Exception as e:
+                delay = self.policy.on_error(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if kwargs.get("stream"):
+                return BreakerStream(response, self.policy)
+            self.policy.on_success()
+            return response
+
+    def close(self):
+        self._client.close()
+
+
+class AsyncManagedChatClient:
+    """Versión asíncrona de ``ManagedChatClient`` (``azure.ai.inference.aio``)"""
+
+    def __init__(self, client: Any, policy: RetryPolicy):
+        self._client = client
+        self.policy = policy
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self.policy.breaker
+
+    async def complete(self, **kwargs):
+        self.policy.before_call()
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.complete(**kwargs)
+            except Exception as e:
+                delay = self.policy.on_error(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if kwargs.get("stream"):
+                return AsyncBreakerStream(response, self.policy)
+            self.policy.on_success()
+            return response
+
+    async def close(self):
+        await self._client.close()
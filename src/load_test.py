@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+load_test.py - Generador de carga para la API de Green Dream
+
+Reproduce un corpus de preguntas contra ``api_complete.app`` (en el mismo
+proceso) o contra una API ya desplegada (``--url``), con concurrencia fija o
+a un ritmo fijo de peticiones por segundo, y resume rendimiento, latencias
+p50/p95/p99 y tiempo hasta el primer fragmento (TTFT). Con ``--mock`` arranca
+el modelo simulado de ``mock_llm_server.py``, así que no necesita red:
+
+    python src/load_test.py --mock --concurrency 16 --requests 200
+    python src/load_test.py --mock --rps 20 --duration 30 --endpoint chat --json resultados.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_llm_server import add_config_arguments, config_from_args, start_mock_server
+
+# Campos en los que se busca la pregunta en corpus JSONL
+_QUERY_FIELDS = ("message", "query", "pregunta", "question", "title")
+
+_TEMPLATES = [
+    "¿Qué cursos recomiendas sobre {}?",
+    "Quiero aprender {} desde cero",
+    "¿Hay algún curso gratuito de {}?",
+    "Artículos sobre {} para jóvenes",
+    "¿Tenéis revistas que hablen de {}?",
+    "Busco formación online en {} de nivel intermedio",
+    "¿Cómo puedo colaborar en proyectos de {}?",
+    "Recursos de {} para un principiante",
+]
+_TOPICS = [
+    "energía renovable", "energía solar", "economía circular", "reciclaje doméstico",
+    "agricultura urbana", "huertos escolares", "cambio climático", "movilidad sostenible",
+    "consumo responsable", "biodiversidad", "gestión del agua", "compostaje",
+]
+
+
+def synthetic_corpus(size: int = 200, seed: int = 42) -> List[str]:
+    """Preguntas sintéticas combinando plantillas y temas"""
+    rng = random.Random(seed)
+    return [rng.choice(_TEMPLATES).format(rng.choice(_TOPICS)) for _ in range(size)]
+
+
+def load_corpus(path: str) -> List[str]:
+    """Preguntas de un archivo JSONL (campo message/query/pregunta/title) o de texto (una por línea)"""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                query = next((record[k] for k in _QUERY_FIELDS if record.get(k)), None)
+                if query:
+                    queries.append(str(query))
+            else:
+                queries.append(line)
+    if not queries:
+        raise ValueError(f"El corpus {path} no contiene preguntas")
+    return queries
+
+
+@dataclass
+class Sample:
+    """Resultado de una petición"""
+
+    ok: bool
+    latency: float
+    ttft: Optional[float] = None
+    degraded: bool = False
+    status: int = 0
+    error: Optional[str] = None
+    # Motivo del 429 de la admisión (rate_limited, queue_full, queue_timeout)
+    reason: Optional[str] = None
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentil por rango más cercano (None si no hay valores)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+        "mean": sum(values) / len(values) if values else None,
+    }
+
+
+@dataclass
+class LoadReport:
+    mode: str
+    endpoint: str
+    requests: int
+    errors: int
+    rejected: int
+    degraded: int
+    duration_seconds: float
+    throughput_rps: float
+    latency_seconds: Dict[str, Optional[float]] = field(default_factory=dict)
+    ttft_seconds: Dict[str, Optional[float]] = field(default_factory=dict)
+    status_codes: Dict[str, int] = field(default_factory=dict)
+    rejected_reasons: Dict[str, int] = field(default_factory=dict)
+    config: Dict[str, object] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, samples: List[Sample], duration: float, mode: str, endpoint: str, config=None):
+        status_codes: Dict[str, int] = {}
+        rejected_reasons: Dict[str, int] = {}
+        for sample in samples:
+            status_codes[str(sample.status)] = status_codes.get(str(sample.status), 0) + 1
+            if sample.status == 429:
+                reason = sample.reason or "unknown"
+                rejected_reasons[reason] = rejected_reasons.get(reason, 0) + 1
+        ok = [s for s in samples if s.ok]
+        rejected = sum(rejected_reasons.values())
+        return cls(
+            mode=mode,
+            endpoint=endpoint,
+            requests=len(samples),
+            # Los 429 de la admisión no son fallos de la API: se cuentan aparte
+            errors=len(samples) - len(ok) - rejected,
+            rejected=rejected,
+            degraded=sum(1 for s in ok if s.degraded),
+            duration_seconds=duration,
+            throughput_rps=len(ok) / duration if duration > 0 else 0.0,
+            latency_seconds=_summary([s.latency for s in ok]),
+            ttft_seconds=_summary([s.ttft for s in ok if s.ttft is not None]),
+            status_codes=status_codes,
+            rejected_reasons=rejected_reasons,
+            config=config or {},
+        )
+
+    def print(self):
+        def ms(value):
+            return f"{value * 1000:.0f} ms" if value is not None else "-"
+
+        print("\n📊 **RESULTADOS DE LA PRUEBA DE CARGA**")
+        print("=" * 50)
+        print(f"🎯 Modo: {self.mode} | Endpoint: {self.endpoint}")
+        print(
+            f"📨 Peticiones: {self.requests} | ❌ Errores: {self.errors} | "
+            f"🚦 Rechazadas (429): {self.rejected} | ⚠️ Degradadas: {self.degraded}"
+        )
+        print(f"⏱️ Duración: {self.duration_seconds:.2f} s | 🚀 Rendimiento: {self.throughput_rps:.2f} req/s")
+        lat, ttft = self.latency_seconds, self.ttft_seconds
+        print(f"🐢 Latencia: p50={ms(lat['p50'])} p95={ms(lat['p95'])} p99={ms(lat['p99'])} max={ms(lat['max'])}")
+        print(f"⚡ TTFT:     p50={ms(ttft['p50'])} p95={ms(ttft['p95'])} p99={ms(ttft['p99'])} max={ms(ttft['max'])}")
+        print(f"📟 Códigos HTTP: {self.status_codes}")
+        if self.rejected_reasons:
+            print(f"🚦 Motivos de rechazo: {self.rejected_reasons}")
+        print("=" * 50)
+
+
+class InProcessTarget:
+    """Envía las peticiones a ``api_complete.app`` con el cliente de pruebas de Flask"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def chat(self, message: str, start: float) -> Sample:
+        response = self._client().post("/api/chat", json={"message": message})
+        data = response.get_json(silent=True) or {}
+        return Sample(
+            ok=response.status_code == 200 and bool(data.get("success")),
+            latency=time.perf_counter() - start,
+            degraded=bool(data.get("degraded")),
+            status=response.status_code,
+            error=data.get("error"),
+            reason=data.get("reason"),
+        )
+
+    def stream(self, message: str, start: float) -> Sample:
+        response = self._client().post("/api/chat/stream", json={"message": message}, buffered=False)
+        try:
+            if response.status_code != 200:
+                return _error_sample(response.status_code, response.get_json(silent=True) or {}, start)
+            return _read_sse(response.iter_encoded(), start, response.status_code)
+        finally:
+            response.close()
+
+
+class HttpTarget:
+    """Envía las peticiones a una API desplegada (``--url``)"""
+
+    def __init__(self, base_url: str):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self._requests = requests
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = self._requests.Session()
+        return self._local.session
+
+    def chat(self, message: str, start: float) -> Sample:
+        response = self._session().post(f"{self.base_url}/api/chat", json={"message": message}, timeout=120)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        return Sample(
+            ok=response.status_code == 200 and bool(data.get("success")),
+            latency=time.perf_counter() - start,
+            degraded=bool(data.get("degraded")),
+            status=response.status_code,
+            error=data.get("error"),
+            reason=data.get("reason"),
+        )
+
+    def stream(self, message: str, start: float) -> Sample:
+        with self._session().post(
+            f"{self.base_url}/api/chat/stream", json={"message": message}, stream=True, timeout=120
+        ) as response:
+            if response.status_code != 200:
+                try:
+                    data = response.json()
+                except ValueError:
+                    data = {}
+                return _error_sample(response.status_code, data, start)
+            return _read_sse(response.iter_content(chunk_size=None), start, response.status_code)
+
+
+def _error_sample(status: int, data: dict, start: float) -> Sample:
+    """Respuesta sin stream (p. ej. un 429 de la admisión): error y motivo del cuerpo JSON"""
+    return Sample(
+        ok=False,
+        latency=time.perf_counter() - start,
+        status=status,
+        error=data.get("error"),
+        reason=data.get("reason"),
+    )
+
+
+def _read_sse(chunks, start: float, status: int) -> Sample:
+    """Lee un stream SSE de /api/chat/stream midiendo el primer fragmento y el final"""
+    sample = Sample(ok=False, latency=0.0, status=status)
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buffer:
+            raw, buffer = buffer.split("\n\n", 1)
+            event, data = "message", {}
+            for line in raw.splitlines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    data = json.loads(line[6:])
+            if event == "message" and "delta" in data and sample.ttft is None:
+                sample.ttft = time.perf_counter() - start
+            elif event == "degraded":
+                sample.degraded = True
+            elif event == "done":
+                sample.ok = status == 200
+            elif event == "error":
+                sample.error = data.get("error")
+    sample.latency = time.perf_counter() - start
+    return sample
+
+
+def run_load(target, queries: List[str], endpoint: str = "stream", concurrency: int = 8,
+             total_requests: Optional[int] = None, duration: Optional[float] = None,
+             rps: Optional[float] = None) -> List[Sample]:
+    """Lanza la carga y devuelve una muestra por petición.
+
+    Sin ``rps`` cada uno de los ``concurrency`` trabajadores envía peticiones una
+    tras otra (bucle cerrado). Con ``rps`` las peticiones se programan a ritmo
+    fijo (bucle abierto) y la latencia se mide desde el instante programado, de
+    modo que la espera en cola también cuenta.
+    """
+    send = target.stream if endpoint == "stream" else target.chat
+    samples: List[Sample] = []
+    lock = threading.Lock()
+    counter = iter(range(sys.maxsize))
+    begin = time.perf_counter()
+
+    def should_continue(index):
+        if total_requests is not None and index >= total_requests:
+            return False
+        return duration is None or time.perf_counter() - begin < duration
+
+    def execute(index, scheduled):
+        try:
+            sample = send(queries[index % len(queries)], scheduled)
+        except Exception as e:
+            sample = Sample(ok=False, latency=time.perf_counter() - scheduled, error=str(e))
+        with lock:
+            samples.append(sample)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if rps:
+            index = 0
+            while should_continue(index):
+                scheduled = begin + index / rps
+                wait = scheduled - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                pool.submit(execute, index, scheduled)
+                index += 1
+        else:
+            def worker():
+                while True:
+                    with lock:
+                        index = next(counter)
+                    if not should_continue(index):
+                        return
+                    execute(index, time.perf_counter())
+
+            for _ in range(concurrency):
+                pool.submit(worker)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de Green Dream")
+    parser.add_argument(
+        "--url",
+        help="API desplegada (por defecto se usa api_complete.app en este proceso). Toda la carga sale de un "
+             "mismo cliente: sin ADMISSION_RATE_PER_MINUTE=0 en el servidor, los excesos vuelven como 429",
+    )
+    parser.add_argument("--endpoint", choices=("stream", "chat"), default="stream",
+                        help="stream mide TTFT con /api/chat/stream; chat usa /api/chat")
+    parser.add_argument("--corpus", help="Archivo .jsonl o de texto con las preguntas (por defecto, sintéticas)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Trabajadores simultáneos")
+    parser.add_argument("--rps", type=float, help="Peticiones por segundo (bucle abierto)")
+    parser.add_argument("--requests", type=int, help="Número total de peticiones")
+    parser.add_argument("--duration", type=float, help="Duración máxima en segundos")
+    parser.add_argument("--no-cache", action="store_true", help="Desactiva la caché de respuestas (RESPONSE_CACHE_MAX=0)")
+    parser.add_argument("--json", help="Guarda el resumen en JSON (use - para stdout)")
+    parser.add_argument("--mock", action="store_true", help="Arranca el modelo simulado y apunta la API a él")
+    add_config_arguments(parser.add_argument_group("modelo simulado (--mock)"))
+    args = parser.parse_args()
+
+    if args.requests is None and args.duration is None:
+        args.requests = 100
+    queries = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+
+    if args.mock:
+        _, mock_url = start_mock_server(config_from_args(args))
+        os.environ["AZURE_AI_ENDPOINT"] = mock_url
+        os.environ["AZURE_AI_KEY"] = "mock"
+        print(f"🤖 Modelo simulado en: {mock_url}")
+    if args.no_cache:
+        os.environ["RESPONSE_CACHE_MAX"] = "0"
+    if not args.url:
+        # Toda la carga sale de un mismo cliente: sin límite por cliente (sí de concurrencia y cola).
+        # Solo afecta a la API de este proceso; una desplegada aplica su propia configuración
+        os.environ.setdefault("ADMISSION_RATE_PER_MINUTE", "0")
+
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        # Importar después de configurar el entorno: la admisión, la caché y la
+        # configuración del cliente de Azure se leen al importar (el cliente se crea al usarlo)
+        from api_complete import app
+
+        target = InProcessTarget(app)
+
+    mode = f"rps={args.rps:g}" if args.rps else f"concurrency={args.concurrency}"
+    print(f"🚀 Lanzando carga ({mode}, {len(queries)} preguntas distintas)...")
+    begin = time.perf_counter()
+    samples = run_load(
+        target, queries, endpoint=args.endpoint, concurrency=args.concurrency,
+        total_requests=args.requests, duration=args.duration, rps=args.rps,
+    )
+    report = LoadReport.build(
+        samples, time.perf_counter() - begin, mode, args.endpoint,
+        config={k: v for k, v in vars(args).items() if v is not None},
+    )
+    report.print()
+    if args.url and report.rejected_reasons.get("rate_limited"):
+        print(
+            "💡 La API rechazó peticiones por el límite por cliente: toda la carga sale de esta "
+            "máquina. Para medir capacidad, despliegue con ADMISSION_RATE_PER_MINUTE=0 (o "
+            "reparta la carga entre varios clientes); los rechazos no cuentan como errores."
+        )
+
+    if args.json:
+        output = json.dumps(asdict(report), indent=2, ensure_ascii=False)
+        if args.json == "-":
+            print(output)
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+            print(f"💾 Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
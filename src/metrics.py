@@ -0,0 +1,211 @@
+# metrics.py - Métricas en formato Prometheus (contadores, histogramas y gauges)
+#
+# Implementación mínima sin dependencias externas. Las métricas son por proceso:
+# con varios workers de gunicorn cada uno expone las suyas.
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+# Buckets por defecto para latencias (segundos)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+
+class Counter(_Metric):
+    """Contador monótono, opcionalmente con etiquetas"""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con buckets fijos"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [contadores por bucket..., suma, total]
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide la duración del bloque ``with`` y la registra"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> float:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[-1] if series else 0.0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Métrica cuyo valor se lee al exportar (p. ej. sesiones activas o aciertos de caché)"""
+
+    def __init__(self, name, documentation, type_name: str, fn: Callable[[], Union[float, Dict]], labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.type_name = type_name
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        try:
+            value = self.fn()
+        except Exception:
+            return lines
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas exportadas en /api/metrics"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_callback(self, name, documentation, type_name, fn, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, type_name, fn, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Latencia por etapa: retrieval, prompt_assembly, llm_ttft, llm_total, serialization
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "greendream_stage_seconds", "Duración de cada etapa de una petición", ("stage",)
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "greendream_request_seconds", "Duración de las peticiones HTTP (hasta la respuesta o inicio del stream)", ("endpoint",)
+))
+REQUESTS = REGISTRY.register(Counter(
+    "greendream_requests_total", "Peticiones HTTP atendidas", ("endpoint", "status")
+))
+ERRORS = REGISTRY.register(Counter(
+    "greendream_errors_total", "Peticiones que terminaron con error", ("endpoint",)
+))
+PROMPT_TOKENS = REGISTRY.register(Counter(
+    "greendream_prompt_tokens_total", "Tokens de entrada enviados al modelo (estimados)"
+))
+COMPLETION_TOKENS = REGISTRY.register(Counter(
+    "greendream_completion_tokens_total", "Tokens generados por el modelo (estimados)"
+))
+DEGRADED_RESPONSES = REGISTRY.register(Counter(
+    "greendream_degraded_responses_total", "Respuestas en modo degradado (solo búsqueda)", ("reason",)
+))
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "greendream_admission_rejections_total", "Peticiones de chat rechazadas con 429", ("reason",)
+))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "greendream_admission_wait_seconds", "Espera en la cola hasta que se admite una petición de chat"
+))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+mock_llm_server.py - Servidor de inferencia simulado para pruebas de carga sin red
+
+Responde en ``POST /chat/completions`` con el mismo formato que espera
+``ChatCompletionsClient`` (con y sin streaming) y en ``GET /info``. La latencia
+hasta el primer token, la velocidad de generación y la tasa de errores son
+configurables. Para usarlo con la API:
+
+    python src/mock_llm_server.py --port 8000 --first-token-latency 0.4 --tokens-per-second 40
+    AZURE_AI_ENDPOINT=http://127.0.0.1:8000 AZURE_AI_KEY=mock python src/api_complete.py
+"""
+import argparse
+import http.server
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+# Texto base de las respuestas simuladas (se repite hasta completar los tokens pedidos)
+MOCK_RESPONSE = (
+    "¡Claro! En Green Dream tenemos recursos que encajan con lo que buscas. "
+    "Te recomiendo empezar por el curso introductorio de sostenibilidad, que es "
+    "gratuito y en línea, y después profundizar con nuestros artículos sobre "
+    "economía circular y energías renovables. Si quieres, también puedes sumarte "
+    "como voluntario en los proyectos locales."
+)
+
+
+@dataclass
+class MockLLMConfig:
+    """Comportamiento del modelo simulado"""
+
+    first_token_latency: float = 0.3  # segundos hasta el primer token
+    latency_jitter: float = 0.1  # variación aleatoria (+/-) de la latencia inicial
+    tokens_per_second: float = 50.0  # 0 = sin espera entre tokens
+    completion_tokens: int = 120  # tokens por respuesta (limitado por max_tokens)
+    error_rate: float = 0.0  # probabilidad de responder con error
+    error_status: int = 503
+    model: str = "mock-gpt-4o"
+
+
+def _tokens(count):
+    """Palabras de la respuesta simulada (una por "token")"""
+    words = MOCK_RESPONSE.split()
+    return [words[i % len(words)] + " " for i in range(count)]
+
+
+class MockLLMHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # conexiones persistentes, como el servicio real
+    config = MockLLMConfig()
+    served = 0
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass  # Sin log por petición: el servidor se usa bajo carga
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") == "/info":
+            self._send_json(200, {
+                "model_name": self.config.model,
+                "model_type": "chat-completion",
+                "model_provider_name": "GreenDreamMock",
+            })
+        else:
+            self._send_json(404, {"error": {"code": "NotFound", "message": self.path}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self.path.split("?")[0].rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"code": "NotFound", "message": self.path}})
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"code": "BadRequest", "message": "JSON inválido"}})
+            return
+
+        with self._lock:
+            type(self).served += 1
+
+        config = self.config
+        delay = max(0.0, config.first_token_latency + random.uniform(-1, 1) * config.latency_jitter)
+        time.sleep(delay)
+
+        if config.error_rate and random.random() < config.error_rate:
+            headers = {"Retry-After": "1"} if config.error_status == 429 else {}
+            self._send_json(
+                config.error_status,
+                {"error": {"code": "MockError", "message": "Error inyectado por el servidor simulado"}},
+                headers,
+            )
+            return
+
+        count = min(config.completion_tokens, int(payload.get("max_tokens") or config.completion_tokens))
+        tokens = _tokens(max(1, count))
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in payload.get("messages", [])) // 4
+        if payload.get("stream"):
+            self._stream(tokens, prompt_tokens)
+        else:
+            self._pace(len(tokens) - 1)
+            self._send_json(200, self._completion(
+                {"message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"},
+                {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)},
+            ))
+
+    def _pace(self, tokens):
+        if self.config.tokens_per_second > 0 and tokens > 0:
+            time.sleep(tokens / self.config.tokens_per_second)
+
+    def _completion(self, choice, usage=None):
+        data = {
+            "id": f"mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": self.config.model,
+            "choices": [dict(index=0, **choice)],
+        }
+        if usage:
+            data["usage"] = usage
+        return data
+
+    def _stream(self, tokens, prompt_tokens):
+        """Envía la respuesta como Server-Sent Events (un evento por token)"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    self._pace(1)
+                delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+                self._write_event(self._completion({"delta": delta, "finish_reason": None}))
+            self._write_event(self._completion(
+                {"delta": {}, "finish_reason": "stop"},
+                {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)},
+            ))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # El cliente abandonó el stream
+
+    def _write_event(self, data):
+        self._write_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    """Arranca el servidor simulado en un hilo; devuelve ``(servidor, url_base)``"""
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {"config": config or MockLLMConfig()})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_config_arguments(parser):
+    """Opciones de línea de comandos que configuran ``MockLLMConfig``"""
+    defaults = MockLLMConfig()
+    parser.add_argument("--first-token-latency", type=float, default=defaults.first_token_latency,
+                        help="Segundos hasta el primer token")
+    parser.add_argument("--latency-jitter", type=float, default=defaults.latency_jitter,
+                        help="Variación aleatoria (+/-) de la latencia inicial")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second,
+                        help="Velocidad de generación (0 = sin espera)")
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens,
+                        help="Tokens por respuesta")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate,
+                        help="Probabilidad de responder con error (0-1)")
+    parser.add_argument("--error-status", type=int, default=defaults.error_status,
+                        help="Código HTTP de los errores inyectados (p. ej. 429, 500, 503)")
+
+
+def config_from_args(args):
+    return MockLLMConfig(
+        first_token_latency=args.first_token_latency,
+        latency_jitter=args.latency_jitter,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de inferencia simulado para Green Dream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_mock_server(config_from_args(args), args.host, args.port)
+    print(f"🤖 Modelo simulado escuchando en: {url}")
+    print(f"   Usa AZURE_AI_ENDPOINT={url} y cualquier AZURE_AI_KEY")
+    print("🔥 Presiona Ctrl+C para detener el servidor")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\nDeteniendo servidor...")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# prompt_budget.py - Ensamblado de prompts con presupuesto de tokens
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+
+# Presupuesto por defecto para la entrada (sistema + historial + contexto + pregunta)
+DEFAULT_MAX_PROMPT_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "3000"))
+# Fracción mínima del presupuesto libre reservada al contexto RAG
+DEFAULT_CONTEXT_RATIO = float(os.getenv("PROMPT_CONTEXT_RATIO", "0.6"))
+
+# Tokens aproximados que añade el formato de cada mensaje (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Aproximación habitual para modelos GPT: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+TRUNCATION_MARK = " [...]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación local y barata del número de tokens de un texto"""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Recorta un texto para que quepa en ``max_tokens`` (intenta cortar en un salto de línea)"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARK))
+    if keep == "tail":
+        return TRUNCATION_MARK.strip() + " " + (text[-max_chars:] if max_chars else "")
+
+    cut = text[:max_chars]
+    newline = cut.rfind("\n")
+    if newline > max_chars // 2:
+        cut = cut[:newline]
+    return cut + TRUNCATION_MARK
+
+
+@dataclass
+class PackedPrompt:
+    """Resultado del empaquetado: historial conservado, contexto recortado y uso de tokens"""
+
+    history: List[Tuple[str, str]]
+    context: str
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+class PromptPacker:
+    """Ajusta historial y contexto RAG a un presupuesto de tokens.
+
+    El prompt del sistema y la pregunta se conservan siempre. El contexto RAG
+    recibe al menos ``context_ratio`` del presupuesto restante (más si el
+    historial no lo necesita) y el historial se rellena desde el turno más
+    reciente hacia atrás; el turno más antiguo que no cabe se compacta y los
+    anteriores se descartan.
+    """
+
+    def __init__(
+        self,
+        max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+        context_ratio: float = DEFAULT_CONTEXT_RATIO,
+        min_compacted_tokens: int = 32,
+    ):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.context_ratio = context_ratio
+        self.min_compacted_tokens = min_compacted_tokens
+
+    def pack(
+        self,
+        system_prompt: str,
+        history: List[Tuple[str, str]],
+        context: str,
+        question: str,
+    ) -> PackedPrompt:
+        """
+        Args:
+            system_prompt (str): Prompt del sistema (siempre se incluye)
+            history (list): Mensajes previos como ``(rol, contenido)``, del más antiguo al más reciente
+            context (str): Bloque de contexto RAG (se recorta si hace falta)
+            question (str): Resto del mensaje del usuario sin el contexto (siempre se incluye)
+        """
+        system_tokens = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        question_tokens = estimate_tokens(question) + MESSAGE_OVERHEAD_TOKENS
+        available = max(0, self.max_prompt_tokens - system_tokens - question_tokens)
+
+        history_needed = sum(
+            estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS for _, content in history
+        )
+        context_cap = max(int(available * self.context_ratio), available - history_needed)
+        context = truncate_to_tokens(context, context_cap)
+        context_tokens = estimate_tokens(context)
+
+        # Historial: del más reciente al más antiguo mientras haya presupuesto
+        remaining = available - context_tokens
+        kept: List[Tuple[str, str]] = []
+        history_tokens = 0
+        for role, content in reversed(history):
+            cost = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            if cost <= remaining:
+                kept.append((role, content))
+            elif remaining - MESSAGE_OVERHEAD_TOKENS >= self.min_compacted_tokens:
+                compacted = truncate_to_tokens(
+                    content, remaining - MESSAGE_OVERHEAD_TOKENS, keep="tail"
+                )
+                kept.append((role, compacted))
+                history_tokens += estimate_tokens(compacted) + MESSAGE_OVERHEAD_TOKENS
+                break
+            else:
+                break
+            remaining -= cost
+            history_tokens += cost
+        kept.reverse()
+
+        usage = {
+            "system": system_tokens,
+            "history": history_tokens,
+            "context": context_tokens,
+            "question": question_tokens,
+            "total": system_tokens + history_tokens + context_tokens + question_tokens,
+            "budget": self.max_prompt_tokens,
+            "history_messages": len(kept),
+            "dropped_messages": len(history) - len(kept),
+        }
+        return PackedPrompt(history=kept, context=context, usage=usage)
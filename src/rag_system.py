@@ -1,246 +1,1052 @@
-# rag_system.py - Sistema RAG para Green Dream
-import json
-import os
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
-import re
-
-
-@dataclass
-class DocumentChunk:
-    """Representa un fragmento de documento con su metadata"""
-
-    content: str
-    metadata: Dict[str, Any]
-    source: str
-    relevance_score: float = 0.0
-
-
-class GreenDreamRAG:
-    """Sistema RAG especializado para Green Dream ONG"""
-
-    def __init__(self, knowledge_base_path: str = "green_dream_knowledge"):
-        knowledge_base_path = os.path.join(
-            os.path.dirname(__file__), "..", "knowledge_base"
-        )
-        self.knowledge_base_path = knowledge_base_path
-        self.documents = []
-        self.load_knowledge_base()
-
-    def load_knowledge_base(self):
-        """Carga toda la base de conocimiento desde archivos JSON"""
-        try:
-            # Cargar cursos
-            cursos_path = os.path.join(self.knowledge_base_path, "cursos.json")
-            if os.path.exists(cursos_path):
-                with open(cursos_path, "r", encoding="utf-8") as f:
-                    cursos = json.load(f)
-                    for curso in cursos:
-                        self.documents.append(
-                            {
-                                "content": self._format_curso(curso),
-                                "metadata": curso,
-                                "type": "curso",
-                                "source": f"Curso: {curso['titulo']}",
-                            }
-                        )
-
-            # Cargar artículos
-            articulos_path = os.path.join(self.knowledge_base_path, "articulos.json")
-            if os.path.exists(articulos_path):
-                with open(articulos_path, "r", encoding="utf-8") as f:
-                    articulos = json.load(f)
-                    for articulo in articulos:
-                        self.documents.append(
-                            {
-                                "content": self._format_articulo(articulo),
-                                "metadata": articulo,
-                                "type": "articulo",
-                                "source": f"Artículo: {articulo['titulo']}",
-                            }
-                        )
-
-            # Cargar revistas
-            revistas_path = os.path.join(self.knowledge_base_path, "revistas.json")
-            if os.path.exists(revistas_path):
-                with open(revistas_path, "r", encoding="utf-8") as f:
-                    revistas = json.load(f)
-                    for revista in revistas:
-                        self.documents.append(
-                            {
-                                "content": self._format_revista(revista),
-                                "metadata": revista,
-                                "type": "revista",
-                                "source": f"Revista: {revista['titulo']}",
-                            }
-                        )
-
-            print(f"✅ Base de conocimiento cargada: {len(self.documents)} documentos")
-
-        except Exception as e:
-            print(f"❌ Error cargando base de conocimiento: {e}")
-
-    def _format_curso(self, curso: Dict) -> str:
-        """Formatea un curso para búsqueda"""
-        content = f"""
-        CURSO: {curso['titulo']}
-        Categoría: {curso['categoria']}
-        Nivel: {curso['nivel']}
-        Modalidad: {curso['modalidad']}
-        Duración: {curso['duracion']}
-        Edad objetivo: {curso['edad_objetivo']}
-        Precio: {curso['precio']}
-
-        DESCRIPCIÓN: {curso['descripcion']}
-
-        OBJETIVOS:
-        {' '.join([f'- {obj}' for obj in curso['objetivos']])}
-
-        CONTENIDO:
-        {' '.join([f'- {cont}' for cont in curso['contenido']])}
-
-        TAGS: {', '.join(curso['tags'])}
-        """
-        return content.strip()
-
-    def _format_articulo(self, articulo: Dict) -> str:
-        """Formatea un artículo para búsqueda"""
-        content = f"""
-        ARTÍCULO: {articulo['titulo']}
-        Categoría: {articulo['categoria']}
-        Autor: {articulo['autor']}
-        Fecha: {articulo['fecha_publicacion']}
-        Público objetivo: {articulo['publico_objetivo']}
-        Dificultad: {articulo['dificultad']}
-        Tiempo de lectura: {articulo['tiempo_lectura']}
-
-        RESUMEN: {articulo['resumen']}
-
-        CONTENIDO: {articulo['contenido']}
-
-        TAGS: {', '.join(articulo['tags'])}
-        """
-        return content.strip()
-
-    def _format_revista(self, revista: Dict) -> str:
-        """Formatea una revista para búsqueda"""
-        contenido_destacado = " ".join(
-            [f"- {item}" for item in revista["contenido_destacado"]]
-        )
-        content = f"""
-        REVISTA: {revista['titulo']}
-        Categoría: {revista['categoria']}
-        Número: {revista['numero']}
-        Fecha: {revista['fecha_publicacion']}
-        Editor: {revista['editor']}
-        Páginas: {revista['paginas']}
-        Precio: {revista['precio']}
-
-        RESUMEN: {revista['resumen']}
-
-        CONTENIDO DESTACADO:
-        {contenido_destacado}
-
-        TEMAS PRINCIPALES: {', '.join(revista['temas_principales'])}
-        """
-        return content.strip()
-
-    def search_simple(self, query: str, max_results: int = 3) -> List[DocumentChunk]:
-        """Búsqueda simple basada en palabras clave (versión básica)"""
-        query_lower = query.lower()
-        query_words = re.findall(r"\w+", query_lower)
-
-        results = []
-
-        for doc in self.documents:
-            content_lower = doc["content"].lower()
-            score = 0
-
-            # Calcular relevancia basada en coincidencias de palabras
-            for word in query_words:
-                if len(word) > 2:  # Ignorar palabras muy cortas
-                    count = content_lower.count(word)
-                    score += count * len(word)  # Palabras más largas tienen más peso
-
-            if score > 0:
-                chunk = DocumentChunk(
-                    content=doc["content"],
-                    metadata=doc["metadata"],
-                    source=doc["source"],
-                    relevance_score=score,
-                )
-                results.append(chunk)
-
-        # Ordenar por relevancia y retornar los mejores
-        results.sort(key=lambda x: x.relevance_score, reverse=True)
-        return results[:max_results]
-
-    def get_recommendations_context(self, query: str) -> str:
-        """Genera contexto para el asistente basado en la consulta"""
-        # Buscar documentos relevantes
-        relevant_docs = self.search_simple(query, max_results=3)
-
-        if not relevant_docs:
-            # Si no hay coincidencias por la consulta, devolver un resumen compacto
-            # de la base de conocimiento para que el asistente siempre tenga datos
-            # sobre Green Dream en lugar de decir que no hay información.
-            summary_lines = [
-                "🌱 **Resumen breve de la Base de Conocimiento Green Dream:**\n"
-            ]
-            # Mostrar hasta 5 títulos representativos
-            for i, doc in enumerate(self.documents[:5], 1):
-                meta = doc.get("metadata", {})
-                title = (
-                    meta.get("titulo")
-                    or meta.get("nombre")
-                    or doc.get("source", f"Doc {i}")
-                )
-                dtype = doc.get("type", "recurso")
-                summary_lines.append(f"{i}. {title} ({dtype})\n")
-
-            summary_lines.append(
-                "\n💡 Usa esta información para hacer recomendaciones concretas sobre cursos, artículos y revistas de Green Dream."
-            )
-            return "\n".join(summary_lines)
-
-        context = "🌱 **INFORMACIÓN DE GREEN DREAM DISPONIBLE:**\n\n"
-
-        for i, doc in enumerate(relevant_docs, 1):
-            context += f"**{i}. {doc.source}**\n"
-
-            # Extraer información clave según el tipo
-            metadata = doc.metadata
-
-            if "titulo" in metadata:
-                context += f"📋 **Título:** {metadata['titulo']}\n"
-
-            if "categoria" in metadata:
-                context += f"🏷️ **Categoría:** {metadata['categoria']}\n"
-
-            if "nivel" in metadata:
-                context += f"📊 **Nivel:** {metadata['nivel']}\n"
-
-            if "modalidad" in metadata:
-                context += f"💻 **Modalidad:** {metadata['modalidad']}\n"
-
-            if "precio" in metadata:
-                context += f"💰 **Precio:** {metadata['precio']}\n"
-
-            if "url" in metadata:
-                context += f"🔗 **URL:** {metadata['url']}\n"
-
-            # Agregar descripción o resumen
-            if "descripcion" in metadata:
-                context += f"📝 **Descripción:** {metadata['descripcion']}\n"
-            elif "resumen" in metadata:
-                context += f"📝 **Resumen:** {metadata['resumen']}\n"
-
-            context += "\n" + "-" * 50 + "\n\n"
-
-        context += "\n💡 **INSTRUCCIONES PARA EL ASISTENTE:**\n"
-        context += "- Usa esta información para hacer recomendaciones específicas y personalizadas\n"
-        context += "- Incluye URLs cuando sean relevantes\n"
-        context += "- Menciona precios, modalidades y niveles\n"
-        context += "- Adapta las recomendaciones al perfil del joven consultante\n"
-
-        return context
+# rag_system.py - Sistema RAG para Green Dream
+import json
+import os
+import threading
+import unicodedata
+from array import array
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import heapq
+from operator import itemgetter
+import math
+import re
+
+import dense_index
+from document_store import HEAD, PASSAGE_WORDS, DocumentStore, DocumentView
+from facets import FacetFilter, FacetIndex, parse_filters
+
+
+# Expresión usada para tokenizar tanto documentos como consultas
+_TOKEN_RE = re.compile(r"\w+")
+
+# Versión del análisis de texto e índice: los snapshots de otra versión se descartan
+INDEX_VERSION = 3
+
+# Palabras vacías (ya sin tildes) que no se indexan; las de 1-2 letras se descartan siempre
+STOPWORDS = frozenset("""
+    algo algun alguna algunas alguno algunos ante antes aqui asi aunque bajo cada como con contra cual
+    cuales cuando del desde donde durante ella ellas ellos entre era eran esa esas ese eso esos esta
+    estan estar estas este esto estos estoy fue fueron hace hacia han hasta hay las les los mas mediante
+    mientras mis mucha muchas mucho muchos muy nada ningun ninguna nos nosotros otra otras otro otros
+    para pero poco por porque puede pueden puedo que quien quienes quiero quisiera sea segun ser sido
+    sin sobre solo son soy sus tal tambien tanto tener tengo tiene tienen toda todas todo todos tus una
+    unas uno unos usted ustedes vez
+""".split())
+
+# Corrección de errores de tipeo: similitud mínima (coeficiente de Dice sobre
+# trigramas) y diferencia máxima de longitud con el término corregido
+TYPO_MIN_SIMILARITY = 0.6
+TYPO_MAX_LENGTH_DIFF = 2
+
+# Snapshot binario de la base (ver kb_snapshot.py); vacío para cargar siempre los JSON
+KB_SNAPSHOT_PATH = os.getenv("KB_SNAPSHOT_PATH")
+
+# Cada cuántos segundos se revisa si cambiaron los JSON de la base (0 desactiva la recarga)
+KB_RELOAD_INTERVAL_SECONDS = float(os.getenv("KB_RELOAD_INTERVAL_SECONDS", "30"))
+
+# Consultas típicas con las que se calienta la búsqueda al arrancar (la última,
+# con una falta de ortografía, prepara el corrector de términos)
+WARMUP_QUERIES = (
+    "cursos gratuitos de energía solar para principiantes",
+    "artículos sobre economía circular y compostaje",
+    "revistas de agricultura urbana",
+    "reciclage de plasticos",
+)
+
+# Fracción de posiciones borradas a partir de la cual una recarga reconstruye todo
+# (compacta el almacén y el índice) en lugar de aplicar cambios incrementales
+RELOAD_COMPACT_RATIO = 0.25
+
+# Modo de recuperación: "lexical" (BM25), "dense" (vectores semánticos locales,
+# requiere numpy) o "hybrid" (fusión de ambos rankings)
+RETRIEVAL_MODES = ("lexical", "dense", "hybrid")
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "lexical").strip().lower()
+
+# Constante de la fusión por rango recíproco y candidatos de cada ranking que se fusionan
+RRF_K = 60
+HYBRID_CANDIDATES = 20
+
+# Procesos entre los que se reparte el índice BM25 (ver sharded_search.py);
+# 0 o 1 puntúa en el hilo de la petición
+RAG_SEARCH_SHARDS = int(os.getenv("RAG_SEARCH_SHARDS", "0"))
+
+
+# Campos clave de cada recurso (metadata, emoji, etiqueta) que se muestran al usuario
+RESOURCE_FIELDS = [
+    ("titulo", "📋", "Título"),
+    ("categoria", "🏷️", "Categoría"),
+    ("nivel", "📊", "Nivel"),
+    ("modalidad", "💻", "Modalidad"),
+    ("precio", "💰", "Precio"),
+    ("url", "🔗", "URL"),
+]
+
+# Archivos de la base de conocimiento: (archivo, tipo, prefijo del origen)
+KNOWLEDGE_BASE_FILES = [
+    ("cursos.json", "curso", "Curso"),
+    ("articulos.json", "articulo", "Artículo"),
+    ("revistas.json", "revista", "Revista"),
+]
+
+
+def split_words(text: str) -> List[str]:
+    """Palabras de un texto en minúsculas (sin analizar)"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def fold_accents(word: str) -> str:
+    """Quita tildes y diéresis ("energía" -> "energia", "años" -> "anos")"""
+    if word.isascii():
+        return word
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+
+
+def light_stem(word: str) -> str:
+    """Stemming ligero para español: plural y vocal final de género.
+
+    "paneles" -> "panel", "energías" -> "energi", "luces" -> "luz",
+    "cursos" y "curso" -> "curs". No toca palabras cortas ni con dígitos.
+    """
+    if len(word) < 5 or not word.isalpha():
+        return word
+    if word.endswith("ces"):
+        word = word[:-3] + "z"
+    elif word.endswith("es") and word[-3] not in "aeiou":
+        word = word[:-2]
+    elif word.endswith("s"):
+        word = word[:-1]
+    if len(word) > 4 and word[-1] in "aeo":
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def analyze_word(word: str) -> str:
+    """Término indexado de una palabra en minúsculas ("" si se descarta).
+
+    Se cachea: el vocabulario se repite mucho y así cada palabra distinta se
+    analiza una sola vez al indexar y al consultar.
+    """
+    word = fold_accents(word)
+    if len(word) <= 2 or word in STOPWORDS:
+        return ""
+    return light_stem(word)
+
+
+def tokenize(text: str) -> List[str]:
+    """Divide un texto en términos analizados (sin tildes, sin palabras vacías, con stemming ligero)"""
+    return [term for term in map(analyze_word, _TOKEN_RE.findall(text.lower())) if term]
+
+
+def _trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Trigramas de caracteres de los términos del vocabulario para corregir errores de tipeo.
+
+    Los candidatos de un término desconocido son los términos que comparten
+    trigramas con él (se cuentan recorriendo las listas de cada trigrama, sin
+    comparar contra todo el vocabulario); gana el de mayor coeficiente de Dice.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = []
+        self.postings: Dict[str, array] = {}
+        self.sizes = array("H")
+        for term_id, term in enumerate(terms):
+            grams = _trigrams(term)
+            self.terms.append(term)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                entry = self.postings.get(gram)
+                if entry is None:
+                    entry = self.postings[gram] = array("I")
+                entry.append(term_id)
+
+    def similar(self, term: str, min_similarity: float = TYPO_MIN_SIMILARITY) -> List[Tuple[float, str]]:
+        """``[(similitud, término), ...]`` del vocabulario parecidos a ``term``, de mayor a menor"""
+        grams = _trigrams(term)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for term_id in self.postings.get(gram, ()):
+                shared[term_id] = shared.get(term_id, 0) + 1
+        n_grams, terms, sizes = len(grams), self.terms, self.sizes
+        matches = []
+        for term_id, count in shared.items():
+            similarity = 2 * count / (n_grams + sizes[term_id])
+            if similarity >= min_similarity and abs(len(terms[term_id]) - len(term)) <= TYPO_MAX_LENGTH_DIFF:
+                matches.append((similarity, terms[term_id]))
+        matches.sort(reverse=True)
+        return matches
+
+
+def passage_terms(documents: DocumentStore, doc_id: int) -> List[Tuple[int, List[str]]]:
+    """Términos indexados de cada pasaje del documento (los fragmentos llevan su título)"""
+    title = documents.metadata(doc_id).get("titulo", "")
+    return [
+        (passage_id, tokenize(text if field == HEAD else f"{title} {text}"))
+        for passage_id, field, text in documents.passages(doc_id)
+    ]
+
+
+def _truncate_words(text: str, max_words: int = PASSAGE_WORDS) -> str:
+    words = text.split()
+    return text if len(words) <= max_words else " ".join(words[:max_words]) + " [...]"
+
+
+class BM25Index:
+    """Índice invertido con puntuación BM25 sobre los documentos cargados.
+
+    Cada término apunta a su lista de postings (``doc_ids`` y frecuencias en dos
+    arrays compactos), de modo que una búsqueda solo recorre los postings de los
+    términos de la consulta en lugar de todo el corpus. ``GreenDreamRAG`` indexa
+    pasajes: los doc_id son los passage_id del ``DocumentStore``. Las recargas
+    no modifican un índice en uso: ``with_changes`` devuelve uno nuevo.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, tuple] = {}
+        self.doc_lengths = array("I")
+        self.total_length = 0
+        self.num_docs = 0
+        # Normalización por longitud de cada documento (se recalcula tras añadir documentos)
+        self._norms: Optional[array] = None
+        # Trigramas del vocabulario (se construyen con la primera corrección)
+        self._trigrams: Optional[TrigramIndex] = None
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_length / self.num_docs if self.num_docs else 0.0
+
+    def add_document(self, doc_id: int, terms: List[str]):
+        """Indexa los términos de un documento"""
+        frequencies: Dict[str, int] = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+        for term, tf in frequencies.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array("I"), array("I"))
+            entry[0].append(doc_id)
+            entry[1].append(tf)
+
+        if doc_id >= len(self.doc_lengths):
+            self.doc_lengths.extend([0] * (doc_id + 1 - len(self.doc_lengths)))
+        self.doc_lengths[doc_id] = len(terms)
+        self.total_length += len(terms)
+        self.num_docs += 1
+        self._norms = None
+
+    def with_changes(
+        self,
+        removed: List[Tuple[int, List[str]]],
+        added: List[Tuple[int, List[str]]],
+    ) -> "BM25Index":
+        """Índice nuevo sin los documentos ``removed`` y con los ``added`` (``(doc_id, términos)``).
+
+        Solo se copian los postings de los términos afectados; el resto se
+        comparte con este índice, que no se modifica.
+        """
+        index = BM25Index(self.k1, self.b)
+        index.postings = dict(self.postings)
+        index.doc_lengths = array("I", self.doc_lengths)
+        index.total_length = self.total_length
+        index.num_docs = self.num_docs
+
+        removed_ids = {doc_id for doc_id, _ in removed}
+        touched = set()
+        for _, terms in removed + added:
+            touched.update(terms)
+        for term in touched:
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            if removed_ids.isdisjoint(entry[0]):
+                index.postings[term] = (array("I", entry[0]), array("I", entry[1]))
+                continue
+            pairs = [(d, tf) for d, tf in zip(*entry) if d not in removed_ids]
+            if pairs:
+                index.postings[term] = (array("I", (d for d, _ in pairs)), array("I", (tf for _, tf in pairs)))
+            else:
+                del index.postings[term]
+        for doc_id in removed_ids:
+            index.total_length -= index.doc_lengths[doc_id]
+            index.doc_lengths[doc_id] = 0
+            index.num_docs -= 1
+
+        for doc_id, terms in added:
+            index.add_document(doc_id, terms)
+        return index
+
+    @property
+    def num_terms(self) -> int:
+        return len(self.postings)
+
+    def iter_postings(self) -> Iterator[Tuple[str, Any, Any]]:
+        """``(término, doc_ids, frecuencias)`` de todos los términos"""
+        for term, (doc_ids, tfs) in self.postings.items():
+            yield term, doc_ids, tfs
+
+    def _postings_for(self, term: str) -> Optional[tuple]:
+        """``(doc_ids, frecuencias)`` de un término (None si no aparece)"""
+        return self.postings.get(term)
+
+    @property
+    def trigrams(self) -> TrigramIndex:
+        if self._trigrams is None:
+            self._trigrams = TrigramIndex(term for term, _, _ in self.iter_postings())
+        return self._trigrams
+
+    def correct(self, terms: List[str]) -> List[str]:
+        """Reemplaza los términos que no están en el índice por el más parecido (errores de tipeo).
+
+        Entre candidatos igual de parecidos se prefiere el más frecuente.
+        """
+        corrected = []
+        for term in terms:
+            if len(term) > 3 and not term.isdigit() and self._postings_for(term) is None:
+                matches = self.trigrams.similar(term)
+                if matches:
+                    best = matches[0][0]
+                    term = max(
+                        (candidate for similarity, candidate in matches if similarity == best),
+                        key=lambda candidate: len(self._postings_for(candidate)[0]),
+                    )
+            corrected.append(term)
+        return corrected
+
+    def idf(self, term: str) -> float:
+        """IDF de BM25 (variante siempre positiva)"""
+        entry = self._postings_for(term)
+        df = len(entry[0]) if entry else 0
+        n = self.num_docs
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _doc_norms(self) -> array:
+        """``k1 * (1 - b + b * longitud / longitud_media)`` por documento"""
+        if self._norms is None:
+            k1, b = self.k1, self.b
+            avgdl = self.avg_doc_length or 1.0
+            self._norms = array(
+                "d", (k1 * (1 - b + b * length / avgdl) for length in self.doc_lengths)
+            )
+        return self._norms
+
+    def _scores(self, terms: List[str], allowed: Optional[Set[int]] = None) -> Dict[int, float]:
+        """Puntuación BM25 de cada doc_id que contiene algún término (solo los de ``allowed`` si se indica)"""
+        if not terms or not self.num_docs:
+            return {}
+
+        norms = self._doc_norms()
+        k1_plus_1 = self.k1 + 1
+        scores: Dict[int, float] = {}
+
+        for term in set(terms):
+            entry = self._postings_for(term)
+            if not entry:
+                continue
+            idf = self.idf(term)
+            doc_ids, tfs = entry
+            if allowed is None:
+                for doc_id, tf in zip(doc_ids, tfs):
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * k1_plus_1 / (tf + norms[doc_id])
+            else:
+                for doc_id, tf in zip(doc_ids, tfs):
+                    if doc_id in allowed:
+                        scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * k1_plus_1 / (tf + norms[doc_id])
+        return scores
+
+    def search(self, terms: List[str], top_k: int = 3) -> List[tuple]:
+        """Devuelve ``[(score, doc_id), ...]`` con los ``top_k`` mejores documentos"""
+        scores = self._scores(terms)
+        # Selección top-k con heap: O(n log k) en lugar de ordenar todos los candidatos
+        return heapq.nlargest(
+            top_k, ((score, doc_id) for doc_id, score in scores.items())
+        )
+
+    def search_grouped(
+        self, terms: List[str], groups, top_k: int = 3, allowed: Optional[Set[int]] = None
+    ) -> List[tuple]:
+        """Como ``search`` pero agrupando resultados: ``groups[doc_id]`` es el grupo de cada entrada.
+
+        Cada grupo puntúa con su mejor entrada. Devuelve ``[(score, grupo, doc_id), ...]``.
+        """
+        scores = self._scores(terms, allowed)
+        # Los mejores grupos casi siempre están entre las primeras entradas: se
+        # agrupa ese top y solo se recorre todo si no alcanza para top_k grupos
+        candidates = scores.items()
+        if len(scores) > top_k * 8:
+            candidates = heapq.nlargest(top_k * 8, candidates, key=itemgetter(1))
+        best = self._best_per_group(candidates, groups)
+        if len(best) < top_k and len(candidates) < len(scores):
+            best = self._best_per_group(scores.items(), groups)
+        return heapq.nlargest(
+            top_k, ((score, group, doc_id) for group, (score, doc_id) in best.items())
+        )
+
+    @staticmethod
+    def _best_per_group(candidates, groups) -> Dict[int, tuple]:
+        best: Dict[int, tuple] = {}
+        for doc_id, score in candidates:
+            group = groups[doc_id]
+            current = best.get(group)
+            if current is None or score > current[0]:
+                best[group] = (score, doc_id)
+        return best
+
+
+@dataclass(frozen=True)
+class KnowledgeBase:
+    """Versión cargada de la base: documentos e índices que se reemplazan juntos"""
+
+    documents: DocumentStore
+    index: BM25Index
+    facets: FacetIndex
+    # Vectores densos (solo en los modos "dense" e "hybrid")
+    dense: Optional["dense_index.DenseIndex"] = None
+    version: int = 0
+    from_snapshot: bool = False
+    # Procesos de búsqueda con fragmentos de ``index`` (con RAG_SEARCH_SHARDS > 1)
+    shards: Optional[Any] = None
+
+
+class GreenDreamRAG:
+    """Sistema RAG especializado para Green Dream ONG"""
+
+    def __init__(
+        self,
+        knowledge_base_path: Optional[str] = None,
+        snapshot_path: Optional[str] = None,
+        retrieval_mode: Optional[str] = None,
+        search_shards: Optional[int] = None,
+    ):
+        # Por defecto, la carpeta knowledge_base/ del proyecto
+        if knowledge_base_path is None:
+            knowledge_base_path = os.path.join(
+                os.path.dirname(__file__), "..", "knowledge_base"
+            )
+        self.knowledge_base_path = knowledge_base_path
+        if snapshot_path is None:
+            snapshot_path = KB_SNAPSHOT_PATH
+        if snapshot_path is None:
+            snapshot_path = os.path.join(knowledge_base_path, "kb.snapshot")
+        self.snapshot_path = snapshot_path
+        self.retrieval_mode = (retrieval_mode or RAG_RETRIEVAL_MODE).lower()
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de recuperación desconocido: {self.retrieval_mode}")
+        if self.retrieval_mode != "lexical" and not dense_index.available():
+            print(f"⚠️ El modo {self.retrieval_mode} requiere numpy: se usa la búsqueda léxica")
+            self.retrieval_mode = "lexical"
+        self.search_shards = RAG_SEARCH_SHARDS if search_shards is None else search_shards
+        # Las búsquedas leen self._kb una sola vez: una recarga lo reemplaza de forma
+        # atómica y las peticiones en curso terminan con la versión anterior
+        self._kb = KnowledgeBase(DocumentStore(self._formatters()), BM25Index(), FacetIndex())
+        # (mtime, tamaño) de cada JSON en la última carga, para detectar cambios
+        self._file_signatures: Dict[str, tuple] = {}
+        self._reload_lock = threading.RLock()
+        self.load_knowledge_base()
+
+    @property
+    def documents(self) -> DocumentStore:
+        return self._kb.documents
+
+    @property
+    def index(self) -> BM25Index:
+        return self._kb.index
+
+    @property
+    def facets(self) -> FacetIndex:
+        return self._kb.facets
+
+    @property
+    def dense(self) -> Optional["dense_index.DenseIndex"]:
+        return self._kb.dense
+
+    @property
+    def version(self) -> int:
+        """Versión de la base cargada: cambia en cada carga (invalida cachés derivadas)"""
+        return self._kb.version
+
+    def load_knowledge_base(self):
+        """Carga la base de conocimiento desde el snapshot binario o, si no hay uno válido, desde los JSON"""
+        with self._reload_lock:
+            # Las firmas se toman antes de leer: un cambio durante la carga se detecta en la siguiente revisión
+            signatures = self._current_signatures()
+            if self._load_snapshot():
+                self._file_signatures = signatures
+                return
+            try:
+                documents = DocumentStore(self._formatters())
+                index = BM25Index()
+                facets = FacetIndex()
+                for filename, doc_type, label in KNOWLEDGE_BASE_FILES:
+                    for record in self._read_records(filename):
+                        doc_id = documents.add(doc_type, record, f"{label}: {record['titulo']}")
+                        facets.add(doc_id, doc_type, record)
+                        # El texto de los pasajes solo se usa para indexar; no se guarda
+                        for passage_id, terms in passage_terms(documents, doc_id):
+                            index.add_document(passage_id, terms)
+
+                dense = self._build_dense(documents, index)
+                self._publish(KnowledgeBase(documents, index, facets, dense, self.version + 1))
+                self._file_signatures = signatures
+                print(f"✅ Base de conocimiento cargada: {len(self.documents)} documentos")
+
+            except Exception as e:
+                print(f"❌ Error cargando base de conocimiento: {e}")
+
+    def _load_snapshot(self) -> bool:
+        """Abre el snapshot con mmap (compartido entre workers); False si no hay uno válido"""
+        if not self.snapshot_path:
+            return False
+        from kb_snapshot import open_snapshot
+
+        loaded = open_snapshot(
+            self.snapshot_path, self.knowledge_base_path, self._formatters(),
+            dense=self.retrieval_mode != "lexical",
+        )
+        if loaded is None:
+            return False
+        documents, index, facets, dense, header = loaded
+        if dense is None:
+            dense = self._build_dense(documents, index)
+        self._publish(KnowledgeBase(documents, index, facets, dense, self.version + 1, from_snapshot=True))
+        print(
+            f"✅ Base de conocimiento cargada desde snapshot: {len(self.documents)} documentos "
+            f"({header['created']})"
+        )
+        return True
+
+    def _publish(self, kb: KnowledgeBase):
+        """Publica una versión de la base (con sus procesos de búsqueda, si se usan)"""
+        if self.search_shards > 1 and len(kb.documents):
+            from sharded_search import ShardedSearch
+
+            documents = kb.documents
+            shards = ShardedSearch(kb.index, documents.passage_parents, documents.passage_offsets, self.search_shards)
+            kb = replace(kb, shards=shards)
+            print(f"🧩 Índice repartido en {len(shards)} procesos de búsqueda")
+        previous, self._kb = self._kb, kb
+        if previous.shards is not None:
+            # Las búsquedas en curso sobre la versión anterior pasan a puntuar en el hilo
+            previous.shards.close()
+
+    def close(self):
+        """Termina los procesos de búsqueda (si hay)"""
+        if self._kb.shards is not None:
+            self._kb.shards.close()
+
+    def prepare_fork(self):
+        """Antes de hacer fork: los procesos de búsqueda no se comparten, cada hijo crea los suyos"""
+        self.close()
+
+    def after_fork(self):
+        """En un proceso creado con fork: crea sus propios procesos de búsqueda (si se usan)"""
+        kb = self._kb
+        if kb.shards is not None:
+            self._kb = replace(kb, shards=None)
+            self._publish(self._kb)
+
+    def warmup(self, queries: Iterable[str] = WARMUP_QUERIES) -> int:
+        """Ejecuta búsquedas de prueba para que la primera petición no pague las inicializaciones perezosas.
+
+        Calcula las normas BM25 y el índice de trigramas, llena la caché del
+        analizador, codifica consultas densas y trae a memoria las páginas del
+        snapshot que se leen al formatear. Antes de un fork, todo eso queda
+        compartido con los workers. Devuelve el número de consultas.
+        """
+        queries = list(queries)
+        self.get_recommendations_contexts(queries)
+        return len(queries)
+
+    def _build_dense(self, documents: DocumentStore, index: BM25Index) -> Optional["dense_index.DenseIndex"]:
+        if self.retrieval_mode == "lexical":
+            return None
+        return dense_index.DenseIndex.build(
+            index.iter_postings(), index.idf, documents.passage_parents, len(documents.types)
+        )
+
+    def _read_records(self, filename: str) -> List[Dict]:
+        path = os.path.join(self.knowledge_base_path, filename)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _current_signatures(self) -> Dict[str, tuple]:
+        signatures = {}
+        for filename, _, _ in KNOWLEDGE_BASE_FILES:
+            try:
+                stat = os.stat(os.path.join(self.knowledge_base_path, filename))
+                signatures[filename] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                signatures[filename] = None
+        return signatures
+
+    def reload(self) -> bool:
+        """Aplica los cambios de los JSON modificados desde la última carga.
+
+        Solo se vuelven a leer los archivos cuya fecha o tamaño cambió. Sus
+        registros se comparan por ``id`` con los cargados y únicamente los
+        nuevos, modificados o eliminados se actualizan en el índice. La versión
+        nueva se publica de una vez; devuelve True si la hubo.
+        """
+        with self._reload_lock:
+            signatures = self._current_signatures()
+            changed = [
+                entry for entry in KNOWLEDGE_BASE_FILES
+                if signatures[entry[0]] != self._file_signatures.get(entry[0])
+            ]
+            if not changed:
+                return False
+            kb = self._kb
+            if kb.from_snapshot:
+                # El snapshot es de solo lectura: los JSON cambiados se cargan completos
+                self.load_knowledge_base()
+                return self._kb is not kb
+
+            documents = kb.documents
+            loaded = {}
+            for doc_id in documents.doc_ids():
+                metadata = documents.metadata(doc_id)
+                loaded[(documents.type_of(doc_id), metadata.get("id", documents.source(doc_id)))] = doc_id
+
+            removed, added, updated = [], [], 0
+            try:
+                for filename, doc_type, label in changed:
+                    seen = set()
+                    for record in self._read_records(filename):
+                        source = f"{label}: {record['titulo']}"
+                        key = (doc_type, record.get("id", source))
+                        doc_id = loaded.get(key) if key not in seen else None
+                        seen.add(key)
+                        if doc_id is not None:
+                            if documents.same_metadata(doc_id, record):
+                                continue
+                            removed.append(doc_id)
+                            updated += 1
+                        added.append((doc_type, source, record))
+                    removed.extend(
+                        doc_id for key, doc_id in loaded.items()
+                        if key[0] == doc_type and key not in seen
+                    )
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Archivo a medio escribir o inválido: se mantiene la versión actual y se reintenta
+                print(f"❌ Error recargando base de conocimiento: {e}")
+                return False
+
+            self._file_signatures.update({filename: signatures[filename] for filename, _, _ in changed})
+            if not removed and not added:
+                return False
+            if len(documents.deleted) + len(removed) > RELOAD_COMPACT_RATIO * len(documents.types):
+                self.load_knowledge_base()
+                return self._kb is not kb
+
+            new_documents = documents.copy()
+            for doc_id in removed:
+                new_documents.delete(doc_id)
+            new_terms, old_terms, new_facets, old_facets, new_dense = [], [], [], [], []
+            for doc_type, source, record in added:
+                doc_id = new_documents.add(doc_type, record, source)
+                terms = passage_terms(new_documents, doc_id)
+                new_terms.extend(terms)
+                new_facets.append((doc_id, doc_type, record))
+                new_dense.append((doc_id, [passage for _, passage in terms]))
+            for doc_id in removed:
+                old_terms.extend(passage_terms(documents, doc_id))
+                old_facets.append((doc_id, documents.type_of(doc_id), documents.metadata(doc_id)))
+            index = kb.index.with_changes(old_terms, new_terms)
+            facets = kb.facets.with_changes(old_facets, new_facets)
+            dense = kb.dense.with_changes(set(removed), new_dense) if kb.dense is not None else None
+
+            self._publish(KnowledgeBase(new_documents, index, facets, dense, kb.version + 1))
+            print(
+                f"🔄 Base de conocimiento actualizada: {len(added) - updated} nuevos, "
+                f"{updated} modificados, {len(removed) - updated} eliminados "
+                f"({len(new_documents)} documentos)"
+            )
+            return True
+
+    def _formatters(self):
+        """Función que genera el texto buscable de cada tipo de documento"""
+        return {
+            "curso": self._format_curso,
+            "articulo": self._format_articulo,
+            "revista": self._format_revista,
+        }
+
+    def _format_curso(self, curso: Dict) -> str:
+        """Formatea un curso para búsqueda"""
+        content = f"""
+        CURSO: {curso['titulo']}
+        Categoría: {curso['categoria']}
+        Nivel: {curso['nivel']}
+        Modalidad: {curso['modalidad']}
+        Duración: {curso['duracion']}
+        Edad objetivo: {curso['edad_objetivo']}
+        Precio: {curso['precio']}
+
+        DESCRIPCIÓN: {curso['descripcion']}
+
+        OBJETIVOS:
+        {' '.join([f'- {obj}' for obj in curso['objetivos']])}
+
+        CONTENIDO:
+        {' '.join([f'- {cont}' for cont in curso['contenido']])}
+
+        TAGS: {', '.join(curso['tags'])}
+        """
+        return content.strip()
+
+    def _format_articulo(self, articulo: Dict) -> str:
+        """Formatea un artículo para búsqueda"""
+        content = f"""
+        ARTÍCULO: {articulo['titulo']}
+        Categoría: {articulo['categoria']}
+        Autor: {articulo['autor']}
+        Fecha: {articulo['fecha_publicacion']}
+        Público objetivo: {articulo['publico_objetivo']}
+        Dificultad: {articulo['dificultad']}
+        Tiempo de lectura: {articulo['tiempo_lectura']}
+
+        RESUMEN: {articulo['resumen']}
+
+        CONTENIDO: {articulo['contenido']}
+
+        TAGS: {', '.join(articulo['tags'])}
+        """
+        return content.strip()
+
+    def _format_revista(self, revista: Dict) -> str:
+        """Formatea una revista para búsqueda"""
+        contenido_destacado = " ".join(
+            [f"- {item}" for item in revista["contenido_destacado"]]
+        )
+        content = f"""
+        REVISTA: {revista['titulo']}
+        Categoría: {revista['categoria']}
+        Número: {revista['numero']}
+        Fecha: {revista['fecha_publicacion']}
+        Editor: {revista['editor']}
+        Páginas: {revista['paginas']}
+        Precio: {revista['precio']}
+
+        RESUMEN: {revista['resumen']}
+
+        CONTENIDO DESTACADO:
+        {contenido_destacado}
+
+        TEMAS PRINCIPALES: {', '.join(revista['temas_principales'])}
+        """
+        return content.strip()
+
+    def search_simple(
+        self, query: str, max_results: int = 3, filters: Optional[FacetFilter] = None
+    ) -> List[DocumentView]:
+        """Búsqueda por palabras clave usando el índice invertido BM25.
+
+        Se puntúan pasajes y cada documento toma la puntuación de su mejor pasaje
+        (disponible en ``passage``). Los términos de la consulta que no están en
+        el índice se corrigen con el más parecido. En los modos "dense" e
+        "hybrid" el ranking sale de los vectores semánticos (ver
+        ``_search_dense``). Con ``filters`` solo se puntúan los documentos que
+        cumplen las facetas; si el texto no basta para llenar ``max_results``,
+        se completa con otros que las cumplen. Devuelve vistas sobre el almacén
+        de documentos (sin copiar contenido ni metadata).
+        """
+        kb = self._kb
+        return self._search(kb, kb.index.correct(tokenize(query)), max_results, filters)
+
+    def _lexical_top_k(self, max_results: int) -> int:
+        """Candidatos BM25 que necesita una búsqueda en el modo actual"""
+        return HYBRID_CANDIDATES if self.retrieval_mode != "lexical" else max_results
+
+    def _allowed_docs(self, kb: KnowledgeBase, filters: Optional[FacetFilter]) -> Optional[Set[int]]:
+        return kb.facets.filter(filters) if filters else None
+
+    def _search(
+        self, kb: KnowledgeBase, terms: List[str], max_results: int,
+        filters: Optional[FacetFilter] = None, query_vector=None, lexical=None,
+    ) -> List[DocumentView]:
+        """``search_simple`` con los términos ya analizados.
+
+        ``query_vector`` y ``lexical`` (resultado de ``_lexical``) se pasan si
+        ya se calcularon para un lote.
+        """
+        documents = kb.documents
+        allowed_docs = self._allowed_docs(kb, filters)
+        if allowed_docs is not None and not allowed_docs:
+            return []
+        if lexical is None:
+            lexical = self._lexical(kb, [(terms, allowed_docs, self._lexical_top_k(max_results))])[0]
+        if kb.dense is not None and self.retrieval_mode != "lexical":
+            results = self._search_dense(kb, terms, max_results, allowed_docs, lexical, query_vector)
+        else:
+            results = [
+                DocumentView(documents, doc_id, score, passage_id)
+                for score, doc_id, passage_id in lexical
+            ]
+        if allowed_docs and len(results) < max_results:
+            found = {doc.doc_id for doc in results}
+            extra = heapq.nsmallest(max_results - len(results), allowed_docs - found)
+            offsets = documents.passage_offsets
+            results += [DocumentView(documents, doc_id, 0.0, offsets[doc_id]) for doc_id in extra]
+        return results
+
+    def _lexical(self, kb: KnowledgeBase, queries: List[Tuple[List[str], Optional[Set[int]], int]]) -> List[List[tuple]]:
+        """Top-k BM25 ``[(score, doc_id, passage_id), ...]`` de cada ``(términos, doc_ids permitidos, top_k)``.
+
+        Con procesos de búsqueda el lote completo se resuelve en un viaje a cada
+        uno; si no responden (p. ej. la versión ya se reemplazó), en este hilo.
+        """
+        if kb.shards is not None:
+            from sharded_search import ShardError
+
+            try:
+                return kb.shards.search(queries)
+            except ShardError:
+                pass
+        documents = kb.documents
+        offsets = documents.passage_offsets
+        results = []
+        for terms, allowed_docs, top_k in queries:
+            allowed = None
+            if allowed_docs is not None:
+                allowed = {
+                    passage_id
+                    for doc_id in allowed_docs
+                    for passage_id in range(offsets[doc_id], offsets[doc_id + 1])
+                }
+            results.append(kb.index.search_grouped(terms, documents.passage_parents, top_k, allowed))
+        return results
+
+    def _search_dense(
+        self, kb: KnowledgeBase, terms: List[str], max_results: int,
+        allowed_docs: Optional[Set[int]], lexical: List[tuple], query_vector=None,
+    ) -> List[DocumentView]:
+        """Ranking semántico ("dense") o fusión por rango recíproco con BM25 ("hybrid").
+
+        El pasaje mostrado de cada documento es su mejor pasaje léxico entre los
+        candidatos BM25 (``lexical``) o, si no tiene, la cabecera.
+        """
+        documents = kb.documents
+        top_k = HYBRID_CANDIDATES if self.retrieval_mode == "hybrid" else max_results
+        if query_vector is None:
+            query_vector = kb.dense.encode([terms])[0]
+        hits = [
+            (similarity, doc_id)
+            for similarity, doc_id in kb.dense.search(query_vector[None, :], top_k, allowed_docs)[0]
+            if similarity > 0
+        ]
+        passages = {doc_id: passage_id for _, doc_id, passage_id in lexical}
+
+        if self.retrieval_mode == "dense":
+            ranked = hits
+        else:
+            fused: Dict[int, float] = {}
+            for ranking in ([doc_id for _, doc_id in hits], [doc_id for _, doc_id, _ in lexical]):
+                for rank, doc_id in enumerate(ranking, 1):
+                    fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (RRF_K + rank)
+            ranked = heapq.nlargest(max_results, ((score, doc_id) for doc_id, score in fused.items()))
+        return [
+            DocumentView(documents, doc_id, score, passages.get(doc_id, documents.passage_offsets[doc_id]))
+            for score, doc_id in ranked
+        ]
+
+    def search_with_filters(self, query: str, max_results: int = 3) -> Tuple[List[DocumentView], FacetFilter, bool]:
+        """Búsqueda con las restricciones detectadas en la consulta.
+
+        Devuelve ``(documentos, filtros, relajado)``; ``relajado`` es True cuando
+        ningún documento cumple todos los filtros y se buscó sin ellos.
+        """
+        kb = self._kb
+        return self._search_with_filters(kb, query, kb.index.correct(tokenize(query)), max_results)
+
+    def _search_with_filters(
+        self, kb: KnowledgeBase, query: str, terms: List[str], max_results: int,
+        query_vector=None, filters: Optional[FacetFilter] = None, lexical=None,
+    ) -> Tuple[List[DocumentView], FacetFilter, bool]:
+        if filters is None:
+            filters = parse_filters(query, kb.facets)
+        if filters:
+            results = self._search(kb, terms, max_results, filters, query_vector, lexical)
+            if results:
+                return results, filters, False
+            lexical = None
+        return self._search(kb, terms, max_results, None, query_vector, lexical), filters, bool(filters)
+
+    def search_many(self, queries: List[str], max_results: int = 3) -> List[Tuple[List[DocumentView], FacetFilter, bool]]:
+        """``search_with_filters`` para un lote de consultas sobre la misma versión de la base.
+
+        Cada palabra distinta del lote se analiza y corrige una sola vez; en
+        los modos densos, los vectores de todas las consultas se calculan en una
+        sola operación y, con procesos de búsqueda, el BM25 de todo el lote va
+        en un solo viaje a cada proceso.
+        """
+        kb = self._kb
+        corrections: Dict[str, str] = {}
+        batch_terms = []
+        for query in queries:
+            terms = tokenize(query)
+            for term in terms:
+                if term not in corrections:
+                    corrections[term] = kb.index.correct([term])[0]
+            batch_terms.append([corrections[term] for term in terms])
+        vectors = [None] * len(queries)
+        if kb.dense is not None and self.retrieval_mode != "lexical" and queries:
+            vectors = kb.dense.encode(batch_terms)
+        filters = [parse_filters(query, kb.facets) for query in queries]
+        lexical = [None] * len(queries)
+        if kb.shards is not None and queries:
+            top_k = self._lexical_top_k(max_results)
+            lexical = self._lexical(kb, [
+                (terms, self._allowed_docs(kb, flt), top_k) for terms, flt in zip(batch_terms, filters)
+            ])
+        return [
+            self._search_with_filters(kb, query, terms, max_results, vector, flt, results)
+            for query, terms, vector, flt, results in zip(queries, batch_terms, vectors, filters, lexical)
+        ]
+
+    def count_by_type(self) -> Dict[str, int]:
+        """Número de documentos por tipo (curso, articulo, revista)"""
+        return self.documents.count_by_type()
+
+    def get_recommendations_context(self, query: str) -> str:
+        """Genera contexto para el asistente basado en la consulta"""
+        # Buscar documentos relevantes (con las facetas que pida la consulta)
+        return self._format_context(*self.search_with_filters(query, max_results=3))
+
+    def get_recommendations_contexts(self, queries: List[str]) -> List[str]:
+        """Contexto de cada consulta de un lote (la búsqueda se hace para todas a la vez)"""
+        return [self._format_context(*result) for result in self.search_many(queries, max_results=3)]
+
+    def _format_context(self, relevant_docs: List[DocumentView], filters: FacetFilter, relaxed: bool) -> str:
+        if not relevant_docs:
+            # Si no hay coincidencias por la consulta, devolver un resumen compacto
+            # de la base de conocimiento para que el asistente siempre tenga datos
+            # sobre Green Dream en lugar de decir que no hay información.
+            summary_lines = [
+                "🌱 **Resumen breve de la Base de Conocimiento Green Dream:**\n"
+            ]
+            # Mostrar hasta 5 títulos representativos
+            for i, doc in enumerate(self.documents[:5], 1):
+                meta = doc.metadata
+                title = (
+                    meta.get("titulo")
+                    or meta.get("nombre")
+                    or doc.source
+                    or f"Doc {i}"
+                )
+                dtype = doc.type or "recurso"
+                summary_lines.append(f"{i}. {title} ({dtype})\n")
+
+            summary_lines.append(
+                "\n💡 Usa esta información para hacer recomendaciones concretas sobre cursos, artículos y revistas de Green Dream."
+            )
+            return "\n".join(summary_lines)
+
+        context = "🌱 **INFORMACIÓN DE GREEN DREAM DISPONIBLE:**\n\n"
+        if filters:
+            context += f"🔎 **Filtros detectados en la consulta:** {filters.describe()}\n"
+            if relaxed:
+                context += "ℹ️ Ningún recurso cumple todos esos filtros; se muestran los más relacionados.\n"
+            context += "\n"
+
+        for i, doc in enumerate(relevant_docs, 1):
+            context += f"**{i}. {doc.source}**\n"
+
+            # Extraer información clave según el tipo
+            metadata = doc.metadata
+
+            for key, emoji, label in RESOURCE_FIELDS:
+                if key in metadata:
+                    context += f"{emoji} **{label}:** {metadata[key]}\n"
+
+            # Agregar el fragmento que coincidió con la consulta o, si fue la
+            # cabecera del documento, su descripción o resumen
+            field, passage = doc.passage
+            if field != HEAD:
+                context += f"📝 **Fragmento relevante ({field}):** {passage}\n"
+            elif "descripcion" in metadata:
+                context += f"📝 **Descripción:** {_truncate_words(metadata['descripcion'])}\n"
+            elif "resumen" in metadata:
+                context += f"📝 **Resumen:** {_truncate_words(metadata['resumen'])}\n"
+
+            context += "\n" + "-" * 50 + "\n\n"
+
+        context += "\n💡 **INSTRUCCIONES PARA EL ASISTENTE:**\n"
+        context += "- Usa esta información para hacer recomendaciones específicas y personalizadas\n"
+        context += "- Incluye URLs cuando sean relevantes\n"
+        context += "- Menciona precios, modalidades y niveles\n"
+        context += "- Adapta las recomendaciones al perfil del joven consultante\n"
+
+        return context
+
+    def get_fallback_answer(self, query: str, max_results: int = 3) -> str:
+        """Respuesta determinista solo con la búsqueda (sin modelo), para modo degradado"""
+        relevant_docs, _, _ = self.search_with_filters(query, max_results=max_results)
+
+        if relevant_docs:
+            answer = "🌱 **Recursos de Green Dream relacionados con tu consulta:**\n\n"
+            resources = [(doc.metadata, doc.source) for doc in relevant_docs]
+        else:
+            answer = "🌱 **Algunos recursos de Green Dream que te pueden interesar:**\n\n"
+            resources = [(doc.metadata, doc.source) for doc in self.documents[:5]]
+
+        for i, (metadata, source) in enumerate(resources, 1):
+            answer += f"**{i}. {metadata.get('titulo', source)}**\n"
+            for key, emoji, label in RESOURCE_FIELDS[1:]:
+                if key in metadata:
+                    answer += f"   {emoji} {label}: {metadata[key]}\n"
+            answer += "\n"
+
+        answer += (
+            "ℹ️ En este momento no pude generar una respuesta personalizada, así que te "
+            "muestro directamente los recursos más relevantes. Vuelve a preguntarme en unos "
+            "minutos para recibir recomendaciones adaptadas a ti."
+        )
+        return answer
+
+
+class KnowledgeBaseWatcher:
+    """Revisa en segundo plano cada ``interval`` segundos si cambiaron los JSON y recarga la base"""
+
+    def __init__(self, rag: GreenDreamRAG, interval: float = KB_RELOAD_INTERVAL_SECONDS):
+        self.rag = rag
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="kb-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Detiene la revisión; con ``timeout`` espera a que termine una recarga en curso"""
+        self._stop.set()
+        if self._thread is not None and timeout is not None:
+            self._thread.join(timeout)
+
+    def restart(self):
+        """Vuelve a lanzar el hilo (p. ej. en un worker creado con fork, que no hereda hilos)"""
+        self._stop = threading.Event()
+        self._thread = None
+        self.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.rag.reload()
+            except Exception as e:
+                print(f"❌ Error revisando la base de conocimiento: {e}")
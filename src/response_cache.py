@@ -0,0 +1,101 @@
+# response_cache.py - Caché de respuestas para preguntas repetidas
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+# Límites por defecto (configurables por variables de entorno); RESPONSE_CACHE_MAX=0 la desactiva
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX", "512"))
+DEFAULT_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_question(pregunta: str) -> str:
+    """Normaliza una pregunta: minúsculas, sin tildes, sin signos y espacios colapsados"""
+    text = unicodedata.normalize("NFKD", pregunta.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _NON_WORD_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+def make_cache_key(pregunta: str, contexto: str, **params: Any) -> str:
+    """Clave de caché: pregunta normalizada + hash del contexto RAG + parámetros del modelo"""
+    context_hash = hashlib.sha256(contexto.encode("utf-8")).hexdigest()
+    raw = json.dumps(
+        [normalize_question(pregunta), context_hash, params], sort_keys=True, default=str
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Caché LRU con expiración (TTL) de respuestas completas del modelo"""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Respuesta guardada para ``key`` (None si no existe o expiró)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, respuesta: str):
+        """Guarda una respuesta, expulsando la menos usada si se supera el límite"""
+        if not self.enabled or not respuesta:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), respuesta)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Invalida todas las respuestas (por ejemplo, al cambiar la base de conocimiento)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+            }
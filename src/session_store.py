@@ -0,0 +1,574 @@
+# session_store.py - Historial de conversación por sesión para Green Dream
+import atexit
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+# Límites por defecto (configurables por variables de entorno)
+DEFAULT_MAX_SESSIONS = int(os.getenv("SESSION_MAX", "1000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+DEFAULT_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "10"))
+
+# Sesiones compartidas entre procesos (p. ej. workers de gunicorn) en un fichero
+# SQLite; vacío = sesiones en memoria de cada proceso
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "").strip()
+# Cada cuánto se escriben en la base los turnos encolados (escritura diferida)
+SESSION_FLUSH_SECONDS = float(os.getenv("SESSION_FLUSH_SECONDS", "0.1"))
+# Cada cuánto se borran de la base las sesiones expiradas y se compacta el fichero
+SESSION_COMPACT_SECONDS = float(os.getenv("SESSION_COMPACT_SECONDS", "300"))
+
+
+@dataclass
+class Session:
+    """Historial compacto de una sesión: pares (pregunta, respuesta) en texto plano"""
+
+    session_id: str
+    turns: Deque[Tuple[str, str]]
+    created_at: float = field(default_factory=time.monotonic)
+    last_access: float = field(default_factory=time.monotonic)
+    greeted: bool = False
+
+    def approx_bytes(self) -> int:
+        """Estimación del tamaño en memoria de los textos guardados"""
+        return sum(sys.getsizeof(u) + sys.getsizeof(a) for u, a in self.turns)
+
+
+class SessionStore:
+    """Almacén de sesiones con expulsión LRU y por inactividad (TTL).
+
+    Las sesiones se mantienen en un ``OrderedDict`` ordenado por último acceso,
+    por lo que tanto la expulsión LRU como la de sesiones inactivas solo miran
+    el principio de la estructura.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_turns: int = DEFAULT_MAX_TURNS,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions_lru = 0
+        self.evictions_ttl = 0
+
+    def __len__(self) -> int:
+        """Sesiones activas (no cuenta las expiradas que aún no se han expulsado)"""
+        with self._lock:
+            return self._count_active(time.monotonic())
+
+    def _count_active(self, now: float) -> int:
+        # Misma condición que _evict_expired: activa si se usó hace menos de ttl_seconds
+        return sum(1 for s in self._sessions.values() if now - s.last_access < self.ttl_seconds)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """Devuelve la sesión indicada (creándola si no existe) y la marca como usada"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(
+                    session_id=session_id or self.new_session_id(),
+                    turns=deque(maxlen=self.max_turns),
+                )
+                self._sessions[session.session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions_lru += 1
+            else:
+                self._sessions.move_to_end(session.session_id)
+            session.last_access = now
+            return session
+
+    def get_history(self, session_id: str) -> List[Tuple[str, str]]:
+        """Copia del historial de la sesión (lista vacía si no existe)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return list(session.turns) if session else []
+
+    def append_turn(self, session_id: str, pregunta: str, respuesta: str):
+        """Guarda un turno completo; los más antiguos salen al superar ``max_turns``"""
+        session = self.get_or_create(session_id)
+        with self._lock:
+            session.turns.append((pregunta, respuesta))
+
+    def clear(self, session_id: str) -> bool:
+        """Elimina una sesión; devuelve True si existía"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def mark_greeted(self, session_id: Optional[str] = None) -> Tuple[str, bool]:
+        """Marca la sesión como saludada; devuelve ``(session_id, True si no lo estaba)``"""
+        session = self.get_or_create(session_id)
+        with self._lock:
+            first = not session.greeted
+            session.greeted = True
+            return session.session_id, first
+
+    def close(self):
+        """Libera los recursos del almacén (nada que hacer en memoria)"""
+
+    def evict_expired(self) -> int:
+        """Elimina las sesiones inactivas y devuelve cuántas se eliminaron"""
+        with self._lock:
+            return self._evict_expired(time.monotonic())
+
+    def _evict_expired(self, now: float) -> int:
+        evicted = 0
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_access < self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            evicted += 1
+        self.evictions_ttl += evicted
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de uso (sesiones activas, turnos y memoria aproximada)"""
+        with self._lock:
+            turns = sum(len(s.turns) for s in self._sessions.values())
+            approx_bytes = sum(s.approx_bytes() for s in self._sessions.values())
+            return {
+                "active_sessions": self._count_active(time.monotonic()),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "max_turns": self.max_turns,
+                "stored_turns": turns,
+                "approx_bytes": approx_bytes,
+                "evictions_lru": self.evictions_lru,
+                "evictions_ttl": self.evictions_ttl,
+            }
+
+
+@dataclass
+class _StoredSession(Session):
+    # Turnos añadidos en la base (por cualquier proceso) que ya refleja esta copia
+    version: int = 0
+    # False mientras la sesión solo existe en este proceso (creada y aún sin escribir)
+    stored: bool = False
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    greeted INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    pregunta TEXT NOT NULL,
+    respuesta TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id);
+"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sesiones compartidas por todos los procesos en un fichero SQLite (modo WAL).
+
+    - Lectura con caché: las sesiones recientes se guardan en memoria (el LRU de
+      ``SessionStore``, que aquí limita solo la caché) y en cada acceso se
+      comprueba su ``version`` en la base con una consulta por clave primaria;
+      si otro worker añadió turnos, la sesión se vuelve a leer.
+    - Escritura diferida: ``append_turn`` y los accesos solo se encolan y un
+      hilo los escribe por lotes, en una transacción, cada ``flush_seconds``.
+      El escritor usa su propia conexión y su propio lock: mientras espera el
+      bloqueo de SQLite (otro worker escribiendo) o compacta, las peticiones
+      siguen leyendo y encolando.
+    - Un hilo de fondo borra las sesiones expiradas y compacta el fichero cada
+      ``compact_seconds``; los turnos por encima de ``max_turns`` se recortan
+      al escribirlos.
+
+    Las conexiones y el hilo son por proceso: se abren al usarse por primera
+    vez en cada uno, y ``close()`` los cierra (antes de un fork, al salir).
+    Orden de los locks: ``_write_lock`` antes que ``_lock``, nunca al revés.
+    """
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        flush_seconds: float = SESSION_FLUSH_SECONDS,
+        compact_seconds: float = SESSION_COMPACT_SECONDS,
+    ):
+        super().__init__(max_sessions=max_sessions, ttl_seconds=ttl_seconds, max_turns=max_turns)
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.compact_seconds = compact_seconds
+        # Operaciones pendientes de escribir, en orden: ("touch", id, creada, acceso, saludada),
+        # ("turn", id, pregunta, respuesta, hora) y ("clear", id)
+        self._pending: List[tuple] = []
+        # Operaciones que el escritor está guardando ahora (fuera de _pending)
+        self._writing: List[tuple] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        # Conexión y lock del escritor (flush y compact)
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._write_pid: Optional[int] = None
+        self._write_lock = threading.Lock()
+        self._inherited: List[sqlite3.Connection] = []
+        self._pid: Optional[int] = None
+        self._writer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_compaction = time.monotonic()
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.reloads = 0
+        self.flush_errors = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            # Crea el fichero y las tablas al arrancar: un error de ruta se ve enseguida
+            self._connection()
+        atexit.register(self.close)
+
+    # --- conexión y escritura diferida -------------------------------------
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        # Solo tiene efecto en una base nueva: permite devolver páginas libres al compactar
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # Con WAL los lectores no esperan al escritor; NORMAL no sincroniza el disco en cada commit
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión de lectura de este proceso (con ``_lock`` tomado); tras un fork se abre otra"""
+        if self._conn is None or self._pid != os.getpid():
+            if self._conn is not None:
+                # Heredada por fork: cerrarla liberaría los bloqueos de fichero de este
+                # proceso (son por proceso en POSIX), así que se conserva sin usarla
+                self._inherited.append(self._conn)
+            conn = self._open()
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+            # Los hilos no sobreviven a un fork: el escritor se vuelve a crear en cada proceso
+            self._writer = None
+        return self._conn
+
+    def _write_connection(self) -> sqlite3.Connection:
+        """Conexión del escritor (con ``_write_lock`` tomado)"""
+        if self._write_conn is None or self._write_pid != os.getpid():
+            if self._write_conn is not None:
+                self._inherited.append(self._write_conn)
+            self._write_conn = self._open()
+            self._write_pid = os.getpid()
+        return self._write_conn
+
+    def _enqueue(self, op: tuple):
+        """Encola una escritura (con el lock tomado) y arranca el escritor si hace falta"""
+        last = self._pending[-1] if self._pending else None
+        if op[0] == "touch" and last is not None and last[0] == "touch" and last[1] == op[1]:
+            # Accesos seguidos a la misma sesión: basta con escribir el último
+            op = (*op[:2], last[2], op[3], op[4] or last[4])
+            self._pending[-1] = op
+        else:
+            self._pending.append(op)
+        if self._writer is None or self._pid != os.getpid():
+            self._connection()
+            self._stop.clear()
+            self._writer = threading.Thread(target=self._run_writer, name="session-writer", daemon=True)
+            self._writer.start()
+
+    def _run_writer(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+                if time.monotonic() - self._last_compaction >= self.compact_seconds:
+                    self.compact()
+            except sqlite3.Error as exc:
+                self.flush_errors += 1
+                print(f"⚠️ Error al guardar sesiones en {self.path}: {exc}")
+
+    def flush(self) -> int:
+        """Escribe en una transacción las operaciones encoladas y devuelve cuántas eran"""
+        with self._write_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        """``flush`` con ``_write_lock`` tomado; ``_lock`` solo se toma para sacar y anotar las operaciones"""
+        with self._lock:
+            ops, self._pending = self._pending, []
+            self._writing = ops
+        if not ops:
+            return 0
+        conn = self._write_connection()
+        try:
+            versions, added = self._write(conn, ops)
+            with self._lock:
+                # El COMMIT (sin esperas: el bloqueo de escritura ya es nuestro) y la
+                # limpieza de _writing van juntos: una relectura no ve los turnos dos veces
+                conn.execute("COMMIT")
+                self._writing = []
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._lock:
+                # Se reintentan en el siguiente flush, antes que las encoladas mientras tanto
+                self._pending[:0] = ops
+                self._writing = []
+            raise
+        with self._lock:
+            for op in ops:
+                session = self._sessions.get(op[1])
+                if op[0] == "touch" and session is not None:
+                    session.stored = True
+            for session_id, version in versions.items():
+                session = self._sessions.get(session_id)
+                # Si nadie más escribió en la sesión la copia sigue al día; si no, se relee en el próximo acceso
+                if session is not None and session.version + added[session_id] == version:
+                    session.version = version
+            self.flushes += 1
+            self.flushed_ops += len(ops)
+        return len(ops)
+
+    def _write(self, conn: sqlite3.Connection, ops: List[tuple]) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Aplica ``ops`` en una transacción sin confirmar; devuelve la versión y los turnos añadidos por sesión"""
+        added: Dict[str, int] = {}
+        conn.execute("BEGIN IMMEDIATE")
+        for op in ops:
+            kind, session_id = op[0], op[1]
+            if kind == "touch":
+                conn.execute(
+                    "INSERT INTO sessions (session_id, created_at, last_access, greeted) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET "
+                    "last_access = max(last_access, excluded.last_access), "
+                    "greeted = max(greeted, excluded.greeted)",
+                    (session_id, op[2], op[3], int(op[4])),
+                )
+            elif kind == "turn":
+                conn.execute(
+                    "INSERT INTO turns (session_id, pregunta, respuesta, created_at) VALUES (?, ?, ?, ?)",
+                    (session_id, op[2], op[3], op[4]),
+                )
+                conn.execute("UPDATE sessions SET version = version + 1 WHERE session_id = ?", (session_id,))
+                added[session_id] = added.get(session_id, 0) + 1
+            else:
+                conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                added.pop(session_id, None)
+        versions = {}
+        for session_id in added:
+            # Solo se guardan los últimos max_turns turnos de cada sesión
+            conn.execute(
+                "DELETE FROM turns WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_turns),
+            )
+            row = conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            versions[session_id] = row[0] if row else 0
+        return versions, added
+
+    def compact(self) -> int:
+        """Borra de la base las sesiones expiradas y devuelve el espacio libre al sistema"""
+        with self._write_lock:
+            conn = self._write_connection()
+            cutoff = time.time() - self.ttl_seconds
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM turns WHERE session_id IN (SELECT session_id FROM sessions WHERE last_access < ?)",
+                    (cutoff,),
+                )
+                expired = conn.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,)).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            # executescript ejecuta el pragma hasta el final (execute solo liberaría una página)
+            conn.executescript("PRAGMA incremental_vacuum;")
+            # Vuelca el WAL en la base y lo trunca (si ningún lector lo está usando)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._last_compaction = time.monotonic()
+            return expired
+
+    def close(self):
+        """Escribe lo pendiente, detiene el escritor y cierra las conexiones de este proceso"""
+        writer = self._writer
+        if writer is not None and self._pid == os.getpid():
+            self._stop.set()
+            writer.join(timeout=10)
+        with self._write_lock:
+            if self._conn is not None and self._pid == os.getpid():
+                try:
+                    self._flush()
+                except sqlite3.Error as exc:
+                    print(f"⚠️ Error al cerrar las sesiones en {self.path}: {exc}")
+            if self._write_conn is not None and self._write_pid == os.getpid():
+                self._write_conn.close()
+                self._write_conn = None
+            with self._lock:
+                if self._conn is not None and self._pid == os.getpid():
+                    self._conn.close()
+                    self._conn = None
+                self._writer = None
+
+    # --- lectura con caché ---------------------------------------------------
+
+    def _fresh(self, session_id: str) -> Optional[_StoredSession]:
+        """Sesión al día con la base (con el lock tomado); None si no existe o expiró"""
+        row = self._connection().execute(
+            "SELECT created_at, last_access, greeted, version FROM sessions WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        session = self._sessions.get(session_id)
+        if row is None or time.time() - row[1] >= self.ttl_seconds:
+            if row is None and session is not None and not session.stored:
+                # Creada aquí y aún sin escribir
+                return session
+            self._sessions.pop(session_id, None)
+            if row is None and session is not None:
+                # Otro proceso la borró: lo pendiente de este tampoco debe llegar a la base
+                self._pending = [op for op in self._pending if op[1] != session_id]
+            if row is not None:
+                # Expirada en la base pero aún sin borrar: no debe reaparecer su historial
+                self._enqueue(("clear", session_id))
+            return None
+        _, _, greeted, version = row
+        if session is None or version > session.version:
+            rows = self._connection().execute(
+                "SELECT pregunta, respuesta FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, self.max_turns),
+            ).fetchall()
+            turns = deque(reversed(rows), maxlen=self.max_turns)
+            # Turnos de este proceso que aún no están en la base (o se están escribiendo)
+            turns.extend(
+                (op[2], op[3]) for op in self._writing + self._pending if op[0] == "turn" and op[1] == session_id
+            )
+            fresh = _StoredSession(
+                session_id=session_id, turns=turns, greeted=bool(greeted), version=version, stored=True
+            )
+            if session is not None:
+                fresh.created_at = session.created_at
+                fresh.greeted = fresh.greeted or session.greeted
+            self._sessions[session_id] = fresh
+            self.reloads += 1
+            return fresh
+        if greeted:
+            session.greeted = True
+        return session
+
+    # --- interfaz de SessionStore --------------------------------------------
+
+    def __len__(self) -> int:
+        """Sesiones activas en la base (de todos los procesos)"""
+        with self._lock:
+            cutoff = time.time() - self.ttl_seconds
+            row = self._connection().execute(
+                "SELECT count(*) FROM sessions WHERE last_access > ?", (cutoff,)
+            ).fetchone()
+            return row[0]
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return self._fresh(session_id) is not None
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._fresh(session_id) if session_id else None
+            if session is None:
+                session = _StoredSession(
+                    session_id=session_id or self.new_session_id(),
+                    turns=deque(maxlen=self.max_turns),
+                )
+                self._sessions[session.session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    # Solo sale de la caché: la sesión sigue en la base
+                    self._sessions.popitem(last=False)
+                    self.evictions_lru += 1
+            self._sessions.move_to_end(session.session_id)
+            session.last_access = now
+            wall = time.time()
+            self._enqueue(("touch", session.session_id, wall, wall, session.greeted))
+            return session
+
+    def get_history(self, session_id: str) -> List[Tuple[str, str]]:
+        with self._lock:
+            session = self._fresh(session_id)
+            return list(session.turns) if session else []
+
+    def append_turn(self, session_id: str, pregunta: str, respuesta: str):
+        session = self.get_or_create(session_id)
+        with self._lock:
+            session.turns.append((pregunta, respuesta))
+            self._enqueue(("turn", session.session_id, pregunta, respuesta, time.time()))
+
+    def clear(self, session_id: str) -> bool:
+        with self._lock:
+            existed = self._fresh(session_id) is not None
+            self._sessions.pop(session_id, None)
+            # Los turnos aún no escritos de esta sesión ya no deben llegar a la base
+            self._pending = [op for op in self._pending if op[1] != session_id]
+            self._enqueue(("clear", session_id))
+            return existed
+
+    def mark_greeted(self, session_id: Optional[str] = None) -> Tuple[str, bool]:
+        session = self.get_or_create(session_id)
+        with self._lock:
+            first = not session.greeted
+            if first:
+                session.greeted = True
+                wall = time.time()
+                self._enqueue(("touch", session.session_id, wall, wall, True))
+            return session.session_id, first
+
+    def evict_expired(self) -> int:
+        """Expulsa de la caché las sesiones inactivas y borra de la base las expiradas"""
+        with self._lock:
+            evicted = self._evict_expired(time.monotonic())
+        return evicted + self.compact()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        active = len(self)
+        with self._lock:
+            stats.update({
+                "backend": "sqlite",
+                "path": self.path,
+                "active_sessions": active,
+                "cached_sessions": len(self._sessions),
+                "pending_writes": len(self._pending) + len(self._writing),
+                "flushes": self.flushes,
+                "flushed_ops": self.flushed_ops,
+                "flush_errors": self.flush_errors,
+                "reloads": self.reloads,
+            })
+        return stats
+
+
+def create_session_store(path: Optional[str] = None) -> SessionStore:
+    """Almacén de sesiones según SESSION_DB_PATH: en SQLite compartido o en memoria"""
+    path = SESSION_DB_PATH if path is None else path
+    if path:
+        print(f"💬 Sesiones compartidas en SQLite: {path}")
+        return SQLiteSessionStore(path)
+    return SessionStore()
@@ -0,0 +1,371 @@
+# sharded_search.py - Búsqueda BM25 repartida entre procesos (scatter-gather)
+import heapq
+import itertools
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from multiprocessing.connection import Connection, wait
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from rag_system import BM25Index
+
+# Consulta de un lote: (términos, doc_ids permitidos o None, top_k)
+ShardQuery = Tuple[List[str], Optional[Set[int]], int]
+
+# Segundos que se espera la respuesta de los procesos a un lote antes de puntuar en el hilo
+RAG_SHARD_TIMEOUT_SECONDS = float(os.getenv("RAG_SHARD_TIMEOUT_SECONDS", "2"))
+# Tras un fallo, segundos en los que se puntúa en el hilo antes de volver a crear los procesos
+RAG_SHARD_RESTART_SECONDS = float(os.getenv("RAG_SHARD_RESTART_SECONDS", "5"))
+# Juegos de conexiones con los procesos: búsquedas que pueden estar en curso a la vez
+RAG_SHARD_CHANNELS = int(os.getenv("RAG_SHARD_CHANNELS", "4"))
+
+
+def _detach(values):
+    """Copia a un array las vistas del snapshot (mmap), que no se pueden serializar"""
+    return array(values.format, values.tobytes()) if isinstance(values, memoryview) else values
+
+
+def _context():
+    """Contexto con el que se crean los procesos: ``fork`` solo si este es el único hilo.
+
+    Un fork con otros hilos vivos (el vigilante que recarga la base, una petición
+    que reinicia los procesos) copia los locks que esos hilos tengan tomados y el
+    hijo puede quedarse bloqueado en ellos. En ese caso los procesos se crean desde
+    ``forkserver``, que no tiene hilos, y reciben su fragmento serializado.
+    """
+    if threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    context = multiprocessing.get_context("forkserver")
+    # El servidor importa este módulo (y rag_system) una vez, no cada proceso
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class ShardError(RuntimeError):
+    """Un proceso de búsqueda no respondió (terminó, se cerró su conexión o superó el plazo)"""
+
+
+class ShardIndex(BM25Index):
+    """Parte de un ``BM25Index``: postings de los pasajes ``[first, last)`` con las estadísticas globales.
+
+    El IDF y la normalización por longitud se calculan con los números de
+    todo el corpus, de modo que las puntuaciones son las mismas que las del
+    índice completo y los top-k de cada fragmento se pueden mezclar.
+    Los postings están ordenados por pasaje (se añaden en orden creciente),
+    así que la parte de cada término se obtiene con búsqueda binaria.
+    """
+
+    def __init__(self, index: BM25Index, first: int, last: int):
+        super().__init__(index.k1, index.b)
+        self.num_docs = index.num_docs
+        self.total_length = index.total_length
+        self._norms = index._doc_norms()
+        self._idf: Dict[str, float] = {}
+        for term, doc_ids, tfs in index.iter_postings():
+            start, end = bisect_left(doc_ids, first), bisect_left(doc_ids, last)
+            if start < end:
+                self.postings[term] = (doc_ids[start:end], tfs[start:end])
+                self._idf[term] = index.idf(term)
+
+    def add_document(self, doc_id, terms):
+        raise TypeError("Los fragmentos del índice son de solo lectura")
+
+    def _doc_norms(self):
+        return self._norms
+
+    def idf(self, term: str) -> float:
+        return self._idf.get(term, 0.0)
+
+    def __getstate__(self):
+        # Para los procesos creados sin fork: los postings del snapshot son vistas del mmap
+        state = dict(self.__dict__)
+        state["postings"] = {term: (_detach(doc_ids), _detach(tfs)) for term, (doc_ids, tfs) in self.postings.items()}
+        state["_norms"] = _detach(self._norms)
+        return state
+
+
+def _shard_main(conns, parent_conns, index: BM25Index, passage_parents, passage_offsets, first_doc: int, last_doc: int):
+    """Bucle de un proceso de búsqueda: recibe lotes de consultas por cualquiera de sus conexiones y devuelve el top-k de cada una"""
+    # Los extremos del padre heredados con el fork se cierran: si el padre muere, recv() da EOF
+    for parent_conn in parent_conns:
+        parent_conn.close()
+    # Sin los manejadores de señales heredados (p. ej. los de un worker de gunicorn):
+    # SIGTERM termina el proceso y Ctrl+C lo resuelve el padre
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Con fork llega el índice completo (compartido con el padre); si no, solo el fragmento
+    shard = index if isinstance(index, ShardIndex) else ShardIndex(index, passage_offsets[first_doc], passage_offsets[last_doc])
+    del index
+    conns = list(conns)
+    conns[0].send(True)
+    while conns:
+        for conn in wait(conns):
+            try:
+                batch = conn.recv()
+            except (EOFError, OSError):
+                batch = None
+            if batch is None:
+                conn.close()
+                conns.remove(conn)
+                continue
+            results = []
+            for terms, allowed_docs, top_k in batch:
+                allowed = None
+                if allowed_docs is not None:
+                    allowed = {
+                        passage_id
+                        for doc_id in allowed_docs
+                        for passage_id in range(passage_offsets[doc_id], passage_offsets[doc_id + 1])
+                    }
+                results.append(shard.search_grouped(terms, passage_parents, top_k, allowed))
+            try:
+                conn.send(results)
+            except OSError:
+                conn.close()
+                conns.remove(conn)
+
+
+class _Shard:
+    __slots__ = ("first_doc", "last_doc", "process")
+
+    def __init__(self, first_doc, last_doc, process):
+        self.first_doc = first_doc
+        self.last_doc = last_doc
+        self.process = process
+
+
+class ShardedSearch:
+    """Índice BM25 repartido en ``n_shards`` procesos, cada uno con un rango de documentos.
+
+    Los procesos se crean con ``fork`` a partir del índice ya cargado (no se
+    vuelve a leer ni a tokenizar la base) y cada uno se queda solo con los
+    postings de sus documentos. Si hay otros hilos vivos (recarga en caliente,
+    reinicio desde una petición) se crean con ``forkserver`` y el fragmento de
+    cada uno se prepara aquí y se le envía serializado. Cada lote de consultas se envía a todos los
+    procesos (scatter), que puntúan su parte en paralelo, y sus top-k se
+    mezclan con un heap (gather): el resultado es el mismo que el de
+    ``BM25Index.search_grouped`` sobre el índice completo.
+
+    Cada proceso atiende ``channels`` conexiones: una búsqueda toma un juego
+    libre (una conexión por proceso) y lo devuelve al terminar, de modo que
+    hasta ``channels`` búsquedas pueden estar en curso a la vez sin mezclar
+    sus respuestas. El lock solo protege el reparto de juegos y los reinicios.
+
+    Si un proceso no responde en ``timeout`` segundos o falla su conexión, se
+    terminan todos (sus conexiones pueden tener respuestas sin leer), la
+    búsqueda lanza ``ShardError`` y el llamador puntúa en su hilo; pasados
+    ``restart_delay`` segundos, la siguiente búsqueda vuelve a crearlos.
+    """
+
+    def __init__(
+        self,
+        index: BM25Index,
+        passage_parents,
+        passage_offsets,
+        n_shards: int,
+        timeout: float = RAG_SHARD_TIMEOUT_SECONDS,
+        restart_delay: float = RAG_SHARD_RESTART_SECONDS,
+        channels: int = RAG_SHARD_CHANNELS,
+    ):
+        # Las normas se calculan antes del fork para que todos los procesos compartan esas páginas
+        index._doc_norms()
+        self._index = index
+        self._passage_parents = passage_parents
+        self._passage_offsets = passage_offsets
+        self.n_shards = n_shards
+        self.timeout = timeout
+        self.restart_delay = restart_delay
+        self.channels = max(1, channels)
+        self._lock = threading.Condition()
+        self._ready = False
+        self._closed = False
+        self._failed_at: Optional[float] = None
+        self.restarts = 0
+        # Método con el que se crearon los procesos la última vez ("fork" o "forkserver")
+        self.start_method: Optional[str] = None
+        self._shards: List[_Shard] = []
+        # Juegos de conexiones (una por proceso): todos y los que no usa ninguna búsqueda
+        self._channels: List[List[Connection]] = []
+        self._free: List[List[Connection]] = []
+        # Cambia al terminar los procesos: los juegos prestados de antes ya no se devuelven
+        self._generation = 0
+        self._start()
+
+    def _start(self):
+        """Crea los procesos de búsqueda (con el lock tomado o desde el constructor)"""
+        context = _context()
+        self.start_method = context.get_start_method()
+        forked = self.start_method == "fork"
+        passage_parents, passage_offsets = self._passage_parents, self._passage_offsets
+        if not forked:
+            passage_parents, passage_offsets = _detach(passage_parents), _detach(passage_offsets)
+        self._ready = False
+        self._shards = []
+        self._channels = [[] for _ in range(self.channels)]
+        parent_conns = []
+        bounds = self._split(self._passage_offsets, self.n_shards)
+        for number, (first_doc, last_doc) in enumerate(zip(bounds, bounds[1:])):
+            pipes = [context.Pipe() for _ in range(self.channels)]
+            index = self._index
+            if forked:
+                parent_conns += [parent_conn for parent_conn, _ in pipes]
+            else:
+                index = ShardIndex(index, passage_offsets[first_doc], passage_offsets[last_doc])
+            process = context.Process(
+                target=_shard_main,
+                args=(
+                    [child_conn for _, child_conn in pipes], parent_conns,
+                    index, passage_parents, passage_offsets, first_doc, last_doc,
+                ),
+                name=f"rag-shard-{number}",
+                daemon=True,
+            )
+            process.start()
+            for channel, (parent_conn, child_conn) in zip(self._channels, pipes):
+                child_conn.close()
+                channel.append(parent_conn)
+            self._shards.append(_Shard(first_doc, last_doc, process))
+        self._free = list(self._channels)
+
+    @staticmethod
+    def _split(passage_offsets: Sequence[int], n_shards: int) -> List[int]:
+        """Límites de documentos que reparten los pasajes en partes similares"""
+        n_docs = len(passage_offsets) - 1
+        total = passage_offsets[-1]
+        bounds = [0]
+        for shard in range(1, n_shards):
+            doc_id = bisect_left(passage_offsets, math.ceil(total * shard / n_shards))
+            bounds.append(min(max(doc_id, bounds[-1]), n_docs))
+        bounds.append(n_docs)
+        return bounds
+
+    def __len__(self) -> int:
+        return self.n_shards
+
+    def search(self, queries: List[ShardQuery]) -> List[List[tuple]]:
+        """``[(score, doc_id, passage_id), ...]`` de cada consulta del lote, en un solo viaje por proceso"""
+        with self._lock:
+            channel, shards, generation = self._checkout()
+
+        batches = [[] for _ in shards]
+        for terms, allowed_docs, top_k in queries:
+            allowed = sorted(allowed_docs) if allowed_docs is not None else None
+            for shard, batch in zip(shards, batches):
+                if allowed is not None:
+                    part = allowed[bisect_left(allowed, shard.first_doc):bisect_left(allowed, shard.last_doc)]
+                    batch.append((terms, part, top_k))
+                else:
+                    batch.append((terms, None, top_k))
+        try:
+            # Un lote a la vez por juego de conexiones: cada respuesta es la del lote enviado
+            for conn, batch in zip(channel, batches):
+                conn.send(batch)
+            deadline = time.monotonic() + self.timeout
+            partials = []
+            for shard, conn in zip(shards, channel):
+                if not conn.poll(max(0.0, deadline - time.monotonic())):
+                    raise TimeoutError(f"{shard.process.name} no respondió en {self.timeout:.1f}s")
+                partials.append(conn.recv())
+        except (EOFError, OSError, TimeoutError) as e:
+            with self._lock:
+                self._close_channel(channel)
+                if generation == self._generation:
+                    self._fail(e)
+            raise ShardError(f"Proceso de búsqueda no disponible: {e}") from e
+        with self._lock:
+            if generation == self._generation:
+                self._free.append(channel)
+                self._lock.notify()
+            else:
+                self._close_channel(channel)
+
+        return [
+            list(itertools.islice(heapq.merge(*(partial[i] for partial in partials), reverse=True), top_k))
+            for i, (_, _, top_k) in enumerate(queries)
+        ]
+
+    def _checkout(self):
+        """Toma un juego de conexiones libre (con el lock tomado): ``(juego, procesos, generación)``"""
+        if self._closed:
+            raise ShardError("Procesos de búsqueda cerrados")
+        if not self._shards:
+            if time.monotonic() - self._failed_at < self.restart_delay:
+                raise ShardError("Procesos de búsqueda reiniciándose")
+            self.restarts += 1
+            self._start()
+        if not self._ready:
+            # Mientras los procesos preparan su fragmento, la consulta se resuelve en el hilo
+            # (ningún juego se presta hasta entonces: el primero sigue libre)
+            ready_conns = self._channels[0]
+            if not all(conn.poll() for conn in ready_conns):
+                raise ShardError("Procesos de búsqueda todavía preparándose")
+            try:
+                for conn in ready_conns:
+                    conn.recv()
+            except (EOFError, OSError) as e:
+                self._fail(e)
+                raise ShardError(f"Proceso de búsqueda no disponible: {e}") from e
+            self._ready = True
+        generation = self._generation
+        deadline = time.monotonic() + self.timeout
+        while not self._free:
+            # Todos los juegos en uso: se espera a que se libere uno (o se puntúa en el hilo)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ShardError("Procesos de búsqueda ocupados")
+            self._lock.wait(remaining)
+            if self._closed or generation != self._generation:
+                raise ShardError("Procesos de búsqueda reiniciándose")
+        return self._free.pop(), self._shards, generation
+
+    def _fail(self, error: BaseException):
+        """Descarta los procesos tras un fallo (con el lock tomado)"""
+        self._terminate()
+        self._failed_at = time.monotonic()
+        print(f"⚠️ Búsqueda repartida no disponible, se puntúa en el hilo: {error}")
+
+    @staticmethod
+    def _close_channel(channel: List[Connection]):
+        for conn in channel:
+            conn.close()
+
+    def _terminate(self):
+        """Mata los procesos sin esperar respuesta (con el lock tomado): alguno puede estar colgado.
+
+        Las búsquedas con un juego prestado reciben EOF y lo cierran al devolverlo.
+        """
+        self._generation += 1
+        for shard in self._shards:
+            shard.process.kill()
+        for shard in self._shards:
+            shard.process.join(timeout=1)
+        for channel in self._free:
+            self._close_channel(channel)
+        self._shards, self._channels, self._free = [], [], []
+        self._lock.notify_all()
+
+    def close(self):
+        """Termina los procesos de búsqueda (los que atienden una búsqueda, al acabarla)"""
+        with self._lock:
+            self._closed = True
+            self._generation += 1
+            for channel in self._free:
+                for conn in channel:
+                    try:
+                        conn.send(None)
+                        conn.close()
+                    except OSError:
+                        pass
+            shards = self._shards
+            self._shards, self._channels, self._free = [], [], []
+            self._lock.notify_all()
+        # Fuera del lock: las búsquedas en curso devuelven su juego y los procesos salen
+        for shard in shards:
+            shard.process.join(timeout=1)
+            if shard.process.is_alive():
+                shard.process.terminate()
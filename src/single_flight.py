@@ -0,0 +1,294 @@
+# single_flight.py - Agrupación de peticiones idénticas concurrentes al modelo
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+
+class FirstFragmentTimeout(TimeoutError):
+    """El modelo no empezó a responder dentro del plazo indicado"""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"El modelo no empezó a responder en {timeout:.1f}s")
+        self.timeout = timeout
+
+
+class _Flight:
+    """Llamada en curso compartida por todas las peticiones con la misma clave"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.fragments: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.result: Any = None
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """Comparte una sola llamada al modelo entre peticiones idénticas simultáneas.
+
+    ``do`` agrupa llamadas sin streaming: la primera ejecuta la función y las
+    demás esperan su resultado. ``stream`` agrupa llamadas con streaming: un
+    hilo consume el stream del modelo y reparte cada fragmento a todos los
+    suscriptores (los que llegan tarde reciben primero lo ya generado). Si todos
+    los suscriptores se van, el stream del modelo se cierra.
+    Con ``key=None`` no se agrupa nada. ``first_timeout`` limita la espera del
+    primer fragmento (lanza ``FirstFragmentTimeout``).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Optional[str], fn: Callable[[], Any]) -> Any:
+        if key is None:
+            return fn()
+
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                flight.result = fn()
+                return flight.result
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                with flight.cond:
+                    flight.done = True
+                    flight.cond.notify_all()
+
+        with flight.cond:
+            while not flight.done:
+                flight.cond.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stream(
+        self,
+        key: Optional[str],
+        factory: Callable[[], Iterator[str]],
+        first_timeout: Optional[float] = None,
+    ) -> Iterator[str]:
+        if key is None and first_timeout is None:
+            yield from factory()
+            return
+
+        with self._lock:
+            flight = self._streams.get(key) if key is not None else None
+            start = flight is None
+            if start:
+                flight = _Flight()
+                if key is not None:
+                    self._streams[key] = flight
+                    self.leaders += 1
+            else:
+                self.coalesced += 1
+            with flight.cond:
+                flight.subscribers += 1
+
+        if start:
+            threading.Thread(
+                target=self._pump, args=(key, flight, factory), daemon=True
+            ).start()
+
+        deadline = time.monotonic() + first_timeout if first_timeout else None
+        sent = 0
+        try:
+            while True:
+                with flight.cond:
+                    while sent >= len(flight.fragments) and not flight.done:
+                        if deadline is not None and sent == 0:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise FirstFragmentTimeout(first_timeout)
+                            flight.cond.wait(remaining)
+                        else:
+                            flight.cond.wait()
+                    pending = flight.fragments[sent:]
+                    done = flight.done
+                sent += len(pending)
+                for fragment in pending:
+                    yield fragment
+                if done:
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            with flight.cond:
+                flight.subscribers -= 1
+
+    def _pump(self, key: str, flight: _Flight, factory: Callable[[], Iterator[str]]):
+        """Consume el stream del modelo y lo reparte a los suscriptores"""
+        upstream = None
+        try:
+            upstream = factory()
+            for fragment in upstream:
+                with flight.cond:
+                    flight.fragments.append(fragment)
+                    flight.cond.notify_all()
+                    idle = flight.subscribers == 0
+                if idle and self._abandon(key, flight):
+                    break
+        except BaseException as e:
+            flight.error = e
+        finally:
+            close = getattr(upstream, "close", None)
+            if close:
+                close()
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _abandon(self, key: str, flight: _Flight) -> bool:
+        """Retira el stream si ya no tiene suscriptores (nadie nuevo puede unirse)"""
+        with self._lock:
+            with flight.cond:
+                if flight.subscribers:
+                    return False
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._streams),
+            }
+
+
+class _AsyncFlight:
+    def __init__(self):
+        self.fragments: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class AsyncSingleFlight:
+    """Versión asyncio de ``SingleFlight`` (un único event loop por proceso)"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _AsyncFlight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Optional[str], coro_factory: Callable[[], Any]) -> Any:
+        if key is None:
+            return await coro_factory()
+
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(coro_factory())
+            task.add_done_callback(lambda t: self._forget(self._calls, key, t))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        # shield: si un cliente cancela, la llamada sigue para los demás
+        return await asyncio.shield(task)
+
+    async def stream(
+        self,
+        key: Optional[str],
+        factory: Callable[[], AsyncIterator[str]],
+        first_timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        if key is None and first_timeout is None:
+            upstream = factory()
+            try:
+                async for fragment in upstream:
+                    yield fragment
+            finally:
+                await upstream.aclose()
+            return
+
+        flight = self._streams.get(key) if key is not None else None
+        if flight is None:
+            flight = _AsyncFlight()
+            if key is not None:
+                self._streams[key] = flight
+                self.leaders += 1
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory))
+        else:
+            self.coalesced += 1
+        flight.subscribers += 1
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + first_timeout if first_timeout else None
+        sent = 0
+        try:
+            while True:
+                if sent < len(flight.fragments):
+                    fragment = flight.fragments[sent]
+                    sent += 1
+                    yield fragment
+                elif flight.done:
+                    break
+                elif deadline is not None and sent == 0:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise FirstFragmentTimeout(first_timeout)
+                    try:
+                        await asyncio.wait_for(flight.changed.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        raise FirstFragmentTimeout(first_timeout) from None
+                else:
+                    await flight.changed.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+
+    async def _pump(self, key: str, flight: _AsyncFlight, factory):
+        upstream = factory()
+        try:
+            async for fragment in upstream:
+                flight.fragments.append(fragment)
+                flight.notify()
+                if flight.subscribers == 0:
+                    break
+        except BaseException as e:
+            flight.error = e
+        finally:
+            self._forget(self._streams, key, flight)
+            flight.done = True
+            flight.notify()
+            await upstream.aclose()
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, value: Any):
+        if registry.get(key) is value:
+            del registry[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
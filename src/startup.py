@@ -0,0 +1,93 @@
+# startup.py - Arranque de la API: fases medidas y ganchos para preload-and-fork
+#
+# Con gunicorn y preload_app (ver gunicorn.conf.py) la app se importa una vez en
+# el proceso maestro: la base de conocimiento y sus índices quedan en memoria y
+# los workers los heredan al hacer fork (páginas compartidas copy-on-write).
+# Lo que no sobrevive a un fork (hilos, conexiones, procesos de búsqueda) se
+# cierra en prepare_fork() y cada worker lo vuelve a crear en after_fork().
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from metrics import REGISTRY
+
+# Calentar índices y conexión con el modelo antes de atender peticiones (0 lo desactiva)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1").strip().lower() not in ("0", "false", "no")
+# gunicorn.conf.py lo activa con preload: la app se importa en el maestro, que no
+# atiende peticiones, así que la conexión con el modelo se calienta en cada worker
+STARTUP_PRELOAD = os.getenv("STARTUP_PRELOAD") == "1"
+
+
+class StartupTimeline:
+    """Duración de cada fase del arranque (las fases pueden anidarse)"""
+
+    def __init__(self):
+        # (fase, segundos, nivel de anidación, pid que la ejecutó)
+        self.phases: List[Tuple[str, float, int, int]] = []
+        self._depth = 0
+        self._before_fork: List[Callable[[], None]] = []
+        self._after_fork: List[Callable[[], None]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        position = len(self.phases)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            # Se inserta en la posición de inicio para que las fases anidadas queden debajo
+            self.phases.insert(position, (name, time.perf_counter() - start, self._depth, os.getpid()))
+
+    def seconds(self) -> Dict[Tuple[str, str], float]:
+        """Segundos por ``(fase, proceso)``; proceso es "parent" para las fases heredadas del maestro"""
+        pid = os.getpid()
+        totals: Dict[Tuple[str, str], float] = {}
+        for name, seconds, _, phase_pid in self.phases:
+            key = (name, "self" if phase_pid == pid else "parent")
+            totals[key] = totals.get(key, 0.0) + seconds
+        return totals
+
+    def report(self):
+        pid = os.getpid()
+        total = sum(seconds for _, seconds, depth, _ in self.phases if depth == 0)
+        print(f"⏱️ Arranque (pid {pid}): {total:.3f} s")
+        for name, seconds, depth, phase_pid in self.phases:
+            where = "" if phase_pid == pid else " (proceso maestro)"
+            print(f"   {'  ' * depth}{name:<{20 - 2 * depth}} {seconds:.3f} s{where}")
+
+    def on_fork(self, before: Callable[[], None] = None, after: Callable[[], None] = None):
+        """Registra qué cerrar en el maestro antes del fork y qué recrear en cada worker"""
+        if before is not None:
+            self._before_fork.append(before)
+        if after is not None:
+            self._after_fork.append(after)
+
+    def prepare_fork(self):
+        """En el proceso maestro, después de cargar la app y antes de crear los workers"""
+        if not self._before_fork:
+            # Sin preload el maestro no cargó la app: no hay nada que preparar
+            return
+        with self.phase("prepare_fork"):
+            for callback in self._before_fork:
+                callback()
+
+    def after_fork(self):
+        """En cada worker recién creado"""
+        if not self._after_fork:
+            # Sin preload la app todavía no se cargó: lo hará el worker al importarla
+            return
+        with self.phase("after_fork"):
+            for callback in self._after_fork:
+                callback()
+        self.report()
+
+
+STARTUP = StartupTimeline()
+
+REGISTRY.register_callback(
+    "greendream_startup_phase_seconds", "Duración de cada fase del arranque del proceso", "gauge",
+    STARTUP.seconds, labelnames=("phase", "process"),
+)
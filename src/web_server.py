@@ -1,44 +1,299 @@
 #!/usr/bin/env python3
 """
 web_server.py - Servidor HTTP para servir la página web de Green Dream
+
+Atiende cada conexión en su propio hilo (con keep-alive) y sirve los archivos
+desde memoria: se comprimen con gzip/brotli al arrancar y se responden con
+ETag, Last-Modified y Cache-Control, devolviendo 304 cuando el navegador ya
+tiene la versión actual.
 """
+import argparse
+import email.utils
+import gzip
+import hashlib
 import http.server
-import socketserver
-import webbrowser
+import mimetypes
+import os
 import threading
 import time
-import os
+import webbrowser
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin brotli solo se ofrece gzip
+    brotli = None
+
+# Archivos hasta este tamaño se guardan (y comprimen) en memoria; los mayores se leen del disco
+STATIC_MAX_INLINE_BYTES = int(os.getenv("STATIC_MAX_INLINE_BYTES", str(1024 * 1024)))
+# Segundos que el navegador puede reutilizar imágenes y otros recursos sin preguntar
+# (las páginas HTML se revalidan siempre con ETag)
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+# Segundos que se mantiene abierta una conexión keep-alive sin peticiones
+STATIC_KEEPALIVE_TIMEOUT = int(os.getenv("STATIC_KEEPALIVE_TIMEOUT", "15"))
+
+# Solo se publican estos tipos de archivo, fuera de las carpetas del backend
+STATIC_EXTENSIONS = {
+    ".html", ".css", ".js", ".json", ".svg", ".ico", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".txt",
+    ".woff", ".woff2",
+}
+EXCLUDED_DIRS = {"src", "config", "knowledge_base", "notebooks", "scripts", "__pycache__", "node_modules"}
+INDEX_PAGE = "website.html"
+# Tipos que vale la pena comprimir (las imágenes y fuentes ya lo están)
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+_CHUNK_SIZE = 64 * 1024
+
+
+class StaticFile:
+    """Un archivo publicado: contenido (y variantes comprimidas) si es pequeño, y sus validadores"""
+
+    __slots__ = ("path", "size", "mtime", "content_type", "etag", "last_modified", "body", "encoded")
+
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        self.body: Optional[bytes] = None
+        # Codificación -> contenido comprimido ("br", "gzip")
+        self.encoded: Dict[str, bytes] = {}
+
+        if self.size <= STATIC_MAX_INLINE_BYTES:
+            with open(path, "rb") as f:
+                self.body = f.read()
+            digest = hashlib.sha1(self.body).hexdigest()[:16]
+            if content_type.startswith(_COMPRESSIBLE):
+                self._compress()
+        else:
+            digest = f"{int(stat.st_mtime_ns):x}-{stat.st_size:x}"
+        self.etag = f'"{digest}"'
+
+    def _compress(self):
+        candidates = {"gzip": gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates["br"] = brotli.compress(self.body, quality=11)
+        # Solo se guardan las variantes que ahorran bytes
+        self.encoded = {name: data for name, data in candidates.items() if len(data) < len(self.body)}
+
+    def is_stale(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        # Cada representación tiene su propia ETag (misma base)
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        """True si alguna ETag de If-None-Match corresponde a este contenido (en cualquier codificación)"""
+        base = self.etag[1:-1]
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            tag = tag.strip('"')
+            stem, _, suffix = tag.rpartition("-")
+            if tag == base or (stem == base and suffix in ("gzip", "br")):
+                return True
+        return False
+
+
+class StaticSite:
+    """Archivos publicables de ``root`` cargados en memoria; se recargan si cambian en disco"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._files: Dict[str, StaticFile] = {}
+        self._lock = threading.Lock()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".") and d not in EXCLUDED_DIRS]
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in STATIC_EXTENSIONS and not filename.startswith("."):
+                    full_path = os.path.join(dirpath, filename)
+                    url = "/" + os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                    self._files[url] = StaticFile(full_path)
 
-def serve_website():
-    Handler = http.server.SimpleHTTPRequestHandler  # Maneja solicitudes HTTP simples
+    def __len__(self) -> int:
+        return len(self._files)
 
-    # Cambiar al directorio raíz del proyecto (donde está website.html)
+    def memory_bytes(self) -> int:
+        return sum(
+            len(f.body or b"") + sum(len(data) for data in f.encoded.values()) for f in self._files.values()
+        )
+
+    def get(self, url_path: str) -> Optional[StaticFile]:
+        if url_path == "/":
+            url_path = "/" + INDEX_PAGE
+        static_file = self._files.get(url_path)
+        if static_file is None or not static_file.is_stale():
+            return static_file
+        # Cambió en disco (edición durante el desarrollo): se vuelve a cargar
+        with self._lock:
+            static_file = self._files.get(url_path)
+            if static_file is not None and static_file.is_stale():
+                try:
+                    static_file = self._files[url_path] = StaticFile(static_file.path)
+                except OSError:
+                    del self._files[url_path]
+                    return None
+            return static_file
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Codificaciones de Accept-Encoding con su peso q"""
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+class StaticHandler(http.server.BaseHTTPRequestHandler):
+    """Responde GET/HEAD desde ``StaticSite`` con compresión, validadores y keep-alive"""
+
+    protocol_version = "HTTP/1.1"
+    timeout = STATIC_KEEPALIVE_TIMEOUT
+    # Cabeceras y cuerpo van en escrituras separadas: sin esto cada respuesta espera el ACK retardado
+    disable_nagle_algorithm = True
+    server_version = "GreenDreamStatic/1.0"
+    site: StaticSite = None  # se asigna en make_server
+
+    def log_request(self, code="-", size="-"):
+        # Con tráfico alto solo se registran los errores
+        if isinstance(code, int) and code >= 400:
+            super().log_request(code, size)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _choose_encoding(self, static_file: StaticFile) -> Optional[str]:
+        if not static_file.encoded:
+            return None
+        accepted = _accepted_encodings(self.headers.get("Accept-Encoding", ""))
+        for encoding in ("br", "gzip"):
+            if encoding in static_file.encoded and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return None
+
+    def _not_modified(self, static_file: StaticFile) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return static_file.matches(if_none_match)
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(static_file.mtime) <= since
+        return False
+
+    def _respond(self, send_body: bool):
+        path = self.path.split("?", 1)[0].split("#", 1)[0]
+        static_file = self.site.get(path)
+        if static_file is None:
+            self.send_error(404, "Archivo no encontrado")
+            return
+
+        encoding = self._choose_encoding(static_file)
+        not_modified = self._not_modified(static_file)
+        self.send_response(304 if not_modified else 200)
+        self.send_header("ETag", static_file.etag_for(encoding))
+        self.send_header("Last-Modified", static_file.last_modified)
+        if static_file.content_type.startswith("text/html"):
+            self.send_header("Cache-Control", "no-cache")
+        else:
+            self.send_header("Cache-Control", f"public, max-age={STATIC_MAX_AGE}")
+        if static_file.encoded:
+            self.send_header("Vary", "Accept-Encoding")
+        if not_modified:
+            self.end_headers()
+            return
+
+        body = static_file.encoded[encoding] if encoding else static_file.body
+        self.send_header("Content-Type", static_file.content_type)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body) if body is not None else static_file.size))
+        self.end_headers()
+        if not send_body:
+            return
+        try:
+            if body is not None:
+                self.wfile.write(body)
+            else:
+                with open(static_file.path, "rb") as f:
+                    while True:
+                        chunk = f.read(_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente cerró la conexión a mitad de la respuesta
+            self.close_connection = True
+
+
+def make_server(root: str, port: int, host: str = "") -> http.server.ThreadingHTTPServer:
+    """Servidor con un hilo por conexión que sirve los archivos publicables de ``root``"""
+    site = StaticSite(root)
+    handler = type("SiteHandler", (StaticHandler,), {"site": site})
+    httpd = http.server.ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    encodings = "gzip/brotli" if brotli is not None else "gzip"
+    print(f"🗜️ {len(site)} archivos en memoria ({site.memory_bytes() / 1024:.0f} KB, {encodings})")
+    return httpd
+
+
+def serve_website(port: Optional[int] = None, host: str = "", open_browser: bool = True):
+    # Directorio raíz del proyecto (donde está website.html)
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    os.chdir(project_root)  # Cambia al directorio raíz del proyecto
 
     # Permitir reutilizar la dirección para evitar errores al reiniciar rápidamente
-    socketserver.TCPServer.allow_reuse_address = True
+    http.server.ThreadingHTTPServer.allow_reuse_address = True
 
     # Intentar enlazar a 8080 y si está ocupado probar puertos siguientes
-    for PORT in range(8080, 8091):
+    ports = [port] if port else range(8080, 8091)
+    for PORT in ports:
         try:
-            with socketserver.TCPServer(("", PORT), Handler) as httpd:
+            with make_server(project_root, PORT, host) as httpd:
                 print(f"🌐 Servidor web iniciado en: http://localhost:{PORT}")
                 print(f"📄 Página principal: http://localhost:{PORT}/website.html")
                 print("📡 API funcionando en: http://localhost:5001")
-                print("\n✅ Todo listo! Abriendo navegador...")
 
-                # Abrir navegador después de 2 segundos
-                def open_browser(port=PORT):
-                    time.sleep(2)
-                    try:
-                        webbrowser.open(f'http://localhost:{port}/website.html')
-                    except Exception:
-                        pass
+                if open_browser:
+                    print("\n✅ Todo listo! Abriendo navegador...")
+
+                    # Abrir navegador después de 2 segundos
+                    def open_browser_later(port=PORT):
+                        time.sleep(2)
+                        try:
+                            webbrowser.open(f'http://localhost:{port}/website.html')
+                        except Exception:
+                            pass
 
-                browser_thread = threading.Thread(target=open_browser)
-                browser_thread.daemon = True
-                browser_thread.start()
+                    browser_thread = threading.Thread(target=open_browser_later)
+                    browser_thread.daemon = True
+                    browser_thread.start()
 
                 print("🔥 Presiona Ctrl+C para detener el servidor")
                 try:
@@ -51,7 +306,12 @@ def serve_website():
             print(f"Puerto {PORT} en uso (detalle: {e}). Probando {PORT + 1}...")
             continue
 
-    print("❌ No fue posible abrir el servidor web en los puertos 8080-8090")
+    print(f"❌ No fue posible abrir el servidor web en los puertos {ports[0]}-{ports[-1]}")
 
 if __name__ == "__main__":
-    serve_website()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sirve website.html y sus recursos")
+    parser.add_argument("--port", type=int, default=None, help="Puerto (por defecto el primero libre entre 8080 y 8090)")
+    parser.add_argument("--host", default="", help="Interfaz donde escuchar (por defecto todas)")
+    parser.add_argument("--no-browser", action="store_true", help="No abrir el navegador al iniciar")
+    args = parser.parse_args()
+    serve_website(args.port, args.host, open_browser=not args.no_browser)
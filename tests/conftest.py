@@ -0,0 +1,29 @@
+# conftest.py - Los módulos de la app están en src/ y se importan sin paquete
+# (igual que con gunicorn --chdir src)
+import os
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# Los tests no calientan la conexión con Azure al importar la API
+os.environ.setdefault("STARTUP_WARMUP", "0")
+
+
+@pytest.fixture
+def synthetic_kb(tmp_path):
+    """Base de conocimiento sintética pequeña (mismos campos que knowledge_base/)"""
+    from bench_retrieval import generate_knowledge_base
+
+    return generate_knowledge_base(str(tmp_path / "kb"), 300, seed=7)
+
+
+def search_results(rag, queries, max_results=10):
+    """Resultados comparables entre cargas distintas (los doc_id internos pueden cambiar)"""
+    return [
+        [(round(doc.relevance_score, 9), doc.source) for doc in rag.search_simple(query, max_results)]
+        for query in queries
+    ]
@@ -0,0 +1,147 @@
+# test_admission.py - Control de admisión de /api/chat (src/admission.py)
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, RateLimiter, client_key, limits_for_threads
+
+
+def _controller(max_concurrent=1, max_queue=1, queue_timeout=2.0, rate_per_minute=0, burst=10):
+    return AdmissionController(max_concurrent, max_queue, queue_timeout, RateLimiter(rate_per_minute, burst))
+
+
+def test_slot_handoff_to_first_waiter():
+    ctl = _controller()
+    first = ctl.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(ctl.acquire()))
+    waiter.start()
+    while ctl.queue_depth == 0:
+        time.sleep(0.01)
+
+    first.release()
+    waiter.join(2)
+    assert got and ctl.in_flight == 1 and ctl.queue_depth == 0
+    first.release()  # release solo cuenta una vez
+    assert ctl.in_flight == 1
+    got[0].release()
+    assert ctl.in_flight == 0
+
+
+def test_queue_full_and_timeout():
+    ctl = _controller(queue_timeout=0.05)
+    slot = ctl.acquire()
+    with pytest.raises(AdmissionRejected) as timeout:
+        ctl.acquire()
+    assert timeout.value.reason == "queue_timeout"
+    assert ctl.queue_depth == 0 and ctl.in_flight == 1
+
+    ctl.max_queue = 0
+    with pytest.raises(AdmissionRejected) as full:
+        ctl.acquire()
+    assert full.value.reason == "queue_full"
+    assert int(full.value.retry_after_header) >= 1
+    slot.release()
+    assert ctl.in_flight == 0
+
+
+def test_rejection_by_queue_refunds_the_token():
+    ctl = _controller(max_queue=0, rate_per_minute=1, burst=2)
+    slot = ctl.acquire("10.0.0.1")
+    for _ in range(5):
+        with pytest.raises(AdmissionRejected) as e:
+            ctl.acquire("10.0.0.1")
+        assert e.value.reason == "queue_full"
+    slot.release()
+
+    ctl.acquire("10.0.0.1").release()
+    with pytest.raises(AdmissionRejected) as e:
+        ctl.acquire("10.0.0.1")
+    assert e.value.reason == "rate_limited"
+    assert e.value.retry_after > 1
+
+
+def test_async_cancel_while_queued():
+    async def scenario():
+        ctl = _controller()
+        slot = await ctl.acquire_async()
+        task = asyncio.ensure_future(ctl.acquire_async())
+        await asyncio.sleep(0.01)
+        assert ctl.queue_depth == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert ctl.queue_depth == 0
+        slot.release()
+        assert ctl.in_flight == 0
+
+        # Cancelada justo después de recibir el hueco: lo devuelve
+        slot = await ctl.acquire_async()
+        task = asyncio.ensure_future(ctl.acquire_async())
+        await asyncio.sleep(0.01)
+        slot.release()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert ctl.in_flight == 0 and ctl.queue_depth == 0
+
+    asyncio.run(scenario())
+
+
+def test_client_key_uses_trusted_proxy_hops_only():
+    assert client_key("10.0.0.1", "1.2.3.4", trusted_proxies=0) == "10.0.0.1"
+    assert client_key("10.0.0.1", "spoofed, 1.2.3.4", trusted_proxies=1) == "1.2.3.4"
+    assert client_key("10.0.0.1", "1.2.3.4", trusted_proxies=2) == "10.0.0.1"
+
+
+def test_limits_fit_in_threads():
+    assert limits_for_threads(16) == (8, 7)
+    assert limits_for_threads(1) == (1, 0)
+
+
+def test_api_responds_429_with_retry_after(monkeypatch):
+    import api_complete
+
+    ctl = _controller(max_queue=0, rate_per_minute=1, burst=1)
+    monkeypatch.setattr(api_complete, "ADMISSION", ctl)
+    client = api_complete.app.test_client()
+
+    slot = ctl.acquire()
+    response = client.post("/api/chat", json={"message": "cursos de energía solar"})
+    assert response.status_code == 429
+    assert response.get_json()["reason"] == "queue_full"
+    assert response.headers["Retry-After"] == str(response.get_json()["retry_after"])
+    slot.release()
+
+    ctl.limiter.acquire("127.0.0.1")
+    response = client.post("/api/chat/stream", json={"message": "cursos de energía solar"})
+    assert response.status_code == 429
+    assert response.get_json()["reason"] == "rate_limited"
+    assert int(response.headers["Retry-After"]) >= 1
+    assert ctl.in_flight == 0
+
+
+def test_batch_charges_one_token_per_question(monkeypatch):
+    import api_complete
+    import assistant_rag
+
+    # Sin modelo: el lote se responde solo con la búsqueda
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: None)
+    ctl = _controller(rate_per_minute=60, burst=2)
+    monkeypatch.setattr(api_complete, "ADMISSION", ctl)
+    client = api_complete.app.test_client()
+    questions = {"questions": ["cursos de energía solar", "reciclaje doméstico", "agricultura urbana"]}
+
+    # Con un token basta para entrar, pero el lote deja el bucket en deuda
+    response = client.post("/api/chat/batch", json=questions)
+    assert response.status_code == 200
+    assert b'"done": true' in response.data
+
+    response = client.post("/api/chat/batch", json=questions)
+    assert response.status_code == 429
+    assert response.get_json()["reason"] == "rate_limited"
+    assert int(response.headers["Retry-After"]) >= 2
+    response = client.post("/api/chat", json={"message": "cursos de energía solar"})
+    assert response.status_code == 429
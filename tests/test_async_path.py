@@ -0,0 +1,135 @@
+# test_async_path.py - Camino asíncrono con el cliente azure.ai.inference.aio (src/assistant_rag.py)
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import assistant_rag
+
+
+def _event(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeAsyncStream:
+    def __init__(self, client, fragments):
+        self.client = client
+        self.fragments = list(fragments)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.fragments:
+            raise StopAsyncIteration
+        await asyncio.sleep(self.client.delay)
+        return _event(self.fragments.pop(0))
+
+    async def aclose(self):
+        if not self.closed:
+            self.closed = True
+            self.client.in_flight -= 1
+
+
+class FakeAsyncClient:
+    """Cliente asíncrono que responde en streaming, esperando ``delay`` antes de cada fragmento"""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.streams = []
+
+    async def complete(self, messages, stream=False, **kwargs):
+        assert stream
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        question = messages[-1].content.rsplit("\n", 1)[-1]
+        stream = FakeAsyncStream(self, ["Respuesta ", f"a {question}"])
+        self.streams.append(stream)
+        return stream
+
+
+@pytest.fixture
+def asistente():
+    asistente = assistant_rag.AsistenteGreenDreamRAG()
+    yield asistente
+    asistente.kb_watcher.stop()
+
+
+@pytest.fixture
+def aclient(monkeypatch):
+    aclient = FakeAsyncClient()
+    monkeypatch.setattr(assistant_rag, "get_async_client", lambda: aclient)
+    return aclient
+
+
+def test_concurrent_questions_share_the_event_loop(asistente, aclient):
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.ensure_future(ticker())
+        start = time.monotonic()
+        respuestas = await asyncio.gather(*[
+            asistente.preguntar_con_rag_async(f"cursos de energía solar número {n} (async)")
+            for n in range(10)
+        ])
+        elapsed = time.monotonic() - start
+        ticking.cancel()
+        return respuestas, elapsed, ticks
+
+    respuestas, elapsed, ticks = asyncio.run(scenario())
+    # 10 llamadas de ~0.2 s cada una: en serie serían 2 s
+    assert elapsed < 1.0 and aclient.max_in_flight == 10
+    assert all(respuesta.startswith("Respuesta a") for respuesta in respuestas)
+    # El event loop siguió atendiendo otras tareas mientras tanto
+    assert ticks >= 10
+    assert all(stream.closed for stream in aclient.streams)
+
+
+def test_async_stream_saves_the_turn(asistente, aclient):
+    session_id = asistente.sessions.get_or_create(None).session_id
+
+    async def scenario():
+        return [
+            fragment
+            async for fragment in asistente.preguntar_con_rag_stream_async("reciclaje doméstico (async)", session_id=session_id)
+        ]
+
+    fragmentos = asyncio.run(scenario())
+    assert len(fragmentos) == 2 and fragmentos[0] == "Respuesta "
+    assert asistente.sessions.get_history(session_id) == [("reciclaje doméstico (async)", "".join(fragmentos))]
+
+
+def test_async_stream_closed_early_keeps_the_partial_answer(asistente, aclient):
+    session_id = asistente.sessions.get_or_create(None).session_id
+
+    async def scenario():
+        fragmentos = asistente.preguntar_con_rag_stream_async("compostaje (async interrumpido)", session_id=session_id)
+        first = await fragmentos.__anext__()
+        await fragmentos.aclose()
+        return first
+
+    assert asyncio.run(scenario()) == "Respuesta "
+    assert asistente.sessions.get_history(session_id) == [("compostaje (async interrumpido)", "Respuesta ")]
+    assert aclient.streams[0].closed
+
+
+def test_async_batch_respects_max_workers(asistente, aclient):
+    preguntas = [f"agricultura urbana número {n} (lote async)" for n in range(6)]
+
+    async def scenario():
+        return [item async for item in asistente.preguntar_lote_async(preguntas, max_workers=2)]
+
+    items = asyncio.run(scenario())
+    assert sorted(item["index"] for item in items) == list(range(6))
+    assert all(item["status"] == "ok" and item["response"].startswith("Respuesta") for item in items)
+    assert aclient.max_in_flight == 2
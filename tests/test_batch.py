@@ -0,0 +1,111 @@
+# test_batch.py - Lotes de preguntas en paralelo y /api/chat/batch (src/assistant_rag.py, src/api_complete.py)
+import json
+import threading
+import time
+
+import pytest
+
+import assistant_rag
+from assistant_rag import BATCH_MAX_WORKERS, BatchRequestError, parse_batch_request
+
+QUESTIONS = ["cursos de energía solar (lote)", "reciclaje doméstico (lote)", "agricultura urbana (lote)", "compostaje (lote)"]
+
+
+def test_batch_request_is_validated():
+    assert parse_batch_request({"questions": ["a", "b"]}) == (["a", "b"], BATCH_MAX_WORKERS)
+    assert parse_batch_request({"questions": ["a"], "max_workers": "2"}) == (["a"], 2)
+    # max_workers se limita a [1, BATCH_MAX_WORKERS]
+    assert parse_batch_request({"questions": ["a"], "max_workers": 10_000})[1] == BATCH_MAX_WORKERS
+    assert parse_batch_request({"questions": ["a"], "max_workers": -3})[1] == 1
+
+    for body in (None, [], {}, {"questions": []}, {"questions": "a"}, {"questions": ["a", "  "]}, {"questions": [1]}):
+        with pytest.raises(BatchRequestError) as error:
+            parse_batch_request(body)
+        assert error.value.status == 400
+    with pytest.raises(BatchRequestError, match="entero"):
+        parse_batch_request({"questions": ["a"], "max_workers": "muchos"})
+    with pytest.raises(BatchRequestError) as error:
+        parse_batch_request({"questions": ["a"] * (assistant_rag.BATCH_MAX_QUESTIONS + 1)})
+    assert error.value.status == 413
+
+
+@pytest.fixture
+def asistente(monkeypatch):
+    asistente = assistant_rag.AsistenteGreenDreamRAG()
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: object())
+    yield asistente
+    asistente.kb_watcher.stop()
+
+
+def test_questions_are_answered_in_parallel_as_they_finish(asistente, monkeypatch):
+    delays = {QUESTIONS[0]: 0.3, QUESTIONS[1]: 0.0, QUESTIONS[2]: 0.15, QUESTIONS[3]: 0.0}
+    threads = set()
+
+    def generate(messages, *args, **kwargs):
+        question = next(q for q in QUESTIONS if q in messages[-1].content)
+        threads.add(threading.current_thread().name)
+        if question == QUESTIONS[3]:
+            raise RuntimeError("fallo del modelo")
+        time.sleep(delays[question])
+        return f"Respuesta a {question}"
+
+    monkeypatch.setattr(asistente, "_generate", generate)
+    start = time.monotonic()
+    items = list(asistente.preguntar_lote(QUESTIONS, max_workers=4))
+    elapsed = time.monotonic() - start
+
+    # En serie serían 0.45 s; el más lento llega el último
+    assert elapsed < 0.4
+    assert sorted(item["index"] for item in items) == [0, 1, 2, 3] and items[-1]["index"] == 0
+    assert all(name.startswith("batch") for name in threads)
+    by_index = {item["index"]: item for item in items}
+    assert by_index[0]["status"] == "ok" and by_index[0]["response"] == f"Respuesta a {QUESTIONS[0]}"
+    assert by_index[0]["question"] == QUESTIONS[0] and by_index[0]["seconds"] >= 0.3
+    # Un fallo del modelo solo degrada su pregunta
+    assert by_index[3]["status"] == "degraded" and by_index[3]["reason"] == "llm_error" and by_index[3]["response"]
+
+    # Las preguntas repetidas salen de la caché de respuestas
+    again = {item["index"]: item for item in asistente.preguntar_lote(QUESTIONS[:2], max_workers=2)}
+    assert again[0]["status"] == again[1]["status"] == "cached"
+    assert again[0]["response"] == by_index[0]["response"]
+
+
+def test_pending_questions_are_cancelled_when_the_consumer_stops(asistente, monkeypatch):
+    calls = []
+
+    def generate(messages, *args, **kwargs):
+        calls.append(messages)
+        time.sleep(0.1)
+        return "Respuesta"
+
+    monkeypatch.setattr(asistente, "_generate", generate)
+    questions = [f"pregunta de prueba {n} (cancelación)" for n in range(20)]
+    resultados = asistente.preguntar_lote(questions, max_workers=2)
+    next(resultados)
+    resultados.close()
+    time.sleep(0.3)
+    assert len(calls) < len(questions) / 2
+
+
+def _ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_api_streams_one_line_per_question_and_a_summary(monkeypatch):
+    import api_complete
+
+    # Sin modelo: el lote se responde solo con la búsqueda
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: None)
+    client = api_complete.app.test_client()
+
+    response = client.post("/api/chat/batch", json={"questions": QUESTIONS[:3], "max_workers": 2})
+    assert response.status_code == 200 and response.mimetype == "application/x-ndjson"
+    lines = _ndjson(response)
+    assert len(lines) == 4
+    assert sorted(line["index"] for line in lines[:3]) == [0, 1, 2]
+    assert all(line["status"] == "degraded" and line["reason"] == "llm_unavailable" for line in lines[:3])
+    summary = lines[-1]
+    assert summary["done"] is True and summary["total"] == 3 and summary["statuses"] == {"degraded": 3}
+
+    response = client.post("/api/chat/batch", json={"questions": []})
+    assert response.status_code == 400 and "questions" in response.get_json()["error"]
@@ -0,0 +1,40 @@
+# test_bench_retrieval.py - Base sintética y medición del micro-benchmark (src/bench_retrieval.py)
+import json
+import os
+
+from bench_retrieval import KB_FILES, KNOWLEDGE_BASE_DIR, generate_knowledge_base, measure
+
+
+def _records(kb_dir):
+    records = {}
+    for name in KB_FILES:
+        with open(os.path.join(kb_dir, f"{name}.json"), encoding="utf-8") as f:
+            records[name] = json.load(f)
+    return records
+
+
+def test_generated_base_has_the_real_fields(tmp_path):
+    records = _records(generate_knowledge_base(str(tmp_path / "kb"), 200, seed=1))
+    assert {name: len(items) for name, items in records.items()} == {"cursos": 80, "articulos": 80, "revistas": 40}
+    real = _records(KNOWLEDGE_BASE_DIR)
+    for name, items in records.items():
+        fields = set().union(*(record.keys() for record in real[name]))
+        assert all(set(record) <= fields for record in items)
+        assert len({record["id"] for record in items}) == len(items)
+        assert all(record["titulo"] and record["url"].startswith("https://greendream.org/") for record in items)
+
+
+def test_generation_is_reproducible(tmp_path):
+    first = _records(generate_knowledge_base(str(tmp_path / "a"), 50, seed=5))
+    assert _records(generate_knowledge_base(str(tmp_path / "b"), 50, seed=5)) == first
+    assert _records(generate_knowledge_base(str(tmp_path / "c"), 50, seed=6)) != first
+
+
+def test_measure_reports_load_and_latencies(synthetic_kb):
+    report = measure(synthetic_kb, n_queries=20)
+    assert report["load_from"] == "json" and report["documents"] == 300
+    assert report["passages"] >= report["documents"] and report["terms"] > 0
+    for name in ("search_simple", "get_recommendations_context"):
+        latencies = report[name]
+        assert latencies["queries"] == 20 and latencies["qps"] > 0
+        assert latencies["p50_ms"] <= latencies["p95_ms"] <= latencies["p99_ms"]
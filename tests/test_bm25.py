@@ -0,0 +1,84 @@
+# test_bm25.py - Índice invertido BM25 (src/rag_system.py)
+import math
+
+import pytest
+
+from rag_system import BM25Index, GreenDreamRAG
+
+CORPUS = [
+    ["energia", "solar", "curso"],
+    ["reciclaje", "domestico", "curso", "curso"],
+    ["energia", "eolica", "revista", "energia"],
+    ["huerto", "urbano"],
+]
+
+
+def _index(corpus=CORPUS):
+    index = BM25Index()
+    for doc_id, terms in enumerate(corpus):
+        index.add_document(doc_id, terms)
+    return index
+
+
+def _linear_scores(corpus, query, k1=1.5, b=0.75):
+    """Puntuación BM25 recorriendo todos los documentos (la búsqueda lineal que reemplaza el índice)"""
+    avgdl = sum(len(doc) for doc in corpus) / len(corpus)
+    scores = {}
+    for doc_id, doc in enumerate(corpus):
+        score = 0.0
+        for term in set(query):
+            tf = doc.count(term)
+            if not tf:
+                continue
+            df = sum(1 for other in corpus if term in other)
+            idf = math.log(1 + (len(corpus) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        if score:
+            scores[doc_id] = score
+    return scores
+
+
+@pytest.mark.parametrize("query", [["energia"], ["curso", "energia"], ["curso", "curso"], ["huerto", "solar", "nada"]])
+def test_scores_match_a_linear_scan(query):
+    index = _index()
+    expected = _linear_scores(CORPUS, query)
+    assert index._scores(query) == pytest.approx(expected)
+    ranked = sorted(((score, doc_id) for doc_id, score in expected.items()), reverse=True)
+    assert index.search(query, top_k=2) == pytest.approx(ranked[:2])
+
+
+def test_only_documents_with_query_terms_are_returned():
+    index = _index()
+    assert index.search(["inexistente"]) == []
+    assert index.search([]) == []
+    assert [doc_id for _, doc_id in index.search(["energia"], top_k=10)] == [2, 0]
+    assert len(index) == 4 and index.num_terms == 9
+
+
+def test_grouped_search_scores_each_group_by_its_best_entry():
+    index = _index()
+    groups = [0, 0, 1, 1]  # dos pasajes por documento
+    query = ["curso", "energia"]
+    scores = _linear_scores(CORPUS, query)
+    best = {}
+    for doc_id, score in scores.items():
+        if score > best.get(groups[doc_id], (0.0,))[0]:
+            best[groups[doc_id]] = (score, doc_id)
+    expected = sorted(((score, group, doc_id) for group, (score, doc_id) in best.items()), reverse=True)
+    assert index.search_grouped(query, groups, top_k=5) == pytest.approx(expected)
+
+    # Con ``allowed`` solo puntúan esas entradas
+    assert index.search_grouped(query, groups, top_k=5, allowed={1}) == pytest.approx([(scores[1], 0, 1)])
+
+
+def test_search_simple_finds_documents_by_title(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    documents = rag.documents
+    for doc_id in list(documents.doc_ids())[::30]:
+        title = documents.metadata(doc_id)["titulo"]
+        results = rag.search_simple(title, max_results=5)
+        assert 0 < len(results) <= 5
+        assert title in [doc.metadata["titulo"] for doc in results]
+        scores = [doc.relevance_score for doc in results]
+        assert scores == sorted(scores, reverse=True) and scores[-1] > 0
+    assert rag.search_simple("", max_results=5) == []
@@ -0,0 +1,146 @@
+# test_circuit_breaker.py - Estados del circuit breaker del modelo (src/llm_client.py)
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import ServiceResponseError
+
+import assistant_rag
+from llm_client import CircuitBreaker, CircuitOpenError, ClientStats, ManagedChatClient, RetryPolicy
+
+
+def _open_breaker(threshold=2, reset_timeout=0.05):
+    breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=reset_timeout)
+    for _ in range(threshold):
+        breaker.before_call()
+        breaker.record_failure()
+    return breaker
+
+
+def _event(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class _StreamingClient:
+    """``ChatCompletionsClient`` de prueba: cada llamada con stream=True devuelve ``events()``"""
+
+    def __init__(self, events):
+        self.events = events
+
+    def complete(self, **kwargs):
+        return self.events()
+
+
+def _managed(events, breaker):
+    stats = ClientStats()
+    return ManagedChatClient(_StreamingClient(events), RetryPolicy(breaker, stats)), stats
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # un éxito reinicia la cuenta
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.is_open
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.before_call()
+    assert 0 < e.value.retry_after <= 60
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.is_open
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # la prueba sigue en curso
+
+
+def test_probe_success_closes_the_circuit():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.before_call()
+
+
+def test_probe_failure_reopens_for_a_full_cooldown():
+    breaker = _open_breaker(threshold=5)
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()  # basta un fallo en semiabierto
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_stream_error_midway_counts_as_failure():
+    def broken():
+        yield _event("Te recomiendo ")
+        raise ServiceResponseError("conexión cortada")
+
+    breaker = _open_breaker(threshold=1)
+    time.sleep(0.06)
+    client, stats = _managed(broken, breaker)
+    stream = client.complete(messages=[], stream=True)
+    assert breaker.state == CircuitBreaker.HALF_OPEN  # establecer el stream no cierra el circuito
+
+    with pytest.raises(ServiceResponseError):
+        list(stream)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert stats.snapshot() == {"timeout": 1, "failure": 1}
+
+    # Un stream leído hasta el final sí cuenta como éxito
+    time.sleep(0.06)
+    client, stats = _managed(lambda: iter([_event("hola")]), breaker)
+    assert len(list(client.complete(messages=[], stream=True))) == 1
+    assert breaker.state == CircuitBreaker.CLOSED and stats.snapshot() == {"success": 1}
+
+
+@pytest.fixture
+def asistente():
+    asistente = assistant_rag.AsistenteGreenDreamRAG()
+    yield asistente
+    asistente.kb_watcher.stop()
+
+
+def test_latency_budget_give_up_counts_as_failure(asistente, monkeypatch):
+    released = threading.Event()
+    finished = threading.Event()
+
+    def late():
+        try:
+            released.wait(5)
+            yield _event("Te recomiendo ")
+            yield _event("el curso de energía solar")
+        finally:
+            finished.set()
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    client, stats = _managed(late, breaker)
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: client)
+    asistente.latency_budget = 0.1
+    session_id = asistente.sessions.get_or_create(None).session_id
+
+    fragmentos = list(asistente.preguntar_con_rag_stream("cursos de energía solar (tarde)", session_id=session_id))
+    assert len(fragmentos) == 1 and fragmentos[0].reason == "latency_budget"
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # El modelo empieza a responder cuando ya nadie espera: no vuelve a cerrar el circuito
+    released.set()
+    assert finished.wait(5)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert stats.snapshot() == {"abandoned": 1, "failure": 1}
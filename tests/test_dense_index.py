@@ -0,0 +1,127 @@
+# test_dense_index.py - Recuperación semántica local e índice IVF (src/dense_index.py)
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import dense_index  # noqa: E402
+from dense_index import DenseIndex, _kmeans, _normalize  # noqa: E402
+from facets import parse_filters  # noqa: E402
+from rag_system import BM25Index, GreenDreamRAG, tokenize  # noqa: E402
+
+CORPUS = [
+    "panel solar fotovoltaico",
+    "energía solar en el tejado",
+    "compost para el huerto urbano",
+    "huerto con semillas y riego",
+    "instalación de panel fotovoltaico",
+    "riego por goteo en el huerto",
+]
+SOLAR, HUERTO = {0, 1, 4}, {2, 3, 5}
+
+
+@pytest.fixture(autouse=True)
+def numpy_loaded():
+    assert dense_index.available()
+
+
+def _dense(corpus=CORPUS):
+    index = BM25Index()
+    for doc_id, text in enumerate(corpus):
+        index.add_document(doc_id, tokenize(text))
+    return DenseIndex.build(index.iter_postings(), index.idf, list(range(len(corpus))), len(corpus))
+
+
+def _ranking(dense, query, top_k=len(CORPUS)):
+    return [doc_id for _, doc_id in dense.search(dense.encode([tokenize(query)]), top_k=top_k)[0]]
+
+
+def test_terms_used_together_are_close():
+    dense = _dense()
+    # "semillas" solo aparece en el documento 3, que comparte "riego" con el 5
+    assert _ranking(dense, "semillas")[:2] == [3, 5]
+    assert set(_ranking(dense, "semillas")[:3]) == HUERTO
+    # "tejado" está en un documento solar: el resto de documentos solares van antes que los del huerto
+    ranking = _ranking(dense, "tejado")
+    assert ranking[0] == 1 and ranking[1] == 0 and set(ranking[:3]) == SOLAR
+    assert set(_ranking(dense, "fotovoltaico")[:2]) == {0, 4}
+
+
+def test_unknown_terms_use_terms_with_the_same_prefix():
+    dense = _dense()
+    # "fotovoltaje" no está en el vocabulario: se aproxima con "fotovoltaic"
+    assert tokenize("fotovoltaje") == ["fotovoltaj"]
+    assert set(_ranking(dense, "fotovoltaje")[:2]) == {0, 4}
+    assert not dense.encode([["zzz"]]).any()
+    assert dense.search(dense.encode([["zzz"]]))[0] == []
+
+
+def test_allowed_restricts_the_results():
+    dense = _dense()
+    query = dense.encode([tokenize("fotovoltaico")])
+    results = dense.search(query, top_k=3, allowed=HUERTO)[0]
+    assert {doc_id for _, doc_id in results} == HUERTO
+
+
+def test_with_changes_removes_and_adds_documents():
+    dense = _dense()
+    changed = dense.with_changes({4}, [(6, [tokenize("panel fotovoltaico para el tejado")])])
+    assert len(changed) == len(dense) == 6
+    assert 4 not in _ranking(changed, "fotovoltaico") and _ranking(changed, "fotovoltaico")[0] in (0, 6)
+    # El índice original no cambia
+    assert 4 in _ranking(dense, "fotovoltaico")[:2]
+
+
+def _clustered_index(n_docs=3000, n_clusters=40, dim=32, seed=3):
+    rng = np.random.default_rng(seed)
+    centers = _normalize(rng.standard_normal((n_clusters, dim)).astype(np.float32))
+    vectors = _normalize(centers[rng.integers(n_clusters, size=n_docs)] + 0.3 * rng.standard_normal((n_docs, dim)).astype(np.float32))
+    empty = DenseIndex([], np.zeros((0, dim), np.float32), np.zeros(0, np.float32), vectors[:0],
+                       np.zeros(0, np.uint32), None, _kmeans(vectors, rng))
+    return empty._with_rows(np.arange(n_docs, dtype=np.uint32), vectors), vectors, rng
+
+
+def test_ivf_finds_most_exact_neighbours():
+    index, vectors, rng = _clustered_index()
+    assert len(index.centroids) == int(np.sqrt(len(vectors)))
+    queries = _normalize(vectors[rng.choice(len(vectors), 50, replace=False)] + 0.1)
+
+    def recall(nprobe):
+        found = index.search(queries, top_k=10, nprobe=nprobe)
+        hits = []
+        for query, results in zip(queries, found):
+            exact = set(np.argsort(-(vectors @ query))[:10].tolist())
+            hits.append(len(exact & {doc_id for _, doc_id in results}) / 10)
+            assert [s for s, _ in results] == sorted((s for s, _ in results), reverse=True)
+        return np.mean(hits)
+
+    # Revisando pocas listas se pierde algún vecino; revisándolas todas la búsqueda es exacta
+    assert recall(dense_index.IVF_NPROBE) >= 0.75
+    assert recall(len(index.centroids)) == 1.0
+
+    # Con un filtro que casi nada cumple en las listas revisadas se compara con todos los permitidos
+    allowed = set(range(0, len(vectors), 500))
+    results = index.search(queries[:1], top_k=3, allowed=allowed)[0]
+    exact = sorted(allowed, key=lambda doc_id: -float(vectors[doc_id] @ queries[0]))[:3]
+    assert [doc_id for _, doc_id in results] == exact
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid"])
+def test_knowledge_base_search_in_dense_modes(synthetic_kb, mode):
+    lexical = GreenDreamRAG(synthetic_kb, snapshot_path="", retrieval_mode="lexical")
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="", retrieval_mode=mode)
+    assert rag.dense is not None and len(rag.dense) == len(rag.documents)
+
+    for doc_id in list(rag.documents.doc_ids())[::60]:
+        title = rag.documents.metadata(doc_id)["titulo"]
+        results = rag.search_simple(title, max_results=5)
+        assert 0 < len(results) <= 5 and len({doc.doc_id for doc in results}) == len(results)
+        if mode == "hybrid":
+            # La fusión conserva el mejor resultado léxico entre los primeros
+            best = lexical.search_simple(title, max_results=1)[0].doc_id
+            assert best in [doc.doc_id for doc in results[:2]]
+
+    query = "cursos online gratuitos de energía"
+    flt = parse_filters(query, rag.facets)
+    allowed = rag.facets.filter(flt)
+    results, _, relaxed = rag.search_with_filters(query, max_results=5)
+    assert not relaxed and results and all(doc.doc_id in allowed for doc in results)
@@ -0,0 +1,100 @@
+# test_document_store.py - Almacén compacto de documentos (src/document_store.py)
+import sys
+
+import pytest
+
+from document_store import DocumentStore, DocumentView, MetadataView
+from rag_system import GreenDreamRAG
+
+
+def _formatter(metadata):
+    return "\n".join(f"{key}: {value}" for key, value in metadata.items())
+
+
+def _store():
+    store = DocumentStore({"curso": _formatter, "revista": _formatter})
+    store.add("curso", {"titulo": "Energía solar", "nivel": "Básico", "tags": ["solar", "energía"]}, "cursos.json")
+    store.add("revista", {"titulo": "Revista verde", "nivel": "Básico"}, "revistas.json")
+    store.add("curso", {"titulo": "Huerto urbano", "nivel": "Básico", "tags": ["huerto"]}, "cursos.json")
+    return store
+
+
+def test_documents_are_read_through_views():
+    store = _store()
+    assert len(store) == 3 and store.count_by_type() == {"curso": 2, "revista": 1}
+    assert store.type_names == ["curso", "revista"]
+
+    doc = store[0]
+    assert isinstance(doc, DocumentView) and doc.doc_id == 0
+    assert doc.type == "curso" and doc.source == "cursos.json"
+    assert isinstance(doc.metadata, MetadataView)
+    assert doc.metadata["titulo"] == "Energía solar" and "nivel" in doc.metadata and "precio" not in doc.metadata
+    # Las listas se guardan como tuplas inmutables
+    assert doc.metadata.to_dict() == {"titulo": "Energía solar", "nivel": "Básico", "tags": ("solar", "energía")}
+    assert doc.content == "titulo: Energía solar\nnivel: Básico\ntags: ('solar', 'energía')"
+    assert [view.metadata["titulo"] for view in store[1:]] == ["Revista verde", "Huerto urbano"]
+
+
+def test_repeated_values_and_keys_are_shared():
+    store = _store()
+    nivel = store.metadata(0)["nivel"]
+    assert all(store.metadata(doc_id)["nivel"] is nivel for doc_id in store.doc_ids())
+    assert nivel is sys.intern("Básico")
+    # Los documentos con los mismos campos comparten esquema
+    assert store.schema_ids[0] == store.schema_ids[2] != store.schema_ids[1]
+    assert store.metadata(0)._schema is store.metadata(2)._schema
+
+
+def test_deleted_documents_keep_their_position():
+    store = _store()
+    store.delete(0)
+    store.delete(0)
+    assert len(store) == 2 and store.count_by_type() == {"curso": 1, "revista": 1}
+    assert list(store.doc_ids()) == [1, 2]
+    assert [doc.doc_id for doc in store] == [1, 2] and store[0].doc_id == 1
+    # La posición no se reutiliza y el resto conserva su doc_id
+    assert store.add("curso", {"titulo": "Compostaje"}, "cursos.json") == 3
+    assert store.metadata(2)["titulo"] == "Huerto urbano"
+
+
+def test_copy_is_independent():
+    store = _store()
+    other = store.copy()
+    other.delete(1)
+    other.add("articulo", {"titulo": "Nuevo", "contenido": "texto"}, "articulos.json")
+
+    assert len(store) == 3 and store.count_by_type() == {"curso": 2, "revista": 1}
+    assert len(store.passage_offsets) == 4 and "articulo" not in store.type_names
+    assert len(other) == 3 and other.count_by_type() == {"curso": 2, "revista": 0, "articulo": 1}
+    # Los valores inmutables de cada documento se comparten
+    assert other.values[0] is store.values[0]
+
+
+def test_same_metadata_compares_keys_and_values():
+    store = _store()
+    metadata = {"titulo": "Energía solar", "nivel": "Básico", "tags": ["solar", "energía"]}
+    assert store.same_metadata(0, metadata)
+    assert not store.same_metadata(0, dict(metadata, nivel="Avanzado"))
+    assert not store.same_metadata(0, {"nivel": "Básico", "titulo": "Energía solar", "tags": ["solar", "energía"]})
+    assert not store.same_metadata(0, dict(metadata, precio="Gratis"))
+
+
+def test_knowledge_base_is_loaded_into_the_store(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    documents = rag.documents
+    assert isinstance(documents, DocumentStore)
+    counts = documents.count_by_type()
+    assert sum(counts.values()) == len(documents) > 0
+    for doc_type, count in counts.items():
+        assert count == sum(1 for doc in documents if doc.type == doc_type)
+
+    results = rag.search_simple("energía solar", max_results=3)
+    assert results and all(isinstance(doc, DocumentView) and doc._store is documents for doc in results)
+    assert all(doc.content for doc in results)
+
+
+def test_indexing_past_the_end():
+    store = _store()
+    assert store[5:6] == []
+    with pytest.raises(IndexError):
+        store[3]
@@ -0,0 +1,108 @@
+# test_facets.py - Filtros por facetas de la metadata (src/facets.py)
+import math
+
+import pytest
+
+from facets import FREE, FacetFilter, FacetIndex, facet_values, parse_age_range, parse_filters, parse_price
+from rag_system import GreenDreamRAG
+
+
+def test_prices_and_age_ranges_are_parsed():
+    assert parse_price("Gratuito") == 0.0 and parse_price("gratis") == 0.0
+    assert parse_price("50 USD") == 50.0 and parse_price("$29,99") == 29.99
+    assert parse_price("Consultar") is None
+    assert parse_age_range("Jóvenes 15-30 años") == (15, 30)
+    assert parse_age_range("16 - 25") == (16, 25)
+    assert parse_age_range("30-15") is None and parse_age_range("Todas las edades") is None
+
+
+def test_query_constraints_become_filters():
+    flt = parse_filters("Busco cursos online gratuitos para principiantes")
+    assert flt.values == {"tipo": {"curso"}, "modalidad": {"online"}, "precio": {FREE}, "nivel": {"principiante"}}
+
+    flt = parse_filters("revistas o artículos de menos de $40, tengo 17 años")
+    assert flt.values == {"tipo": {"revista", "articulo"}}
+    assert flt.max_price == 40.0 and flt.min_price is None and flt.age == 17
+    assert flt.describe() == "tipo: articulo o revista · precio <= 40 · edad: 17 años"
+
+    assert parse_filters("desde 100 USD").min_price == 100.0
+    assert not parse_filters("¿Qué es la economía circular?")
+
+
+def test_categories_and_tags_need_the_index():
+    facets = FacetIndex()
+    facets.add(0, "curso", {"categoria": "Energía Renovable", "tags": ["solar", "Compostaje"]})
+    assert not parse_filters("categoría energía")
+    assert parse_filters("categoría energía", facets).values == {"categoria": {"energia renovable"}}
+    assert parse_filters("cursos con #compostaje y #inexistente", facets).values == {
+        "tipo": {"curso"}, "tag": {"compostaje"},
+    }
+
+
+def _matches(doc_type, metadata, flt: FacetFilter) -> bool:
+    """Comprobación documento a documento (lo que el índice evita hacer)"""
+    values = set(facet_values(doc_type, metadata))
+    if any(not any((facet, value) in values for value in accepted) for facet, accepted in flt.values.items()):
+        return False
+    price = parse_price(metadata["precio"]) if "precio" in metadata else None
+    if flt.max_price is not None and (price is None or price > flt.max_price):
+        return False
+    if flt.min_price is not None and (price is None or price < flt.min_price):
+        return False
+    if flt.age is not None:
+        ages = parse_age_range(metadata.get("edad_objetivo") or metadata.get("publico_objetivo") or "")
+        if not ages or not ages[0] <= flt.age <= ages[1]:
+            return False
+    return True
+
+
+FILTERED_QUERIES = [
+    "cursos online gratuitos para principiantes",
+    "cursos presenciales",
+    "cursos intermedios o híbridos",
+    "artículos para principiantes",
+    "cursos de menos de 60 USD",
+    "cursos desde 20 USD hasta 80 USD",
+    "tengo 17 años",
+    "cursos gratis para alguien de 22 años",
+]
+
+
+@pytest.mark.parametrize("query", FILTERED_QUERIES)
+def test_index_matches_a_scan_of_the_metadata(synthetic_kb, query):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    documents = rag.documents
+    flt = parse_filters(query, rag.facets)
+    expected = {
+        doc_id for doc_id in documents.doc_ids()
+        if _matches(documents.type_of(doc_id), documents.metadata(doc_id), flt)
+    }
+    assert rag.facets.filter(flt) == expected
+
+
+def test_filtered_search_only_returns_matching_documents(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    results, flt, relaxed = rag.search_with_filters("cursos online gratuitos de energía", max_results=5)
+    assert flt and not relaxed and results
+    assert all(_matches(doc.type, doc.metadata, flt) for doc in results)
+
+    # Si nada cumple los filtros se busca sin ellos y se indica que se relajaron
+    results, flt, relaxed = rag.search_with_filters("revistas presenciales", max_results=5)
+    assert rag.facets.filter(flt) == set() and relaxed and results
+    assert "Ningún recurso cumple todos esos filtros" in rag._format_context(results, flt, relaxed)
+
+
+def test_with_changes_leaves_the_original_index_untouched():
+    facets = FacetIndex()
+    facets.add(0, "curso", {"modalidad": "Online", "precio": "Gratuito", "edad_objetivo": "16-25 años"})
+    facets.add(1, "curso", {"modalidad": "Online", "precio": "30 USD"})
+    online = FacetFilter({"modalidad": {"online"}})
+
+    changed = facets.with_changes(
+        removed=[(0, "curso", {"modalidad": "Online", "precio": "Gratuito", "edad_objetivo": "16-25 años"})],
+        added=[(2, "curso", {"modalidad": "Online", "precio": "10 USD"})],
+    )
+    assert changed.filter(online) == {1, 2} and facets.filter(online) == {0, 1}
+    assert changed.filter(FacetFilter(max_price=20)) == {2} and facets.filter(FacetFilter(max_price=20)) == {0}
+    assert changed.filter(FacetFilter(age=18)) == set() and facets.filter(FacetFilter(age=18)) == {0}
+    assert "gratuito" not in changed.postings["precio"] and math.isnan(changed.prices[0])
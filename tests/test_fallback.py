@@ -0,0 +1,95 @@
+# test_fallback.py - Respuestas degradadas cuando el modelo no responde (src/assistant_rag.py)
+import asyncio
+import threading
+
+import pytest
+
+import assistant_rag
+from assistant_rag import AsistenteGreenDreamRAG, FallbackAnswer
+from llm_client import CircuitOpenError
+from single_flight import FirstFragmentTimeout
+
+
+@pytest.fixture(scope="module")
+def asistente():
+    asistente = AsistenteGreenDreamRAG()
+    yield asistente
+    asistente.kb_watcher.stop()
+
+
+@pytest.fixture
+def session_id(asistente):
+    return asistente.sessions.get_or_create(None).session_id
+
+
+@pytest.fixture(autouse=True)
+def model_configured(monkeypatch):
+    # El cliente no se usa: cada test sustituye la llamada al modelo
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: object())
+
+
+def test_circuit_open_answers_from_retrieval_without_history(asistente, session_id, monkeypatch):
+    def circuit_open(*args, **kwargs):
+        raise CircuitOpenError(30)
+
+    monkeypatch.setattr(asistente, "_process_non_streaming", circuit_open)
+    respuesta = asistente.preguntar_con_rag("cursos de energía solar (abierto)", session_id=session_id)
+
+    assert isinstance(respuesta, FallbackAnswer)
+    assert respuesta.reason == "circuit_open" and respuesta
+    assert asistente.sessions.get_history(session_id) == []
+
+
+def test_stream_falls_back_before_the_first_fragment(asistente, session_id, monkeypatch):
+    def silent(*args, **kwargs):
+        raise FirstFragmentTimeout(0.1)
+        yield  # generador
+
+    monkeypatch.setattr(asistente, "_stream_deltas", silent)
+    fragmentos = list(asistente.preguntar_con_rag_stream("reciclaje doméstico (lento)", session_id=session_id))
+
+    assert len(fragmentos) == 1 and fragmentos[0].reason == "latency_budget"
+    assert asistente.sessions.get_history(session_id) == []
+
+
+def test_stream_error_midway_keeps_the_partial_answer(asistente, session_id, monkeypatch):
+    def broken(*args, **kwargs):
+        yield "Te recomiendo "
+        raise RuntimeError("conexión cortada")
+
+    monkeypatch.setattr(asistente, "_stream_deltas", broken)
+    fragmentos = asistente.preguntar_con_rag_stream("agricultura urbana (cortada)", session_id=session_id)
+    assert next(fragmentos) == "Te recomiendo "
+    with pytest.raises(RuntimeError):
+        next(fragmentos)
+
+    assert asistente.sessions.get_history(session_id) == [("agricultura urbana (cortada)", "Te recomiendo ")]
+
+
+def test_async_fallback_searches_off_the_event_loop(asistente, session_id, monkeypatch):
+    search = asistente.rag_system.get_fallback_answer
+    threads = []
+
+    def recording_search(query, *args, **kwargs):
+        threads.append(threading.get_ident())
+        return search(query, *args, **kwargs)
+
+    async def circuit_open(*args, **kwargs):
+        raise CircuitOpenError(30)
+
+    monkeypatch.setattr(asistente.rag_system, "get_fallback_answer", recording_search)
+    monkeypatch.setattr(asistente, "_generate_async", circuit_open)
+
+    async def scenario():
+        monkeypatch.setattr(assistant_rag, "get_async_client", lambda: object())
+        respuesta = await asistente.preguntar_con_rag_async("cursos de energía solar (async)", session_id=session_id)
+        assert respuesta.reason == "circuit_open"
+
+        monkeypatch.setattr(assistant_rag, "get_async_client", lambda: None)
+        fragmentos = [f async for f in asistente.preguntar_con_rag_stream_async("reciclaje (async)", session_id=session_id)]
+        assert fragmentos[0].reason == "llm_unavailable"
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(threads) == 2 and loop_thread not in threads
+    assert asistente.sessions.get_history(session_id) == []
@@ -0,0 +1,67 @@
+# test_kb_snapshot.py - Snapshot binario de la base de conocimiento (src/kb_snapshot.py)
+import json
+import os
+
+import pytest
+
+from conftest import search_results
+from kb_snapshot import build_snapshot
+from rag_system import GreenDreamRAG
+
+QUERIES = [
+    "cursos de energía solar",
+    "reciclaje doméstico para jóvenes",
+    "revistas sobre economía circular",
+    "agricultura urbana online",
+    "energia renovabel",  # con erratas: pasa por la corrección de términos
+]
+
+
+def _as_json(metadata):
+    # El snapshot devuelve listas donde el almacén en memoria usa tuplas
+    return json.dumps(dict(metadata), ensure_ascii=False, sort_keys=True)
+
+
+def _titles(rag, step=25):
+    return [rag.documents.metadata(doc_id)["titulo"] for doc_id in list(rag.documents.doc_ids())[::step]]
+
+
+@pytest.mark.parametrize("mode", ["lexical", "hybrid"])
+def test_snapshot_answers_like_the_json_files(synthetic_kb, tmp_path, mode):
+    if mode != "lexical":
+        pytest.importorskip("numpy")
+    path = build_snapshot(synthetic_kb, str(tmp_path / "kb.snapshot"))
+    from_json = GreenDreamRAG(synthetic_kb, snapshot_path="", retrieval_mode=mode)
+    from_snapshot = GreenDreamRAG(synthetic_kb, snapshot_path=path, retrieval_mode=mode)
+    try:
+        assert from_snapshot._kb.from_snapshot and not from_json._kb.from_snapshot
+        assert from_snapshot.count_by_type() == from_json.count_by_type()
+        for doc_id in from_json.documents.doc_ids():
+            assert from_snapshot.documents.source(doc_id) == from_json.documents.source(doc_id)
+            assert _as_json(from_snapshot.documents.metadata(doc_id)) == _as_json(from_json.documents.metadata(doc_id))
+
+        queries = QUERIES + _titles(from_json)
+        assert search_results(from_snapshot, queries) == search_results(from_json, queries)
+        for query in ["cursos online gratuitos", "revistas gratis", "cursos de menos de 40 USD"]:
+            assert (
+                [doc.source for doc in from_snapshot.search_with_filters(query, 20)[0]]
+                == [doc.source for doc in from_json.search_with_filters(query, 20)[0]]
+            )
+        assert from_snapshot.get_recommendations_context(QUERIES[0]) == from_json.get_recommendations_context(QUERIES[0])
+    finally:
+        from_snapshot.close()
+        from_json.close()
+
+
+def test_stale_snapshot_falls_back_to_the_json_files(synthetic_kb, tmp_path):
+    path = build_snapshot(synthetic_kb, str(tmp_path / "kb.snapshot"))
+    cursos = os.path.join(synthetic_kb, "cursos.json")
+    with open(cursos, encoding="utf-8") as f:
+        records = json.load(f)
+    records.append(dict(records[0], id="curso_nuevo", titulo="Taller de reciclaje creativo"))
+    with open(cursos, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path=path)
+    assert not rag._kb.from_snapshot
+    assert rag.search_simple("Taller de reciclaje creativo", 1)[0].source.endswith("Taller de reciclaje creativo")
@@ -0,0 +1,236 @@
+# test_load_test.py - Modelo simulado y generador de carga (src/mock_llm_server.py, src/load_test.py)
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+import pytest
+
+import assistant_rag
+import chat_client
+from admission import AdmissionController, RateLimiter
+from load_test import InProcessTarget, LoadReport, Sample, _read_sse, load_corpus, percentile, run_load, synthetic_corpus
+from mock_llm_server import MOCK_RESPONSE, MockLLMConfig, start_mock_server
+
+FAST = dict(first_token_latency=0, latency_jitter=0, tokens_per_second=0)
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**config):
+        server, url = start_mock_server(MockLLMConfig(**{**FAST, **config}))
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _post(url, payload, path="/chat/completions"):
+    connection = http.client.HTTPConnection(urlparse(url).netloc, timeout=5)
+    connection.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response, response.read(), connection
+
+
+def test_mock_completion_respects_max_tokens(mock_server):
+    server, url = mock_server(completion_tokens=20)
+    response, body, connection = _post(url, {"messages": [{"role": "user", "content": "hola"}], "max_tokens": 5})
+    data = json.loads(body)
+    assert response.status == 200
+    assert data["choices"][0]["message"]["content"] == " ".join(MOCK_RESPONSE.split()[:5]) + " "
+    assert data["usage"]["completion_tokens"] == 5 and data["model"] == "mock-gpt-4o"
+
+    # La conexión sigue abierta para la siguiente petición (keep-alive)
+    connection.request("GET", "/info")
+    assert json.loads(connection.getresponse().read())["model_name"] == "mock-gpt-4o"
+    assert server.RequestHandlerClass.served == 1
+
+
+def test_mock_stream_sends_one_event_per_token(mock_server):
+    _, url = mock_server(completion_tokens=4)
+    response, body, _ = _post(url, {"messages": [{"role": "user", "content": "hola"}], "stream": True})
+    assert response.status == 200 and response.getheader("Content-Type") == "text/event-stream"
+
+    events = [line[len("data: "):] for line in body.decode().split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    deltas = [chunk["choices"][0]["delta"].get("content", "") for chunk in chunks]
+    assert "".join(deltas) == " ".join(MOCK_RESPONSE.split()[:4]) + " "
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop" and chunks[-1]["usage"]["completion_tokens"] == 4
+
+
+def test_mock_latency_and_injected_errors(mock_server):
+    _, url = mock_server(first_token_latency=0.2, completion_tokens=3)
+    start = time.perf_counter()
+    _post(url, {"messages": []})
+    assert time.perf_counter() - start >= 0.2
+
+    _, url = mock_server(error_rate=1, error_status=429)
+    response, body, _ = _post(url, {"messages": []})
+    assert response.status == 429 and response.getheader("Retry-After") == "1"
+    assert json.loads(body)["error"]["code"] == "MockError"
+
+    response, _, _ = _post(url, {}, path="/otra/ruta")
+    assert response.status == 404
+
+
+def test_percentile_uses_the_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50 and percentile(values, 99) == 99 and percentile(values, 100) == 100
+    assert percentile([3.0], 95) == 3.0 and percentile([], 50) is None
+
+
+def test_corpus_from_files(tmp_path):
+    jsonl = tmp_path / "preguntas.jsonl"
+    jsonl.write_text('{"message": "¿Cursos de compostaje?"}\n\n{"title": "Huerto urbano"}\n{"otro": 1}\n', encoding="utf-8")
+    assert load_corpus(str(jsonl)) == ["¿Cursos de compostaje?", "Huerto urbano"]
+
+    txt = tmp_path / "preguntas.txt"
+    txt.write_text("energía solar\n\nreciclaje\n", encoding="utf-8")
+    assert load_corpus(str(txt)) == ["energía solar", "reciclaje"]
+
+    empty = tmp_path / "vacio.txt"
+    empty.write_text("\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_corpus(str(empty))
+    assert synthetic_corpus(20, seed=1) == synthetic_corpus(20, seed=1)
+
+
+def test_report_counts_admission_rejections_apart():
+    samples = [
+        Sample(ok=True, latency=0.1, ttft=0.05, status=200),
+        Sample(ok=True, latency=0.3, ttft=0.1, degraded=True, status=200),
+        Sample(ok=False, latency=0.01, status=429, reason="queue_full"),
+        Sample(ok=False, latency=0.01, status=429),
+        Sample(ok=False, latency=0.5, status=500, error="fallo"),
+    ]
+    report = LoadReport.build(samples, duration=2.0, mode="en proceso", endpoint="chat")
+    assert (report.requests, report.errors, report.rejected, report.degraded) == (5, 1, 2, 1)
+    assert report.rejected_reasons == {"queue_full": 1, "unknown": 1}
+    assert report.status_codes == {"200": 2, "429": 2, "500": 1}
+    # Solo las respuestas correctas cuentan para el rendimiento y las latencias
+    assert report.throughput_rps == 1.0 and report.latency_seconds["max"] == 0.3
+    assert report.ttft_seconds["p50"] == 0.05
+
+
+def test_read_sse_measures_the_first_fragment():
+    start = time.perf_counter()
+    chunks = [
+        b'event: session\ndata: {"session_id": "abc"}\n\nevent: degraded\ndata: {"reason": "llm_unavailable"}\n\n',
+        b'data: {"delta": "Ho',  # Un evento puede llegar partido en dos fragmentos
+        b'la"}\n\nevent: done\ndata: {"success": true}\n\n',
+    ]
+    sample = _read_sse(chunks, start, 200)
+    assert sample.ok and sample.degraded and 0 < sample.ttft <= sample.latency
+
+    sample = _read_sse([b'data: {"delta": "Te "}\n\nevent: error\ndata: {"error": "cortado"}\n\n'], start, 200)
+    assert not sample.ok and sample.error == "cortado" and sample.ttft is not None
+
+
+class FakeTarget:
+    """Destino que tarda ``delay`` en responder y anota la concurrencia máxima"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def chat(self, message, start):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.messages.append(message)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        if message == "falla":
+            raise RuntimeError("sin conexión")
+        return Sample(ok=True, latency=time.perf_counter() - start, status=200)
+
+    stream = chat
+
+
+def test_closed_loop_keeps_the_concurrency():
+    target = FakeTarget()
+    samples = run_load(target, ["a", "b", "falla"], endpoint="chat", concurrency=4, total_requests=24)
+    assert len(samples) == 24 and target.max_in_flight == 4
+    assert sorted(target.messages) == sorted(["a", "b", "falla"] * 8)
+    # Las excepciones del destino se convierten en muestras fallidas
+    failed = [s for s in samples if not s.ok]
+    assert len(failed) == 8 and all(s.error == "sin conexión" for s in failed)
+
+
+def test_open_loop_sends_at_a_fixed_rate():
+    target = FakeTarget(delay=0.1)
+    start = time.perf_counter()
+    samples = run_load(target, ["a"], concurrency=8, total_requests=10, rps=50)
+    elapsed = time.perf_counter() - start
+    # 10 peticiones a 50 req/s: ~0.2 s de envío más 0.1 s de la última, sin esperar a las anteriores
+    assert len(samples) == 10 and elapsed < 0.6 and target.max_in_flight >= 4
+
+    # Con duración y sin límite de peticiones
+    samples = run_load(FakeTarget(delay=0), ["a"], concurrency=2, duration=0.2, rps=25)
+    assert 3 <= len(samples) <= 6
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """La API en proceso con una admisión propia (el límite por minuto lo comparten todos los tests)"""
+    import api_complete
+
+    def install(max_concurrent=8, max_queue=8, rate_per_minute=0, burst=10):
+        limiter = RateLimiter(rate_per_minute, burst)
+        monkeypatch.setattr(api_complete, "ADMISSION", AdmissionController(max_concurrent, max_queue, 5.0, limiter))
+        return api_complete.app
+
+    return install
+
+
+@pytest.fixture
+def api_client(app, mock_server, monkeypatch):
+    """La API en proceso con el cliente real de Azure apuntando al modelo simulado"""
+    server, url = mock_server(completion_tokens=8)
+    monkeypatch.setattr(chat_client, "ENDPOINT", url)
+    monkeypatch.setattr(chat_client, "API_KEY", "mock")
+    monkeypatch.setattr(chat_client, "client", None)
+    yield InProcessTarget(app()), server
+    chat_client.reset_client()
+
+
+@pytest.mark.parametrize("endpoint", ["chat", "stream"])
+def test_in_process_load_against_the_mock_model(api_client, endpoint):
+    target, server = api_client
+    queries = [f"cursos de energía solar para carga {endpoint} {n}" for n in range(6)]
+    samples = run_load(target, queries, endpoint=endpoint, concurrency=3, total_requests=6)
+
+    report = LoadReport.build(samples, duration=1.0, mode="en proceso", endpoint=endpoint)
+    assert report.requests == 6 and report.errors == 0 and report.degraded == 0
+    assert report.status_codes == {"200": 6}
+    assert server.RequestHandlerClass.served == 6
+    if endpoint == "stream":
+        assert all(s.ttft is not None and s.ttft <= s.latency for s in samples)
+
+
+def test_in_process_load_without_a_model_is_degraded(app, monkeypatch):
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: None)
+    samples = run_load(InProcessTarget(app()), ["reciclaje (carga sin modelo)"], endpoint="stream",
+                       concurrency=2, total_requests=4)
+    assert len(samples) == 4 and all(s.ok and s.degraded for s in samples)
+
+
+def test_in_process_load_reports_rate_limited_requests(app, monkeypatch):
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: None)
+    target = InProcessTarget(app(rate_per_minute=1, burst=3))
+    samples = run_load(target, ["compostaje (carga limitada)"], endpoint="chat", concurrency=1, total_requests=5)
+
+    report = LoadReport.build(samples, duration=1.0, mode="en proceso", endpoint="chat")
+    assert (report.requests, report.errors, report.rejected) == (5, 0, 2)
+    assert report.rejected_reasons == {"rate_limited": 2} and report.degraded == 3
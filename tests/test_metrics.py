@@ -0,0 +1,83 @@
+# test_metrics.py - Métricas por etapa y /api/metrics (src/metrics.py)
+from metrics import Counter, Histogram, MetricsRegistry
+
+
+def _registry():
+    registry = MetricsRegistry()
+    requests = registry.register(Counter("app_requests_total", "Peticiones", ("endpoint", "status")))
+    stages = registry.register(Histogram("app_stage_seconds", "Etapas", ("stage",), buckets=(0.1, 1)))
+    return registry, requests, stages
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    registry, requests, stages = _registry()
+    requests.inc(endpoint="/api/chat", status="200")
+    requests.inc(2, endpoint="/api/chat", status="200")
+    requests.inc(endpoint='/ruta "rara"\n', status="500")
+    for value in (0.05, 0.5, 3):
+        stages.observe(value, stage="retrieval")
+
+    assert requests.value(endpoint="/api/chat", status="200") == 3
+    assert stages.count(stage="retrieval") == 3 and stages.count(stage="llm_total") == 0
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP app_requests_total Peticiones", "# TYPE app_requests_total counter"]
+    assert 'app_requests_total{endpoint="/api/chat",status="200"} 3.0' in lines
+    assert 'app_requests_total{endpoint="/ruta \\"rara\\"\\n",status="500"} 1.0' in lines
+    # Buckets acumulados, con +Inf, suma y total
+    assert "# TYPE app_stage_seconds histogram" in lines
+    assert 'app_stage_seconds_bucket{stage="retrieval",le="0.1"} 1.0' in lines
+    assert 'app_stage_seconds_bucket{stage="retrieval",le="1.0"} 2.0' in lines
+    assert 'app_stage_seconds_bucket{stage="retrieval",le="+Inf"} 3.0' in lines
+    assert 'app_stage_seconds_sum{stage="retrieval"} 3.55' in lines
+    assert 'app_stage_seconds_count{stage="retrieval"} 3.0' in lines
+
+
+def test_histogram_times_a_block_even_if_it_raises():
+    _, _, stages = _registry()
+    with stages.time(stage="ok"):
+        pass
+    try:
+        with stages.time(stage="error"):
+            raise ValueError
+    except ValueError:
+        pass
+    assert stages.count(stage="ok") == 1 and stages.count(stage="error") == 1
+
+
+def test_callbacks_are_read_at_render_time():
+    registry = MetricsRegistry()
+    sessions = []
+    registry.register_callback("app_sessions", "Sesiones", "gauge", lambda: len(sessions))
+    registry.register_callback("app_calls_total", "Llamadas", "counter", lambda: {"success": 2, "retry": 1}, ("outcome",))
+    registry.register_callback("app_broken", "Falla al leerse", "gauge", lambda: 1 / 0)
+
+    sessions.extend(["a", "b"])
+    lines = registry.render().splitlines()
+    assert "app_sessions 2.0" in lines
+    assert 'app_calls_total{outcome="retry"} 1.0' in lines and 'app_calls_total{outcome="success"} 2.0' in lines
+    # Un callback que falla deja solo su cabecera, sin romper la exportación
+    assert lines[-2:] == ["# HELP app_broken Falla al leerse", "# TYPE app_broken gauge"]
+
+
+def test_api_exposes_request_and_stage_metrics(monkeypatch):
+    import api_complete
+    import assistant_rag
+    from metrics import REQUESTS, STAGE_SECONDS
+
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: None)
+    client = api_complete.app.test_client()
+    requests_before = REQUESTS.value(endpoint="/api/chat", status="200")
+    retrieval_before = STAGE_SECONDS.count(stage="retrieval")
+
+    response = client.post("/api/chat", json={"message": "cursos de energía solar (métricas)"})
+    assert response.status_code == 200
+    assert REQUESTS.value(endpoint="/api/chat", status="200") == requests_before + 1
+    assert STAGE_SECONDS.count(stage="retrieval") > retrieval_before
+
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.content_type == "text/plain; version=0.0.4; charset=utf-8"
+    body = response.get_data(as_text=True)
+    for name in ("greendream_stage_seconds_bucket", "greendream_requests_total", "greendream_cache_hits_total"):
+        assert name in body
+    assert 'greendream_stage_seconds_count{stage="retrieval"}' in body
@@ -0,0 +1,84 @@
+# test_passages.py - División en pasajes y búsqueda por pasaje (src/document_store.py, src/rag_system.py)
+import json
+import os
+
+from document_store import HEAD, PASSAGE_OVERLAP, PASSAGE_WORDS, DocumentStore, passage_bounds
+from rag_system import GreenDreamRAG, passage_terms, tokenize
+
+
+def _formatter(metadata):
+    return "\n".join(f"{key}: {value}" for key, value in metadata.items() if value)
+
+
+def test_windows_overlap_and_cover_the_whole_field():
+    assert passage_bounds(0) == []
+    assert passage_bounds(15) == [(0, 15)]
+    bounds = passage_bounds(100)
+    assert bounds == [(0, 40), (30, 70), (60, 100)]
+    step = PASSAGE_WORDS - PASSAGE_OVERLAP
+    assert all(start == n * step for n, (start, _) in enumerate(bounds))
+    assert all(end - start <= PASSAGE_WORDS for start, end in bounds)
+
+
+def test_long_fields_are_split_with_a_link_to_their_document():
+    store = DocumentStore({"articulo": _formatter, "curso": _formatter})
+    words = [f"palabra{n}" for n in range(100)]
+    store.add("curso", {"titulo": "Curso corto", "objetivos": ["Aprender"], "nivel": "Básico"}, "Curso: Curso corto")
+    doc_id = store.add("articulo", {"titulo": "Artículo largo", "contenido": " ".join(words)}, "Artículo: Artículo largo")
+
+    first, last = store.passage_offsets[doc_id], store.passage_offsets[doc_id + 1]
+    assert store.passage_offsets[0] == 0 and first == 2  # cabecera + objetivos del curso
+    assert list(store.passage_parents[first:last]) == [doc_id] * 4
+    passages = store.passages(doc_id)
+    assert [field for _, field, _ in passages] == [HEAD, "contenido", "contenido", "contenido"]
+    # La cabecera es el documento formateado sin los campos divididos
+    assert passages[0][2] == "titulo: Artículo largo"
+    assert passages[1][2] == " ".join(words[0:40]) and passages[3][2] == " ".join(words[60:100])
+    assert store.passage(passages[2][0]) == ("contenido", " ".join(words[30:70]))
+    # Las listas se dividen tal como aparecen en el texto formateado
+    assert store.passages(0)[1][1:] == ("objetivos", "- Aprender")
+
+    # Los fragmentos llevan el título del documento para que también puntúe
+    terms = dict(passage_terms(store, doc_id))
+    assert terms[passages[1][0]][:2] == tokenize("Artículo largo")
+    assert "palabra99" in terms[passages[3][0]] and "palabra99" not in terms[passages[1][0]]
+
+
+def _add_long_article(knowledge_base_path):
+    path = os.path.join(knowledge_base_path, "articulos.json")
+    with open(path, encoding="utf-8") as f:
+        records = json.load(f)
+    filler = " ".join(["texto de relleno sobre sostenibilidad"] * 40)
+    records.append(dict(
+        records[0], id="articulo_largo", titulo="Informe extenso",
+        contenido=f"{filler} El biocarbón mejora la retención de agua del suelo. {filler}",
+    ))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+
+
+def test_search_returns_the_matching_passage(synthetic_kb):
+    _add_long_article(synthetic_kb)
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+
+    results = rag.search_simple("biocarbón retención de agua", max_results=3)
+    assert results[0].source == "Artículo: Informe extenso"
+    # Un resultado por documento, con el pasaje que obtuvo la mejor puntuación
+    assert len({doc.doc_id for doc in results}) == len(results)
+    field, text = results[0].passage
+    assert field == "contenido" and "biocarbón" in text
+    assert len(text.split()) <= PASSAGE_WORDS
+
+    context = rag.get_recommendations_context("biocarbón retención de agua")
+    assert "📝 **Fragmento relevante (contenido):**" in context and "biocarbón" in context
+    # Solo el fragmento, no el artículo entero
+    assert context.count("texto de relleno") < 40
+
+
+def test_documents_without_a_search_have_no_passage(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    assert rag.documents[0].passage is None
+    doc = rag.search_simple(rag.documents[0].metadata["titulo"], max_results=1)[0]
+    assert doc.passage is not None and doc.passage_id in range(
+        rag.documents.passage_offsets[doc.doc_id], rag.documents.passage_offsets[doc.doc_id + 1]
+    )
@@ -0,0 +1,96 @@
+# test_prompt_budget.py - Presupuesto de tokens del prompt (src/prompt_budget.py)
+from prompt_budget import TRUNCATION_MARK, PromptPacker, estimate_tokens, truncate_to_tokens
+
+SYSTEM = "Eres el asistente de Green Dream."
+QUESTION = "¿Qué cursos de energía solar hay?"
+
+
+def _turns(n, words=40):
+    """``n`` pares pregunta/respuesta numerados, del más antiguo al más reciente"""
+    history = []
+    for turn in range(n):
+        history.append(("user", f"pregunta {turn} " + "palabra " * words))
+        history.append(("assistant", f"respuesta {turn} " + "texto " * words))
+    return history
+
+
+def test_truncate_keeps_head_or_tail_within_budget():
+    text = "primera línea\n" + "x" * 200 + "\núltima línea"
+    assert truncate_to_tokens(text, 1000) == text
+    assert truncate_to_tokens(text, 0) == ""
+
+    head = truncate_to_tokens(text, 20)
+    assert head.startswith("primera línea") and head.endswith(TRUNCATION_MARK)
+    assert estimate_tokens(head) <= 20
+    tail = truncate_to_tokens(text, 20, keep="tail")
+    assert tail.startswith(TRUNCATION_MARK.strip()) and tail.endswith("última línea")
+
+
+def test_everything_fits_unchanged():
+    history = _turns(2, words=5)
+    packed = PromptPacker(max_prompt_tokens=3000).pack(SYSTEM, history, "contexto corto", QUESTION)
+    assert packed.history == history and packed.context == "contexto corto"
+    usage = packed.usage
+    assert usage["dropped_messages"] == 0 and usage["history_messages"] == 4
+    assert usage["total"] == usage["system"] + usage["history"] + usage["context"] + usage["question"]
+
+
+def test_history_is_filled_from_the_most_recent_turn():
+    history = _turns(10)
+    packer = PromptPacker(max_prompt_tokens=600, context_ratio=0.5)
+    packed = packer.pack(SYSTEM, history, "contexto " * 50, QUESTION)
+
+    usage = packed.usage
+    assert usage["total"] <= 600
+    assert 0 < usage["history_messages"] < len(history)
+    assert usage["dropped_messages"] == len(history) - len(packed.history)
+    # Se conservan los últimos turnos; solo el más antiguo de ellos puede estar compactado
+    assert packed.history[1:] == history[-(len(packed.history) - 1):]
+    oldest_role, oldest = packed.history[0]
+    assert oldest_role == history[-len(packed.history)][0]
+    assert oldest == history[-len(packed.history)][1] or oldest.startswith(TRUNCATION_MARK.strip())
+
+
+def test_context_keeps_its_share_against_a_long_history():
+    history = _turns(30)
+    context = "\n".join(f"Recurso {n}: curso de energía solar para principiantes" for n in range(200))
+    packer = PromptPacker(max_prompt_tokens=1000, context_ratio=0.6)
+    packed = packer.pack(SYSTEM, history, context, QUESTION)
+
+    usage = packed.usage
+    available = 1000 - usage["system"] - usage["question"]
+    assert usage["total"] <= 1000
+    assert packed.context.startswith("Recurso 0:") and packed.context.endswith(TRUNCATION_MARK)
+    # El recorte se ajusta a un salto de línea: puede quedarse algo por debajo de su parte
+    assert int(available * 0.6) * 0.9 <= usage["context"] <= int(available * 0.6)
+    assert usage["history"] > 0  # el resto es para el historial
+
+
+def test_short_context_leaves_the_budget_to_the_history():
+    history = _turns(6)
+    packer = PromptPacker(max_prompt_tokens=1000, context_ratio=0.6)
+    with_context = packer.pack(SYSTEM, history, "contexto " * 400, QUESTION).usage
+    without_context = packer.pack(SYSTEM, history, "", QUESTION).usage
+    assert without_context["history_messages"] > with_context["history_messages"]
+
+
+def test_assistant_prompt_stays_within_the_budget():
+    from assistant_rag import AsistenteGreenDreamRAG
+
+    asistente = AsistenteGreenDreamRAG()
+    try:
+        asistente.packer = PromptPacker(max_prompt_tokens=900)
+        session_id = asistente.sessions.get_or_create(None).session_id
+        for turn in range(20):
+            asistente.sessions.append_turn(session_id, f"pregunta {turn} " + "palabra " * 40, f"respuesta {turn} " + "texto " * 80)
+
+        peticion = asistente._preparar_mensajes("cursos de energía solar", session_id)
+        usage = peticion.usage
+        assert usage["total"] <= 900 and usage["dropped_messages"] > 0
+        assert peticion.messages[0].role == "system" and peticion.messages[-1].role == "user"
+        assert "cursos de energía solar" in peticion.messages[-1].content
+        # El último turno de la sesión es el que llega justo antes de la pregunta
+        assert peticion.messages[-2].content == "respuesta 19 " + "texto " * 80
+        assert len(peticion.messages) == 2 + usage["history_messages"]
+    finally:
+        asistente.kb_watcher.stop()
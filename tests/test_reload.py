@@ -0,0 +1,54 @@
+# test_reload.py - Recarga incremental de la base de conocimiento (GreenDreamRAG.reload)
+import json
+import os
+
+from conftest import search_results
+from rag_system import GreenDreamRAG
+
+
+def _edit(kb_dir, filename, change):
+    path = os.path.join(kb_dir, filename)
+    with open(path, encoding="utf-8") as f:
+        records = json.load(f)
+    change(records)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+    # Firma distinta aunque el sistema de archivos tenga poca resolución de mtime
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_unchanged_files_do_not_reload(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    version = rag.version
+    assert rag.reload() is False
+    assert rag.version == version
+
+
+def test_incremental_reload_matches_a_fresh_load(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    before = rag.documents
+
+    def change_cursos(records):
+        records[0]["descripcion"] = "Curso de compostaje urbano y huertos verticales con energía solar"
+        nuevo = dict(records[1], id="curso_nuevo", titulo="Taller de reciclaje creativo")
+        records.append(nuevo)
+
+    _edit(synthetic_kb, "cursos.json", change_cursos)
+    _edit(synthetic_kb, "articulos.json", lambda records: records.pop(3))
+    assert rag.reload() is True
+    # Se aplicó como cambio incremental (el documento modificado y el borrado quedan marcados)
+    assert rag.documents is not before and len(rag.documents.deleted) == 2
+
+    fresh = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    assert rag.count_by_type() == fresh.count_by_type()
+    assert len(rag.index) == len(fresh.index)
+    assert rag.index.avg_doc_length == fresh.index.avg_doc_length
+    assert rag.index.num_terms == fresh.index.num_terms
+
+    titles = [rag.documents.metadata(doc_id)["titulo"] for doc_id in list(rag.documents.doc_ids())[::15]]
+    queries = titles + ["compostaje urbano", "reciclaje creativo", "cursos online de energía renovable"]
+    assert search_results(rag, queries) == search_results(fresh, queries)
+    for query in ["cursos online gratuitos", "revistas gratis"]:
+        found = sorted(doc.source for doc in rag.search_with_filters(query, 50)[0])
+        assert found == sorted(doc.source for doc in fresh.search_with_filters(query, 50)[0])
@@ -0,0 +1,80 @@
+# test_response_cache.py - Caché de respuestas para preguntas repetidas (src/response_cache.py)
+import time
+
+import pytest
+
+import assistant_rag
+from response_cache import ResponseCache, make_cache_key, normalize_question
+
+
+def test_equivalent_questions_share_a_key():
+    assert normalize_question("  ¿Qué CURSOS de energía   solar hay? ") == "que cursos de energia solar hay"
+    key = make_cache_key("¿Qué cursos de energía solar hay?", "contexto", model="gpt-4o", kb_version=1)
+    assert make_cache_key("que cursos de energia solar hay", "contexto", model="gpt-4o", kb_version=1) == key
+    # Otro contexto, otros parámetros del modelo u otra versión de la base: otra clave
+    assert make_cache_key("que cursos de energia solar hay", "otro contexto", model="gpt-4o", kb_version=1) != key
+    assert make_cache_key("que cursos de energia solar hay", "contexto", model="gpt-4o-mini", kb_version=1) != key
+    assert make_cache_key("que cursos de energia solar hay", "contexto", model="gpt-4o", kb_version=2) != key
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", "respuesta a")
+    cache.set("b", "respuesta b")
+    assert cache.get("a") == "respuesta a"  # "b" pasa a ser la menos usada
+    cache.set("c", "respuesta c")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "respuesta a" and cache.get("c") == "respuesta c"
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert stats["hits"] == 3 and stats["misses"] == 1 and stats["hit_ratio"] == 0.75
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ResponseCache(max_entries=10, ttl_seconds=0.05)
+    cache.set("a", "respuesta a")
+    assert cache.get("a") == "respuesta a"
+    time.sleep(0.06)
+    assert cache.get("a") is None and len(cache) == 0
+
+
+def test_disabled_cache_and_empty_answers_are_not_stored():
+    disabled = ResponseCache(max_entries=0)
+    disabled.set("a", "respuesta a")
+    assert not disabled.enabled and disabled.get("a") is None
+
+    cache = ResponseCache(max_entries=10)
+    cache.set("a", "")
+    assert cache.get("a") is None
+
+
+@pytest.fixture
+def asistente(monkeypatch):
+    asistente = assistant_rag.AsistenteGreenDreamRAG()
+    calls = []
+
+    def generate(messages, *args, **kwargs):
+        calls.append(messages)
+        return f"Respuesta {len(calls)}"
+
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: object())
+    monkeypatch.setattr(asistente, "_generate", generate)
+    asistente.calls = calls
+    yield asistente
+    asistente.kb_watcher.stop()
+
+
+def test_repeated_first_question_is_answered_from_the_cache(asistente):
+    first = asistente.sessions.get_or_create(None).session_id
+    second = asistente.sessions.get_or_create(None).session_id
+
+    assert asistente.preguntar_con_rag("¿Qué cursos de energía solar hay?", session_id=first) == "Respuesta 1"
+    assert asistente.preguntar_con_rag("que cursos de energia solar hay", session_id=second) == "Respuesta 1"
+    assert len(asistente.calls) == 1
+    # La respuesta de la caché también queda en el historial de la sesión
+    assert asistente.sessions.get_history(second) == [("que cursos de energia solar hay", "Respuesta 1")]
+
+    # Con turnos previos la respuesta depende del historial: no se usa la caché
+    assert asistente.preguntar_con_rag("¿Qué cursos de energía solar hay?", session_id=first) == "Respuesta 2"
+    assert len(asistente.calls) == 2
@@ -0,0 +1,160 @@
+# test_session_store.py - Sesiones compartidas en SQLite (src/session_store.py)
+import multiprocessing
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+from session_store import SQLiteSessionStore
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="usa fork como los workers de gunicorn")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.sqlite3")
+
+
+def _stored_turns(db_path, session_id):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT pregunta, respuesta FROM turns WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_turns_are_written_behind_the_request(db_path):
+    store = SQLiteSessionStore(db_path, flush_seconds=60)
+    session_id = store.get_or_create(None).session_id
+    store.append_turn(session_id, "hola", "¿qué tal?")
+
+    # La petición ve su turno enseguida; la base, al vaciar la cola
+    assert store.get_history(session_id) == [("hola", "¿qué tal?")]
+    assert _stored_turns(db_path, session_id) == []
+    assert store.stats()["pending_writes"] > 0
+
+    assert store.flush() > 0
+    assert _stored_turns(db_path, session_id) == [("hola", "¿qué tal?")]
+    assert store.stats()["pending_writes"] == 0
+    store.close()
+
+
+def test_background_writer_and_close_flush_pending_turns(db_path):
+    store = SQLiteSessionStore(db_path, flush_seconds=0.02)
+    session_id = store.get_or_create(None).session_id
+    store.append_turn(session_id, "p1", "r1")
+    assert _wait_for(lambda: _stored_turns(db_path, session_id) == [("p1", "r1")])
+
+    store.flush_seconds = 60
+    store.close()
+    store.append_turn(session_id, "p2", "r2")  # vuelve a abrir la conexión y el escritor
+    store.close()
+    assert _stored_turns(db_path, session_id) == [("p1", "r1"), ("p2", "r2")]
+
+
+def test_requests_do_not_wait_for_a_blocked_writer(db_path):
+    store = SQLiteSessionStore(db_path, flush_seconds=60)
+    session_id = store.get_or_create(None).session_id
+    store.append_turn(session_id, "p1", "r1")
+    store.flush()
+
+    # Otro worker tiene el bloqueo de escritura de SQLite
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    store.append_turn(session_id, "p2", "r2")
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert _wait_for(lambda: store._writing)
+
+    start = time.monotonic()
+    store.append_turn(session_id, "p3", "r3")
+    assert store.get_history(session_id) == [("p1", "r1"), ("p2", "r2"), ("p3", "r3")]
+    store._sessions.clear()  # relectura desde la base con una escritura a medias
+    assert store.get_history(session_id) == [("p1", "r1"), ("p2", "r2"), ("p3", "r3")]
+    assert time.monotonic() - start < 0.5
+
+    other.execute("COMMIT")
+    other.close()
+    flusher.join(5)
+    store.flush()
+    assert _stored_turns(db_path, session_id) == [("p1", "r1"), ("p2", "r2"), ("p3", "r3")]
+    assert store.get_history(session_id) == [("p1", "r1"), ("p2", "r2"), ("p3", "r3")]
+    store.close()
+
+
+def test_failed_write_is_retried_first(db_path, monkeypatch):
+    store = SQLiteSessionStore(db_path, flush_seconds=60)
+    session_id = store.get_or_create(None).session_id
+    store.append_turn(session_id, "p1", "r1")
+
+    def locked(conn, ops):
+        conn.execute("BEGIN IMMEDIATE")
+        raise sqlite3.OperationalError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "_write", locked)
+        with pytest.raises(sqlite3.OperationalError):
+            store.flush()
+    store.append_turn(session_id, "p2", "r2")
+    store.flush()
+    assert _stored_turns(db_path, session_id) == [("p1", "r1"), ("p2", "r2")]
+    store.close()
+
+
+def _append_in_child(store, session_id, worker):
+    for turn in range(2):
+        store.append_turn(session_id, f"p{worker}-{turn}", f"r{worker}-{turn}")
+    store.close()
+
+
+def test_turns_from_other_processes_are_visible(db_path):
+    store = SQLiteSessionStore(db_path, max_turns=10, flush_seconds=0.02)
+    session_id, first = store.mark_greeted(None)
+    assert first
+    store.append_turn(session_id, "hola", "¿qué tal?")
+    assert store.get_history(session_id) == [("hola", "¿qué tal?")]  # queda en la caché
+    # Como gunicorn con preload: se cierra antes del fork y cada worker abre su conexión
+    store.close()
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_append_in_child, args=(store, session_id, i)) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+        assert worker.exitcode == 0
+
+    history = store.get_history(session_id)
+    assert history[0] == ("hola", "¿qué tal?") and len(history) == 5
+    assert set(history[1:]) == {(f"p{w}-{t}", f"r{w}-{t}") for w in range(2) for t in range(2)}
+
+    other = SQLiteSessionStore(db_path, max_turns=10)
+    assert other.mark_greeted(session_id) == (session_id, False)
+    other.clear(session_id)
+    other.close()
+    assert session_id not in store
+    assert store.get_history(session_id) == []
+    store.close()
+
+
+def test_expired_sessions_are_not_counted_or_returned(db_path):
+    store = SQLiteSessionStore(db_path, ttl_seconds=0.2, flush_seconds=60)
+    session_id = store.get_or_create(None).session_id
+    store.append_turn(session_id, "hola", "¿qué tal?")
+    store.flush()
+    assert len(store) == 1
+
+    time.sleep(0.3)
+    assert len(store) == 0
+    assert store.get_history(session_id) == []
+    store.close()
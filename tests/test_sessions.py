@@ -0,0 +1,77 @@
+# test_sessions.py - Historial por sesión en memoria con expulsión LRU y TTL (src/session_store.py)
+import time
+
+import assistant_rag
+from session_store import SessionStore
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(max_sessions=2, ttl_seconds=60)
+    store.append_turn("a", "hola", "¡Hola!")
+    store.append_turn("b", "hola", "¡Hola!")
+    store.get_or_create("a")  # "b" pasa a ser la menos usada
+    store.get_or_create("c")
+
+    assert "b" not in store and "a" in store and "c" in store
+    assert store.get_history("a") == [("hola", "¡Hola!")] and store.get_history("b") == []
+    stats = store.stats()
+    assert stats["active_sessions"] == 2 and stats["evictions_lru"] == 1 and stats["stored_turns"] == 1
+
+
+def test_inactive_sessions_expire():
+    store = SessionStore(max_sessions=10, ttl_seconds=0.05)
+    store.append_turn("a", "hola", "¡Hola!")
+    assert len(store) == 1
+    time.sleep(0.06)
+    assert len(store) == 0  # expirada aunque todavía no se haya expulsado
+    store.get_or_create("b")
+    assert "a" not in store and store.stats()["evictions_ttl"] == 1
+
+
+def test_history_keeps_the_last_turns():
+    store = SessionStore(max_turns=3)
+    session_id = store.get_or_create(None).session_id
+    assert len(session_id) == 32
+    for turn in range(5):
+        store.append_turn(session_id, f"pregunta {turn}", f"respuesta {turn}")
+    assert store.get_history(session_id) == [(f"pregunta {t}", f"respuesta {t}") for t in (2, 3, 4)]
+
+    # La copia devuelta no modifica la sesión
+    store.get_history(session_id).clear()
+    assert len(store.get_history(session_id)) == 3
+    assert store.clear(session_id) and not store.clear(session_id)
+
+
+def test_greeting_is_marked_once_per_session():
+    store = SessionStore()
+    session_id, first = store.mark_greeted(None)
+    assert first
+    assert store.mark_greeted(session_id) == (session_id, False)
+
+
+def test_api_keeps_one_history_per_visitor(monkeypatch):
+    import api_complete
+
+    asistente = api_complete.asistente
+    prompts = []
+
+    def generate(messages, *args, **kwargs):
+        prompts.append([message.content for message in messages])
+        return f"Respuesta {len(prompts)}"
+
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: object())
+    monkeypatch.setattr(asistente, "_generate", generate)
+    client = api_complete.app.test_client()
+
+    first = client.post("/api/chat", json={"message": "Me interesa el reciclaje (sesión A)"}).get_json()
+    second = client.post("/api/chat", json={"message": "Me interesa la energía solar (sesión B)"}).get_json()
+    assert first["session_id"] != second["session_id"]
+
+    reply = client.post("/api/chat", json={"message": "¿Y algo más avanzado?", "session_id": first["session_id"]})
+    assert reply.get_json()["session_id"] == first["session_id"]
+    # El tercer prompt lleva el turno de su sesión y no el de la otra
+    assert "Me interesa el reciclaje (sesión A)" in prompts[2] and "Respuesta 1" in prompts[2]
+    assert not any("sesión B" in content for content in prompts[2])
+    assert asistente.sessions.get_history(second["session_id"]) == [
+        ("Me interesa la energía solar (sesión B)", "Respuesta 2"),
+    ]
@@ -0,0 +1,173 @@
+# test_sharded_search.py - Búsqueda BM25 repartida entre procesos (src/sharded_search.py)
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from conftest import search_results
+from kb_snapshot import build_snapshot
+from rag_system import GreenDreamRAG
+from sharded_search import ShardError, ShardIndex, ShardedSearch
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="los procesos de búsqueda usan fork y forkserver")
+
+QUERIES = [
+    "cursos de energía solar",
+    "reciclaje doméstico para jóvenes",
+    "revistas sobre economía circular",
+    "agricultura urbana online",
+]
+
+
+def _wait_ready(shards: ShardedSearch, timeout=10.0):
+    """Mientras los procesos se preparan la búsqueda lanza ShardError"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return shards.search([([], None, 1)])
+        except ShardError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.02)
+
+
+def test_sharded_results_match_a_single_index(synthetic_kb):
+    local = GreenDreamRAG(synthetic_kb, snapshot_path="", search_shards=0)
+    sharded = GreenDreamRAG(synthetic_kb, snapshot_path="", search_shards=3)
+    try:
+        shards = sharded._kb.shards
+        _wait_ready(shards)
+        calls = []
+        search = shards.search
+        shards.search = lambda queries: calls.append(len(queries)) or search(queries)
+
+        titles = [local.documents.metadata(doc_id)["titulo"] for doc_id in list(local.documents.doc_ids())[::20]]
+        queries = QUERIES + titles
+        assert search_results(sharded, queries) == search_results(local, queries)
+        for query in ["cursos online gratuitos", "revistas gratis"]:
+            assert (
+                [doc.source for doc in sharded.search_with_filters(query, 20)[0]]
+                == [doc.source for doc in local.search_with_filters(query, 20)[0]]
+            )
+        assert len(calls) >= len(queries) and shards.restarts == 0
+    finally:
+        sharded.close()
+
+
+def test_independent_queries_run_at_the_same_time(synthetic_kb, monkeypatch):
+    search_grouped = ShardIndex.search_grouped
+
+    def slow(self, terms, *args, **kwargs):
+        # "lento0" tarda en el primer proceso y "lento1" en el segundo
+        if terms and terms[0] == "lento" + multiprocessing.current_process().name[-1]:
+            time.sleep(0.4)
+        return search_grouped(self, terms, *args, **kwargs)
+
+    # Los procesos se crean con fork: heredan la versión lenta
+    monkeypatch.setattr(ShardIndex, "search_grouped", slow)
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="", search_shards=0)
+    shards = ShardedSearch(rag.index, rag.documents.passage_parents, rag.documents.passage_offsets, 2, timeout=5)
+    try:
+        _wait_ready(shards)
+        common = sorted(rag.index.postings, key=lambda term: -len(rag.index.postings[term][0]))
+        terms = [["lento0", common[0]], ["lento1", common[1]]]
+        results = {}
+
+        def query(number):
+            results[number] = shards.search([(terms[number], None, 5)])
+
+        threads = [threading.Thread(target=query, args=(number,)) for number in range(2)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        elapsed = time.monotonic() - start
+
+        # Con un solo lock serían 0.4 s + 0.4 s: cada búsqueda espera solo a su proceso lento
+        assert elapsed < 0.7
+        for number in range(2):
+            expected = rag.index.search_grouped(terms[number], rag.documents.passage_parents, 5)
+            assert results[number] == [expected] and expected
+    finally:
+        shards.close()
+
+
+def test_dead_shard_falls_back_and_restarts(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="", search_shards=0)
+    parents = rag.documents.passage_parents
+    shards = ShardedSearch(rag.index, parents, rag.documents.passage_offsets, 2, timeout=2, restart_delay=0.2)
+    try:
+        _wait_ready(shards)
+        shards._shards[1].process.kill()
+        with pytest.raises(ShardError):
+            shards.search([(["reciclaje"], None, 5)])
+        with pytest.raises(ShardError):
+            shards.search([(["reciclaje"], None, 5)])  # todavía dentro de restart_delay
+
+        time.sleep(0.25)
+        assert _wait_ready(shards) == [[]] and shards.restarts == 1
+        expected = rag.index.search_grouped(["reciclaje"], parents, 5)
+        assert shards.search([(["reciclaje"], None, 5)]) == [expected]
+    finally:
+        shards.close()
+
+
+def _answered_by_shards(rag):
+    """Las búsquedas pasan por los procesos (no por la búsqueda en el hilo) y coinciden con el índice"""
+    index = rag.index
+    terms = [term for term, _, _ in itertools.islice(index.iter_postings(), 2)]
+    expected = index.search_grouped(terms, rag.documents.passage_parents, 5)
+    return expected and rag._kb.shards.search([(terms, None, 5)]) == [expected]
+
+
+def _in_thread(function):
+    """Ejecuta ``function`` en otro hilo (como el vigilante de la base) y devuelve su resultado"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join(30)
+    return result[0]
+
+
+def test_reload_from_another_thread_uses_forkserver(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="", search_shards=2)
+    try:
+        path = os.path.join(synthetic_kb, "cursos.json")
+        with open(path, encoding="utf-8") as f:
+            records = json.load(f)
+        records.append(dict(records[0], id="curso_nuevo", titulo="Taller de reciclaje creativo"))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        assert _in_thread(rag.reload) is True
+        shards = rag._kb.shards
+        assert shards.start_method == "forkserver"
+        _wait_ready(shards, timeout=30)
+        assert _answered_by_shards(rag)
+        fresh = GreenDreamRAG(synthetic_kb, snapshot_path="", search_shards=0)
+        queries = QUERIES + ["Taller de reciclaje creativo"]
+        assert search_results(rag, queries) == search_results(fresh, queries)
+    finally:
+        rag.close()
+
+
+def test_snapshot_shards_are_sent_to_forkserver(synthetic_kb, tmp_path):
+    path = build_snapshot(synthetic_kb, str(tmp_path / "kb.snapshot"))
+    rag = _in_thread(lambda: GreenDreamRAG(synthetic_kb, snapshot_path=path, search_shards=2))
+    try:
+        shards = rag._kb.shards
+        assert rag._kb.from_snapshot and shards.start_method == "forkserver"
+        _wait_ready(shards, timeout=30)
+        assert _answered_by_shards(rag)
+        local = GreenDreamRAG(synthetic_kb, snapshot_path="", search_shards=0)
+        assert search_results(rag, QUERIES) == search_results(local, QUERIES)
+    finally:
+        rag.close()
@@ -0,0 +1,132 @@
+# test_single_flight.py - Agrupación de llamadas idénticas al modelo (src/single_flight.py)
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import AsyncSingleFlight, FirstFragmentTimeout, SingleFlight
+
+
+def _endless(closed: threading.Event, delay: float = 0.01):
+    """Stream del modelo que no termina nunca; marca ``closed`` al cerrarse"""
+    try:
+        n = 0
+        while True:
+            time.sleep(delay)
+            n += 1
+            yield f"f{n} "
+    finally:
+        closed.set()
+
+
+def test_identical_streams_share_one_call():
+    calls = []
+    release = threading.Event()
+
+    def factory():
+        calls.append(1)
+        release.wait(2)
+        yield from ["Hola ", "mundo"]
+
+    flight = SingleFlight()
+    first = flight.stream("clave", factory)
+    second = flight.stream("clave", factory)
+    results = []
+    readers = [threading.Thread(target=lambda s=s: results.append("".join(s))) for s in (first, second)]
+    for reader in readers:
+        reader.start()
+    while flight.stats()["coalesced"] < 1:
+        time.sleep(0.01)
+    release.set()
+    for reader in readers:
+        reader.join(2)
+
+    assert results == ["Hola mundo", "Hola mundo"]
+    assert len(calls) == 1
+    assert flight.stats() == {"leaders": 1, "coalesced": 1, "in_flight": 0}
+
+
+def test_stream_abandoned_by_every_subscriber_is_closed():
+    closed = threading.Event()
+    flight = SingleFlight()
+    stream = flight.stream("clave", lambda: _endless(closed))
+    assert next(stream).startswith("f")
+    stream.close()
+
+    assert closed.wait(2)
+    assert flight.stats()["in_flight"] == 0
+    # Una petición nueva con la misma clave empieza otra llamada
+    stream = flight.stream("clave", lambda: iter(["nuevo"]))
+    assert list(stream) == ["nuevo"]
+    assert flight.stats()["leaders"] == 2
+
+
+def test_first_fragment_timeout():
+    closed = threading.Event()
+    flight = SingleFlight()
+    stream = flight.stream("clave", lambda: _endless(closed, delay=1), first_timeout=0.05)
+    start = time.monotonic()
+    with pytest.raises(FirstFragmentTimeout):
+        next(stream)
+    assert time.monotonic() - start < 0.5
+    # Sin suscriptores, el stream del modelo se cierra en cuanto llega el primer fragmento
+    assert closed.wait(3)
+
+
+def test_do_shares_result_and_error():
+    flight = SingleFlight()
+    gate = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        gate.wait(2)
+        raise RuntimeError("sin modelo")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("clave", slow)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["coalesced"] < 2:
+        time.sleep(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join(2)
+    assert errors == ["sin modelo"] * 3 and len(calls) == 1
+
+
+def test_async_abandon_and_timeout():
+    async def scenario():
+        closed = asyncio.Event()
+
+        async def endless(delay=0.01):
+            try:
+                while True:
+                    await asyncio.sleep(delay)
+                    yield "f "
+            finally:
+                closed.set()
+
+        flight = AsyncSingleFlight()
+        stream = flight.stream("clave", endless)
+        assert await stream.__anext__() == "f "
+        await stream.aclose()
+        await asyncio.wait_for(closed.wait(), 2)
+        assert flight.stats()["in_flight"] == 0
+
+        closed.clear()
+        stream = flight.stream("otra", lambda: endless(delay=0.5), first_timeout=0.05)
+        with pytest.raises(FirstFragmentTimeout):
+            await stream.__anext__()
+        await asyncio.wait_for(closed.wait(), 2)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,112 @@
+# test_startup.py - Fases del arranque y ganchos de preload-and-fork (src/startup.py)
+import json
+import os
+import sys
+
+import pytest
+
+import assistant_rag
+from startup import STARTUP, StartupTimeline
+
+
+def test_phases_are_nested_in_start_order(capsys):
+    timeline = StartupTimeline()
+    with timeline.phase("assistant"):
+        with timeline.phase("knowledge_base"):
+            pass
+        with timeline.phase("warmup_search"):
+            pass
+    with timeline.phase("imports"):
+        pass
+
+    assert [(name, depth) for name, _, depth, _ in timeline.phases] == [
+        ("assistant", 0), ("knowledge_base", 1), ("warmup_search", 1), ("imports", 0),
+    ]
+    seconds = timeline.seconds()
+    assert set(seconds) == {(name, "self") for name, _, _, _ in timeline.phases}
+    assert seconds[("assistant", "self")] >= seconds[("knowledge_base", "self")]
+
+    timeline.report()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith(f"⏱️ Arranque (pid {os.getpid()}):")
+    assert lines[2].startswith("     knowledge_base")
+
+
+def test_phase_is_recorded_when_it_raises():
+    timeline = StartupTimeline()
+    with pytest.raises(RuntimeError):
+        with timeline.phase("knowledge_base"):
+            raise RuntimeError
+    assert [name for name, _, _, _ in timeline.phases] == ["knowledge_base"]
+    # Una fase fallida no deja mal el nivel de las siguientes
+    with timeline.phase("imports"):
+        pass
+    assert timeline.phases[-1][2] == 0
+
+
+def test_fork_hooks_run_only_when_registered(capsys):
+    timeline = StartupTimeline()
+    timeline.prepare_fork()
+    timeline.after_fork()
+    # Sin preload no hay nada que preparar ni informe que mostrar
+    assert timeline.phases == [] and capsys.readouterr().out == ""
+
+    calls = []
+    timeline.on_fork(before=lambda: calls.append("antes 1"), after=lambda: calls.append("después 1"))
+    timeline.on_fork(before=lambda: calls.append("antes 2"))
+    timeline.prepare_fork()
+    timeline.after_fork()
+    assert calls == ["antes 1", "antes 2", "después 1"]
+    assert [name for name, _, _, _ in timeline.phases] == ["prepare_fork", "after_fork"]
+    assert "after_fork" in capsys.readouterr().out
+
+
+def test_phases_are_exported_as_metrics():
+    from metrics import REGISTRY
+
+    with STARTUP.phase("test_fase"):
+        pass
+    assert 'greendream_startup_phase_seconds{phase="test_fase",process="self"}' in REGISTRY.render()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="preload-and-fork requiere os.fork")
+def test_worker_inherits_the_loaded_assistant():
+    # Como el maestro de gunicorn con preload: carga, prepara el fork y crea un worker
+    asistente = assistant_rag.AsistenteGreenDreamRAG()
+    timeline = StartupTimeline()
+    timeline.on_fork(before=asistente.prepare_fork, after=lambda: asistente.after_fork(warmup=False))
+    try:
+        timeline.prepare_fork()
+        watcher = asistente.kb_watcher
+        assert watcher._thread is None or not watcher._thread.is_alive()
+        documents = asistente.rag_system.documents
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                timeline.after_fork()
+                results = asistente.rag_system.search_simple("cursos de energía solar", max_results=3)
+                state = {
+                    "same_documents": asistente.rag_system.documents is documents,
+                    "results": len(results),
+                    "watcher_alive": watcher._thread is not None and watcher._thread.is_alive(),
+                    # La carga de la base se hizo en el maestro
+                    "inherited": [name for name, process in STARTUP.seconds() if process == "parent"],
+                    "own": [name for name, process in timeline.seconds() if process == "self"],
+                }
+                os.write(write_fd, json.dumps(state).encode())
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            state = json.loads(f.read() or "{}")
+        os.waitpid(pid, 0)
+        assert state["same_documents"] and state["results"] > 0
+        assert state["watcher_alive"] == (watcher.interval > 0)
+        assert "knowledge_base" in state["inherited"]
+        assert state["own"] == ["after_fork"]
+    finally:
+        asistente.kb_watcher.stop()
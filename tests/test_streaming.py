@@ -0,0 +1,124 @@
+# test_streaming.py - Respuesta por Server-Sent Events en /api/chat/stream (src/api_complete.py)
+import json
+import threading
+
+import pytest
+
+import assistant_rag
+
+
+def _events(chunks):
+    """``[(evento, datos), ...]`` de un cuerpo SSE (evento None para los ``data`` sin nombre)"""
+    events = []
+    for block in b"".join(chunks).decode().split("\n\n"):
+        if not block:
+            continue
+        event = None
+        for line in block.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+@pytest.fixture
+def api(monkeypatch):
+    import api_complete
+
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: object())
+    return api_complete.app.test_client(), api_complete.asistente
+
+
+def _stream(client, message, **body):
+    return client.post("/api/chat/stream", json={"message": message, **body}, buffered=False)
+
+
+def test_fragments_are_sent_as_they_arrive(api, monkeypatch):
+    client, asistente = api
+    first_sent = threading.Event()
+    waited = []
+
+    def deltas(*args, **kwargs):
+        yield "Te recomiendo "
+        # El segundo fragmento solo se genera cuando el cliente ya recibió el primero
+        waited.append(first_sent.wait(5))
+        yield "el curso de energía solar."
+
+    monkeypatch.setattr(asistente, "_stream_deltas", deltas)
+    response = _stream(client, "cursos de energía solar (stream)")
+    assert response.status_code == 200 and response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    chunks = []
+    for chunk in response.response:
+        chunks.append(chunk)
+        if b"Te recomiendo" in chunk:
+            first_sent.set()
+    response.close()
+    assert waited == [True]
+
+    events = _events(chunks)
+    assert events[0][0] == "session"
+    session_id = events[0][1]["session_id"]
+    assert events[1:] == [
+        (None, {"delta": "Te recomiendo "}),
+        (None, {"delta": "el curso de energía solar."}),
+        ("done", {"success": True}),
+    ]
+    assert asistente.sessions.get_history(session_id) == [
+        ("cursos de energía solar (stream)", "Te recomiendo el curso de energía solar."),
+    ]
+
+
+def test_degraded_answer_is_flagged(api, monkeypatch):
+    client, asistente = api
+    monkeypatch.setattr(assistant_rag, "get_client", lambda: None)
+    response = _stream(client, "reciclaje doméstico (stream sin modelo)")
+    events = _events(response.response)
+    response.close()
+
+    names = [name for name, _ in events]
+    assert names == ["session", "degraded", None, "done"]
+    assert events[1][1] == {"reason": "llm_unavailable"} and events[2][1]["delta"]
+
+
+def test_error_midway_sends_an_error_event_and_keeps_the_partial_answer(api, monkeypatch):
+    client, asistente = api
+
+    def broken(*args, **kwargs):
+        yield "Te recomiendo "
+        raise RuntimeError("conexión cortada")
+
+    monkeypatch.setattr(asistente, "_stream_deltas", broken)
+    response = _stream(client, "agricultura urbana (stream cortado)")
+    events = _events(response.response)
+    response.close()
+
+    assert events[-2:] == [(None, {"delta": "Te recomiendo "}), ("error", {"success": False, "error": "conexión cortada"})]
+    session_id = events[0][1]["session_id"]
+    assert asistente.sessions.get_history(session_id) == [("agricultura urbana (stream cortado)", "Te recomiendo ")]
+
+
+def test_disconnect_keeps_what_was_sent(api, monkeypatch):
+    client, asistente = api
+
+    def endless(*args, **kwargs):
+        yield "Primera parte. "
+        while True:
+            yield "más "
+
+    monkeypatch.setattr(asistente, "_stream_deltas", endless)
+    response = _stream(client, "compostaje (stream interrumpido)")
+    chunks = iter(response.response)
+    session_id = _events([next(chunks)])[0][1]["session_id"]
+    assert _events([next(chunks)]) == [(None, {"delta": "Primera parte. "})]
+    response.close()
+
+    assert asistente.sessions.get_history(session_id) == [("compostaje (stream interrumpido)", "Primera parte. ")]
+
+
+def test_message_is_required(api):
+    client, _ = api
+    response = client.post("/api/chat/stream", json={})
+    assert response.status_code == 400 and "message" in response.get_json()["error"]
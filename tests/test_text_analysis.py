@@ -0,0 +1,75 @@
+# test_text_analysis.py - Análisis de texto en español y corrección de errores de tipeo (src/rag_system.py)
+import pytest
+
+from rag_system import BM25Index, GreenDreamRAG, TrigramIndex, fold_accents, light_stem, tokenize
+
+
+def test_accents_are_folded():
+    assert fold_accents("energía") == "energia" and fold_accents("años") == "anos"
+    assert fold_accents("pingüino") == "pinguino" and fold_accents("solar") == "solar"
+
+
+@pytest.mark.parametrize("word, stem", [
+    ("paneles", "panel"),
+    ("energias", "energi"),
+    ("luces", "luz"),
+    ("cursos", "curs"),
+    ("curso", "curs"),
+    ("huerta", "huert"),
+    ("sol", "sol"),        # corta
+    ("co2eq", "co2eq"),    # con dígitos
+])
+def test_light_stem(word, stem):
+    assert light_stem(word) == stem
+
+
+def test_inflected_forms_share_a_term():
+    assert tokenize("Cursos de Energías renovables") == tokenize("curso energía renovable")
+    # Palabras vacías y de 1-2 letras no se indexan
+    assert tokenize("¿Qué hay para mí en la web?") == ["web"]
+    assert tokenize("Paneles solares en 2025") == ["panel", "solar", "2025"]
+
+
+def test_trigram_index_ranks_similar_terms():
+    trigrams = TrigramIndex(["reciclaj", "recicl", "compost", "energi"])
+    matches = trigrams.similar("reciclag")
+    assert [term for _, term in matches][:1] == ["reciclaj"]
+    assert all(0.6 <= similarity <= 1 for similarity, _ in matches)
+    assert [similarity for similarity, _ in matches] == sorted((s for s, _ in matches), reverse=True)
+    assert trigrams.similar("xyzw") == []
+    # Longitud demasiado distinta aunque compartan trigramas
+    assert "recicl" not in [term for _, term in trigrams.similar("reciclajes")]
+
+
+def _index(corpus):
+    index = BM25Index()
+    for doc_id, text in enumerate(corpus):
+        index.add_document(doc_id, tokenize(text))
+    return index
+
+
+def test_unknown_terms_are_corrected_to_the_closest_known_term():
+    index = _index(["reciclaje de plásticos", "compostaje doméstico", "energía solar", "reciclaje urbano"])
+    assert index.correct(tokenize("reciclage de plastikos")) == tokenize("reciclaje plásticos")
+    # Términos conocidos, cortos, numéricos o sin parecidos no cambian
+    assert index.correct(["solar", "sol", "2025", "zzzzzz"]) == ["solar", "sol", "2025", "zzzzzz"]
+
+
+def test_ties_prefer_the_most_frequent_term():
+    for frequent, rare in (("caminax", "caminay"), ("caminay", "caminax")):
+        index = BM25Index()
+        for doc_id, term in enumerate([frequent, frequent, rare]):
+            index.add_document(doc_id, [term])
+        assert index.correct(["caminaz"]) == [frequent]
+
+
+def test_search_understands_typos_and_inflections(synthetic_kb):
+    rag = GreenDreamRAG(synthetic_kb, snapshot_path="")
+    title = rag.documents.metadata(0)["titulo"]
+    words = [word for word in title.split() if len(word) > 5]
+    # Una letra cambiada en cada palabra larga del título
+    typo = " ".join(word[:-2] + "x" + word[-1] for word in words)
+    assert rag.search_simple(typo, max_results=1)[0].metadata["titulo"] == title
+    assert [doc.doc_id for doc in rag.search_simple(title.upper(), max_results=5)] == [
+        doc.doc_id for doc in rag.search_simple(title, max_results=5)
+    ]
@@ -0,0 +1,147 @@
+# test_web_server.py - Servidor de la página con compresión y validadores (src/web_server.py)
+import gzip
+import http.client
+import os
+import threading
+
+import pytest
+
+import web_server
+
+CSS = ".curso { color: green; }\n" * 100
+
+
+@pytest.fixture
+def site_root(tmp_path, monkeypatch):
+    # Los archivos de más de 4 KB se sirven desde el disco
+    monkeypatch.setattr(web_server, "STATIC_MAX_INLINE_BYTES", 4096)
+    (tmp_path / "website.html").write_text("<html><body>Green Dream</body></html>", encoding="utf-8")
+    (tmp_path / "app.css").write_text(CSS, encoding="utf-8")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + bytes(range(256)) * 4)
+    (tmp_path / "video.txt").write_bytes(b"x" * 10_000)
+    (tmp_path / ".env").write_text("SECRETO=1")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "config.json").write_text("{}")
+    (tmp_path / "notas.py").write_text("print()")
+    return tmp_path
+
+
+@pytest.fixture
+def server(site_root):
+    httpd = web_server.make_server(str(site_root), 0, "127.0.0.1")
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def conn(server):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    yield conn
+    conn.close()
+
+
+def _get(conn, path, method="GET", **headers):
+    conn.request(method, path, headers=headers)
+    response = conn.getresponse()
+    return response, response.read()
+
+
+def test_only_public_files_are_served(conn):
+    response, body = _get(conn, "/")
+    assert response.status == 200 and b"Green Dream" in body
+    assert response.getheader("Content-Type") == "text/html; charset=utf-8"
+    assert response.getheader("Cache-Control") == "no-cache"
+    for path in ("/.env", "/src/config.json", "/notas.py", "/no-existe.css"):
+        response, _ = _get(conn, path)
+        assert response.status == 404, path
+    # Todas las peticiones van por la misma conexión (keep-alive)
+    response, _ = _get(conn, "/website.html?v=2")
+    assert response.status == 200 and not response.will_close
+
+
+def test_compressible_files_are_sent_compressed(conn):
+    response, body = _get(conn, "/app.css", **{"Accept-Encoding": "gzip, deflate"})
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert response.getheader("Vary") == "Accept-Encoding"
+    assert int(response.getheader("Content-Length")) == len(body) < len(CSS)
+    assert gzip.decompress(body).decode() == CSS
+    assert response.getheader("Cache-Control") == f"public, max-age={web_server.STATIC_MAX_AGE}"
+    gzip_etag = response.getheader("ETag")
+
+    response, body = _get(conn, "/app.css")
+    assert response.getheader("Content-Encoding") is None and body.decode() == CSS
+    assert response.getheader("ETag") != gzip_etag
+    response, body = _get(conn, "/app.css", **{"Accept-Encoding": "gzip;q=0"})
+    assert response.getheader("Content-Encoding") is None
+
+    # Las imágenes no se comprimen
+    response, body = _get(conn, "/logo.png", **{"Accept-Encoding": "gzip"})
+    assert response.getheader("Content-Encoding") is None and response.getheader("Vary") is None
+    assert body.startswith(b"\x89PNG")
+
+
+def test_brotli_is_preferred_when_available(server, conn):
+    static_file = server.RequestHandlerClass.site.get("/app.css")
+    # Sin el paquete brotli instalado se simula la variante
+    static_file.encoded.setdefault("br", b"contenido brotli")
+    response, body = _get(conn, "/app.css", **{"Accept-Encoding": "gzip, br"})
+    assert response.getheader("Content-Encoding") == "br" and body == static_file.encoded["br"]
+    response, _ = _get(conn, "/app.css", **{"Accept-Encoding": "gzip, br;q=0"})
+    assert response.getheader("Content-Encoding") == "gzip"
+
+
+def test_validators_answer_304(conn):
+    response, _ = _get(conn, "/app.css", **{"Accept-Encoding": "gzip"})
+    etag, last_modified = response.getheader("ETag"), response.getheader("Last-Modified")
+
+    # La ETag de cualquier codificación vale para revalidar
+    for headers in (
+        {"If-None-Match": etag},
+        {"If-None-Match": etag.replace("-gzip", ""), "Accept-Encoding": "gzip"},
+        {"If-None-Match": f'"otra", W/{etag}'},
+        {"If-None-Match": "*"},
+        {"If-Modified-Since": last_modified},
+    ):
+        response, body = _get(conn, "/app.css", **headers)
+        assert response.status == 304 and body == b"", headers
+        assert response.getheader("ETag")
+
+    response, body = _get(conn, "/app.css", **{"If-None-Match": '"otra"'})
+    assert response.status == 200 and body.decode() == CSS
+    # If-None-Match tiene prioridad sobre If-Modified-Since
+    response, _ = _get(conn, "/app.css", **{"If-None-Match": '"otra"', "If-Modified-Since": last_modified})
+    assert response.status == 200
+    response, _ = _get(conn, "/app.css", **{"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"})
+    assert response.status == 200
+
+
+def test_large_files_are_streamed_from_disk(server, conn):
+    static_file = server.RequestHandlerClass.site.get("/video.txt")
+    assert static_file.body is None and not static_file.encoded
+    response, body = _get(conn, "/video.txt", **{"Accept-Encoding": "gzip"})
+    assert response.status == 200 and body == b"x" * 10_000
+    assert response.getheader("Content-Encoding") is None
+
+    response, body = _get(conn, "/video.txt", method="HEAD")
+    assert response.getheader("Content-Length") == "10000" and body == b""
+
+
+def test_changed_files_are_reloaded(site_root, conn):
+    response, _ = _get(conn, "/app.css")
+    etag = response.getheader("ETag")
+
+    path = site_root / "app.css"
+    path.write_text(CSS + ".nuevo {}\n", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    response, body = _get(conn, "/app.css", **{"If-None-Match": etag})
+    assert response.status == 200 and body.decode().endswith(".nuevo {}\n")
+    assert response.getheader("ETag") != etag
+
+    path.unlink()
+    response, _ = _get(conn, "/app.css")
+    assert response.status == 404